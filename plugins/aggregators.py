@@ -11,11 +11,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import json
+import warnings
+from array import array
 from enum import Enum
+from functools import partial
 from http import HTTPStatus
-from tempfile import SpooledTemporaryFile
-from typing import Mapping, Optional
+from math import nan
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterator, List, Mapping, Optional, Tuple
 
 from celery.canvas import chain
 from celery.utils.log import get_task_logger
@@ -44,12 +46,19 @@ from qhana_plugin_runner.api.util import (
 )
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
-from qhana_plugin_runner.plugin_utils.entity_marshalling import save_entities
+from qhana_plugin_runner.plugin_utils.entity_marshalling import (
+    JSON_STREAM_CHUNK_SIZE,
+    _iter_json_values,
+    save_entities,
+)
 from qhana_plugin_runner.plugin_utils.zip_utils import get_files_from_zip_url
 from qhana_plugin_runner.storage import STORE
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
 from qhana_plugin_runner.util.plugins import QHAnaPluginBase, plugin_identifier
 
+if TYPE_CHECKING:
+    import numpy as np
+
 _plugin_name = "distance-aggregator"
 __version__ = "v0.2.0"
 _identifier = plugin_identifier(_plugin_name, __version__)
@@ -239,11 +248,151 @@ class Aggregator(QHAnaPluginBase):
         return AGGREGATOR_BLP
 
     def get_requirements(self) -> str:
-        return ""
+        return "numpy>=1.21"
 
 
 TASK_LOGGER = get_task_logger(__name__)
 
+AGGREGATION_BLOCK_SIZE = 2**16
+"""Number of entity pairs that are aggregated at once (bounds the memory usage)."""
+
+_AGGREGATOR_FUNCTIONS = {
+    AggregatorsEnum.mean: "nanmean",
+    AggregatorsEnum.median: "nanmedian",
+    AggregatorsEnum.max: "nanmax",
+    AggregatorsEnum.min: "nanmin",
+}
+
+
+def load_attribute_distances(
+    file: IO[bytes], entity_index: Dict[str, int]
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Stream the distances of one attribute into arrays.
+
+    Args:
+        file (IO[bytes]): the json file with the attribute distances
+        entity_index (Dict[str, int]): the (shared) index of all entity IDs, new entities get added to the index
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: the entity indices of the first and second entities and the distances (NaN for missing distances)
+    """
+    import numpy as np
+
+    first_entities = array("q")
+    second_entities = array("q")
+    distances = array("d")
+    chunks = iter(partial(file.read, JSON_STREAM_CHUNK_SIZE), b"")
+    for ent in _iter_json_values(chunks):
+        first_entities.append(
+            entity_index.setdefault(ent["entity_1_ID"], len(entity_index))
+        )
+        second_entities.append(
+            entity_index.setdefault(ent["entity_2_ID"], len(entity_index))
+        )
+        distance = ent.get("distance")
+        distances.append(nan if distance is None else distance)
+
+    return (
+        np.frombuffer(first_entities, dtype=np.int64),
+        np.frombuffer(second_entities, dtype=np.int64),
+        np.frombuffer(distances, dtype=np.float64),
+    )
+
+
+def get_pair_distances(
+    first_entities: "np.ndarray",
+    second_entities: "np.ndarray",
+    distances: "np.ndarray",
+    entity_count: int,
+    attribute: str,
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Get the distances of one attribute sorted by their pair key.
+
+    The key of a pair is ``first_entity * entity_count + second_entity``.
+
+    Raises:
+        ValueError: if the attribute contains multiple distances for the same entity pair
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the sorted pair keys and the corresponding distances
+    """
+    import numpy as np
+
+    keys = first_entities * entity_count + second_entities
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    if keys.size > 1 and np.any(keys[1:] == keys[:-1]):
+        raise ValueError(
+            f"Attribute '{attribute}' has multiple distances for an entity pair!"
+        )
+    return keys, distances[order]
+
+
+def aggregate_distances(
+    attribute_distances: List[Tuple["np.ndarray", "np.ndarray"]],
+    entity_ids: List[str],
+    aggregator: AggregatorsEnum,
+) -> Iterator[Dict[str, Any]]:
+    """Aggregate the attribute distances of all entity pairs.
+
+    The distances are aligned into an (attributes x pairs) array with NaN for missing
+    distances that is reduced along the attribute axis (ignoring the missing distances).
+    The pairs are processed in blocks of about ``AGGREGATION_BLOCK_SIZE`` pair keys.
+
+    Args:
+        attribute_distances (List[Tuple[np.ndarray, np.ndarray]]): the sorted pair keys and distances of every attribute (see :py:func:`get_pair_distances`)
+        entity_ids (List[str]): the entity IDs by their index
+        aggregator (AggregatorsEnum): the aggregator to use
+
+    Raises:
+        ValueError: if the aggregator is unknown
+
+    Yields:
+        Iterator[Dict[str, Any]]: the entity distances
+    """
+    import numpy as np
+
+    if aggregator not in _AGGREGATOR_FUNCTIONS:
+        raise ValueError("Unknown aggregator")
+
+    aggregate = getattr(np, _AGGREGATOR_FUNCTIONS[aggregator])
+    entity_count = len(entity_ids)
+    block_size = max(AGGREGATION_BLOCK_SIZE // max(entity_count, 1), 1) * entity_count
+
+    for start in range(0, entity_count * entity_count, block_size):
+        end = start + block_size
+        block_keys = []
+        block_values = []
+        for keys, values in attribute_distances:
+            block_start, block_end = np.searchsorted(keys, [start, end])
+            block_keys.append(keys[block_start:block_end])
+            block_values.append(values[block_start:block_end])
+        pair_keys = np.unique(np.concatenate(block_keys))
+        if pair_keys.size == 0:
+            continue
+
+        distances = np.full((len(attribute_distances), pair_keys.size), np.nan)
+        for row, (keys, values) in enumerate(zip(block_keys, block_values)):
+            distances[row, np.searchsorted(pair_keys, keys)] = values
+
+        with warnings.catch_warnings():
+            # pairs without any distance are aggregated to NaN
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            aggregated = aggregate(distances, axis=0)
+
+        first_entities, second_entities = np.divmod(pair_keys, entity_count)
+        for ent_1, ent_2, ent_dist in zip(
+            first_entities.tolist(), second_entities.tolist(), aggregated.tolist()
+        ):
+            ent_1_id, ent_2_id = entity_ids[ent_1], entity_ids[ent_2]
+            yield {
+                "ID": ent_1_id + "_" + ent_2_id,
+                "entity_1_ID": ent_1_id,
+                "entity_2_ID": ent_2_id,
+                "href": "",
+                "distance": None if ent_dist != ent_dist else ent_dist,
+            }
+
 
 @CELERY.task(name=f"{Aggregator.instance.identifier}.calculation_task", bind=True)
 def calculation_task(self, db_id: int) -> str:
@@ -268,74 +417,36 @@ def calculation_task(self, db_id: int) -> str:
 
     # load data from file
 
-    attribute_distances = {}
+    entity_index: Dict[str, int] = {}
+    loaded_distances = []
 
-    for file, file_name in get_files_from_zip_url(attribute_distances_url):
+    for file, file_name in get_files_from_zip_url(attribute_distances_url, mode="b"):
         # removes .json from file name to get the name of the attribute
         attr_name = file_name[:-5]
+        loaded_distances.append(
+            (attr_name, *load_attribute_distances(file, entity_index))
+        )
 
-        attribute_distances[attr_name] = json.load(file)
-
-    entity_distance_lists = {}
-
-    for attr_dist in attribute_distances.values():
-        for ent in attr_dist:
-            ent_ids = (ent["entity_1_ID"], ent["entity_2_ID"])
-
-            if ent_ids in entity_distance_lists:
-                entity_distance_lists[ent_ids].append(ent)
-            else:
-                entity_distance_lists[ent_ids] = [ent]
-
-    entity_distances = []
-
-    for ent_dist_list in entity_distance_lists.values():
-        ent_dist = 0.0
-        dist_list = [ent["distance"] for ent in ent_dist_list]
-
-        if aggregator == AggregatorsEnum.mean:
-            for dist in dist_list:
-                ent_dist += dist
-
-            ent_dist /= len(ent_dist_list)
-        elif aggregator == AggregatorsEnum.median:
-            dist_list = sorted(dist_list)
-
-            if len(dist_list) % 2 == 0:
-                ent_dist = (
-                    0.5 * dist_list[len(dist_list) // 2]
-                    + 0.5 * dist_list[len(dist_list) // 2 - 1]
-                )
-            else:
-                ent_dist = dist_list[len(dist_list) // 2]
-        elif aggregator == AggregatorsEnum.max:
-            ent_dist = max(dist_list)
-        elif aggregator == AggregatorsEnum.min:
-            ent_dist = min(dist_list)
-        else:
-            raise ValueError("Unknown aggregator")
-
-        ent_1_id = ent_dist_list[0]["entity_1_ID"]
-        ent_2_id = ent_dist_list[0]["entity_2_ID"]
-
-        entity_distances.append(
-            {
-                "ID": ent_1_id + "_" + ent_2_id,
-                "entity_1_ID": ent_1_id,
-                "entity_2_ID": ent_2_id,
-                "href": "",
-                "distance": ent_dist,
-            }
+    # the pair keys can only be computed once all entities are known
+    attribute_distances = []
+    while loaded_distances:
+        attr_name, first_entities, second_entities, distances = loaded_distances.pop()
+        attribute_distances.append(
+            get_pair_distances(
+                first_entities, second_entities, distances, len(entity_index), attr_name
+            )
         )
 
-    with SpooledTemporaryFile(mode="w") as output:
+    entity_distances = aggregate_distances(
+        attribute_distances, list(entity_index), aggregator
+    )
+
+    with STORE.open_task_result_writer(
+        db_id,
+        "entity_distances.json",
+        "custom/entity-distances",
+        "application/json",
+    ) as output:
         save_entities(entity_distances, output, "application/json")
-        STORE.persist_task_result(
-            db_id,
-            output,
-            "entity_distances.json",
-            "custom/entity-distances",
-            "application/json",
-        )
 
     return "Result stored in file"
@@ -46,6 +46,10 @@ from qhana_plugin_runner.api.util import (
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
 from qhana_plugin_runner.plugin_utils.entity_marshalling import save_entities
+from qhana_plugin_runner.plugin_utils.entity_matrix import (
+    MATRIX_MIMETYPE,
+    load_entity_matrix,
+)
 from qhana_plugin_runner.requests import open_url
 from qhana_plugin_runner.storage import STORE
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
@@ -89,10 +93,10 @@ class InputParametersSchema(FrontendFormBaseSchema):
         required=True,
         allow_none=False,
         data_input_type="custom/entity-distances",
-        data_content_types="application/json",
+        data_content_types=["application/json", MATRIX_MIMETYPE],
         metadata={
             "label": "Entity distances URL",
-            "description": "URL to a json file with the entity distances.",
+            "description": "URL to a file with the entity distances (json pair list or binary matrix).",
             "input_type": "text",
         },
     )
@@ -159,7 +163,7 @@ class PluginsView(MethodView):
                 data_input=[
                     InputDataMetadata(
                         data_type="custom/entity-distances",
-                        content_type=["application/json"],
+                        content_type=["application/json", MATRIX_MIMETYPE],
                         required=True,
                         parameter="entityDistancesUrl",
                     )
@@ -324,28 +328,13 @@ def calculation_task(self, db_id: int) -> str:
 
     # load data from file
 
-    entity_distances = open_url(entity_distances_url).json()
-    id_to_idx = {}
-
-    idx = 0
-
-    for ent_dist in entity_distances:
-        if ent_dist["entity_1_ID"] not in id_to_idx:
-            id_to_idx[ent_dist["entity_1_ID"]] = idx
-            idx += 1
-
-    distance_matrix = np.zeros((len(id_to_idx), len(id_to_idx)))
-
-    for ent_dist in entity_distances:
-        ent_1_id = ent_dist["entity_1_ID"]
-        ent_2_id = ent_dist["entity_2_ID"]
-        dist = ent_dist["distance"]
-
-        ent_1_idx = id_to_idx[ent_1_id]
-        ent_2_idx = id_to_idx[ent_2_id]
+    with open_url(entity_distances_url, stream=True) as entity_distances_data:
+        entity_distances = load_entity_matrix(
+            entity_distances_data, "distance", symmetric=True
+        )
 
-        distance_matrix[ent_1_idx, ent_2_idx] = dist
-        distance_matrix[ent_2_idx, ent_1_idx] = dist
+    # missing distances are treated as 0
+    distance_matrix = np.nan_to_num(entity_distances.to_numpy(), nan=0.0)
 
     mds = manifold.MDS(
         dimensions,
@@ -360,7 +349,7 @@ def calculation_task(self, db_id: int) -> str:
     entity_points = []
     dim_attributes = _get_dim_attributes(dimensions)
 
-    for ent_id, idx in id_to_idx.items():
+    for idx, ent_id in enumerate(entity_distances.row_ids):
         new_entity_point = {"ID": ent_id, "href": ""}
         new_entity_point.update({d: x for d, x in zip(dim_attributes, transformed[idx])})
 
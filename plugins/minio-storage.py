@@ -14,19 +14,37 @@
 
 import io
 from collections.abc import Sized
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import timedelta
 from json import loads
 from os import environ
 from pathlib import Path
-from typing import IO, BinaryIO, Optional, TextIO, Union, cast
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Union,
+    cast,
+)
 
 from flask import Flask
 
 from qhana_plugin_runner.db.models.tasks import TaskFile
 from qhana_plugin_runner.storage import FileStore
+from qhana_plugin_runner.util.compression import get_content_encoding
 from qhana_plugin_runner.util.plugins import QHAnaPluginBase
 
-__version__ = "v0.2.0"
+__version__ = "v0.3.0"
+
+MIN_PART_SIZE = 5 * 2**20
+"""The minimum size of a part of a multipart upload (except for the last part)."""
 
 
 class HelloWorld(QHAnaPluginBase):
@@ -41,10 +59,14 @@ class HelloWorld(QHAnaPluginBase):
         super().__init__(app)
 
     def get_requirements(self) -> str:
-        return "minio"
+        # the multipart upload uses private methods of the minio client
+        # (_create_multipart_upload, _upload_part, _complete_multipart_upload
+        # and _abort_multipart_upload), check them before raising the upper bound
+        return "minio>=7.1,<7.2"
 
 
 import minio
+from minio.datatypes import Part
 
 
 class TextFileWrapper(BinaryIO):
@@ -57,6 +79,115 @@ class TextFileWrapper(BinaryIO):
         return self._file.read(*args).encode()
 
 
+class MultipartUploadWriter(io.RawIOBase):
+    """A writable stream uploading the written data as a multipart upload.
+
+    The data is uploaded in parts of ``part_size`` bytes in parallel using the
+    given executor. At most ``max_pending_parts`` parts are kept in memory;
+    writing blocks until an upload finished if more parts are pending.
+
+    Call :py:meth:`complete` to finish the upload or :py:meth:`abort` to cancel
+    it. Small files that fit into a single part are uploaded with a single
+    request when the upload is completed.
+    """
+
+    def __init__(
+        self,
+        client: minio.Minio,
+        bucket: str,
+        object_name: str,
+        headers: Dict[str, str],
+        part_size: int,
+        executor: ThreadPoolExecutor,
+        max_pending_parts: int,
+    ) -> None:
+        super().__init__()
+        self._client = client
+        self._bucket = bucket
+        self._object_name = object_name
+        self._headers = headers
+        self._part_size = max(part_size, MIN_PART_SIZE)
+        self._executor = executor
+        self._max_pending_parts = max(max_pending_parts, 1)
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Future] = []
+        self._pending: Set[Future] = set()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._part_size:
+            part = bytes(self._buffer[: self._part_size])
+            del self._buffer[: self._part_size]
+            self._upload_part(part)
+        return len(memoryview(data))
+
+    def _upload_part(self, data: bytes):
+        if self._upload_id is None:
+            self._upload_id = self._client._create_multipart_upload(
+                self._bucket, self._object_name, self._headers
+            )
+        if len(self._pending) >= self._max_pending_parts:
+            # limit the memory used by parts waiting for their upload
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()  # raise upload errors early
+        part_number = len(self._parts) + 1
+        future = self._executor.submit(
+            self._client._upload_part,
+            self._bucket,
+            self._object_name,
+            data,
+            None,
+            self._upload_id,
+            part_number,
+        )
+        self._parts.append(future)
+        self._pending.add(future)
+
+    def complete(self):
+        """Upload the remaining data and complete the upload."""
+        if self._upload_id is None:
+            # the file fits into a single part
+            self._client.put_object(
+                self._bucket,
+                self._object_name,
+                io.BytesIO(self._buffer),
+                length=len(self._buffer),
+                content_type=self._headers.get(
+                    "Content-Type", "application/octet-stream"
+                ),
+                metadata={k: v for k, v in self._headers.items() if k != "Content-Type"},
+            )
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            parts = [
+                Part(part_number, future.result())
+                for part_number, future in enumerate(self._parts, start=1)
+            ]
+            self._client._complete_multipart_upload(
+                self._bucket, self._object_name, self._upload_id, parts
+            )
+        self._buffer = bytearray()
+        self.close()
+
+    def abort(self):
+        """Cancel the upload and remove the already uploaded parts."""
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            for future in self._parts:
+                future.cancel()
+            wait(self._pending)
+            self._client._abort_multipart_upload(
+                self._bucket, self._object_name, self._upload_id
+            )
+        self.close()
+
+
 class MinioStore(FileStore, name="minio"):
     """A file store implementation using minio backend.
 
@@ -72,12 +203,27 @@ class MinioStore(FileStore, name="minio"):
     settings of the storage provider use the `MINIO` config key. The default
     bucket can be configured by the setting `MINIO.bucket="custom-bucket"`.
     The default bucket can also be set via the `MINIO_BUCKET` environment variable.
+
+    Task results are streamed to minio as multipart uploads. The size of the
+    parts (`MINIO.part_size`, in bytes, at least 5MiB) and the number of parts
+    uploaded in parallel (`MINIO.upload_threads`) can be configured.
+
+    Text based task results are only compressed if `FILE_STORE_COMPRESSION`
+    is "gzip" (zstd compressed files are not decoded by most clients).
+
+    Task file URLs are presigned GET URLs, so downloads do not go through the
+    plugin runner. The URLs expire after `MINIO.url_expiry` seconds
+    (defaults to 3 days for external and 7 days for internal URLs).
     """
 
     def __init__(self, app: Flask) -> None:
         super().__init__(app=app)
         self._client: Optional[minio.Minio] = None
         self._minio_bucket: Optional[str] = None
+        self._part_size: int = 2**25
+        self._upload_threads: int = 4
+        self._url_expiry: Optional[timedelta] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
 
     def init_app(self, app: Flask):
         """Init the file store with the Flask app to get access to the flask config."""
@@ -88,8 +234,13 @@ class MinioStore(FileStore, name="minio"):
             minio_config = loads(env_config)
         if not minio_config:
             raise ValueError("No configuration for the minio file store found.")
-        self._minio_bucket = app.config.get("MINIO", {}).get("bucket", "experiment-data")
+        settings = app.config.get("MINIO", {})
+        self._minio_bucket = settings.get("bucket", "experiment-data")
         self._minio_bucket = environ.get("MINIO_BUCKET", self._minio_bucket)
+        self._part_size = max(int(settings.get("part_size", 2**25)), MIN_PART_SIZE)
+        self._upload_threads = max(int(settings.get("upload_threads", 4)), 1)
+        if settings.get("url_expiry"):
+            self._url_expiry = timedelta(seconds=int(settings["url_expiry"]))
         self._client = minio.Minio(**minio_config)
         if not self._client.bucket_exists(self._minio_bucket):
             self._client.make_bucket(self._minio_bucket)
@@ -128,7 +279,7 @@ class MinioStore(FileStore, name="minio"):
 
         if length < 0:
             # part size >5MiB must be set if the size is unknown
-            extra_args["part_size"] = 2**25
+            extra_args["part_size"] = self._part_size
 
         self._client.put_object(
             self._minio_bucket,
@@ -139,16 +290,78 @@ class MinioStore(FileStore, name="minio"):
             **extra_args,
         )
 
-    def get_file_url(self, file_storage_data: str, external: bool = True) -> str:
+    def _get_content_encoding(self, mimetype: Optional[str]) -> Optional[str]:
+        content_encoding = super()._get_content_encoding(mimetype)
+        if content_encoding != "gzip":
+            # files are downloaded directly from minio with presigned URLs,
+            # most clients (e.g. urllib3 1.x) only decode gzip transparently
+            return None
+        return content_encoding
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._upload_threads, thread_name_prefix="minio-upload"
+            )
+        return self._executor
+
+    @contextmanager
+    def _open_target_writer(
+        self, target: Union[Path, str], mimetype: str
+    ) -> Iterator[IO[bytes]]:
+        if self._client is None or self._minio_bucket is None:
+            raise ValueError("Client not configured!")
+        headers = {"Content-Type": mimetype}
+        content_encoding = get_content_encoding(target)
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        writer = MultipartUploadWriter(
+            self._client,
+            self._minio_bucket,
+            str(target),
+            headers,
+            part_size=self._part_size,
+            executor=self._get_executor(),
+            max_pending_parts=self._upload_threads,
+        )
+        try:
+            yield writer
+            writer.complete()
+        except BaseException:
+            writer.abort()  # do not leave incomplete uploads in the bucket
+            raise
+
+    def _get_presigned_url(
+        self,
+        file_storage_data: str,
+        external: bool,
+        response_headers: Optional[Dict[str, str]] = None,
+    ) -> str:
         if self._client is None:
             raise ValueError("Client not configured!")
 
+        expires = self._url_expiry
+        if expires is None:
+            expires = timedelta(days=(3 if external else 7))
         return self._client.get_presigned_url(
             "GET",
             self._minio_bucket,
             file_storage_data,
-            expires=timedelta(days=(3 if external else 7)),
+            expires=expires,
+            response_headers=response_headers,
         )
 
+    def get_file_url(self, file_storage_data: str, external: bool = True) -> str:
+        return self._get_presigned_url(file_storage_data, external)
+
     def get_task_file_url(self, file_info: TaskFile, external: bool = True) -> str:
-        return super().get_task_file_url(file_info, external=external)
+        # the presigned URL overrides the response headers to send the file
+        # with the name and mimetype of the task file
+        return self._get_presigned_url(
+            file_info.file_storage_data,
+            external,
+            response_headers={
+                "response-content-type": file_info.mimetype,
+                "response-content-disposition": f'attachment; filename="{file_info.file_name}"',
+            },
+        )
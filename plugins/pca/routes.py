@@ -40,6 +40,7 @@ from qhana_plugin_runner.api.plugin_schemas import (
     InputDataMetadata,
 )
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
+from qhana_plugin_runner.result_cache import complete_task_from_result_cache
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
 
 from .tasks import calculation_task
@@ -189,6 +190,16 @@ class ProcessView(MethodView):
         )
         db_task.save(commit=True)
 
+        if complete_task_from_result_cache(
+            db_task,
+            PCA.instance.version,
+            input_urls=[arguments.entity_points_url, arguments.kernel_url],
+        ):
+            return redirect(
+                url_for("tasks-api.TaskView", task_id=str(db_task.id)),
+                HTTPStatus.SEE_OTHER,
+            )
+
         # all tasks need to know about db id to load the db entry
         task: chain = calculation_task.s(db_id=db_task.id) | save_task_result.s(
             db_id=db_task.id
@@ -23,6 +23,7 @@ from qhana_plugin_runner.api.util import (
     MaBaseSchema,
     FileUrl,
 )
+from qhana_plugin_runner.plugin_utils.entity_matrix import MATRIX_MIMETYPE
 
 
 class SolverEnum(Enum):
@@ -180,10 +181,10 @@ class InputParametersSchema(FrontendFormBaseSchema):
         required=False,
         allow_none=True,
         data_input_type="kernel-matrix",
-        data_content_types=["application/json"],
+        data_content_types=["application/json", MATRIX_MIMETYPE],
         metadata={
             "label": "Kernel matrix URL",
-            "description": "URL to a json file, containing the kernel matrix."
+            "description": "URL to a json or binary matrix file, containing the kernel matrix."
             "Note that only kernel matrices between the same set of points X can be processed here, "
             "i.e. K(X, X)",
             "input_type": "text",
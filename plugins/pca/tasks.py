@@ -14,7 +14,7 @@
 
 from tempfile import SpooledTemporaryFile
 
-from typing import Optional, List
+from typing import Optional
 
 from json import loads
 from celery.utils.log import get_task_logger
@@ -23,10 +23,11 @@ from . import PCA
 from .schemas import InputParameters, InputParametersSchema, PCATypeEnum, KernelEnum
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
-from qhana_plugin_runner.plugin_utils.entity_marshalling import (
-    save_entities,
-    load_entities,
-    ensure_dict,
+from qhana_plugin_runner.plugin_utils.entity_marshalling import save_entities
+from qhana_plugin_runner.plugin_utils.entity_matrix import load_entity_matrix
+from qhana_plugin_runner.plugin_utils.entity_points import (
+    iter_entity_point_batches,
+    load_entity_points,
 )
 from qhana_plugin_runner.requests import open_url
 from qhana_plugin_runner.storage import STORE
@@ -39,30 +40,19 @@ from itertools import islice
 
 TASK_LOGGER = get_task_logger(__name__)
 
+# fixed seed of the randomized solvers, results must be reproducible for the result cache
+RANDOM_STATE = 0
 
-def get_point(ent):
-    dimension_keys = list(ent.keys())
-    dimension_keys.remove("ID")
-    dimension_keys.remove("href")
 
-    dimension_keys.sort()
-    point = np.empty(len(dimension_keys))
-    for idx, d in enumerate(dimension_keys):
-        point[idx] = ent[d]
-    return point
-
-
-def get_entity_generator(entity_points_url: str):
+def get_point_batches(entity_points_url: str, batch_size: int):
     """
-    Return a generator for the entity points, given an url to them.
+    Return a generator for batches of the entity points, given an url to them.
+    Each batch is a tuple of the entity IDs and an array with the corresponding points.
     :param entity_points_url: url to the entity points
+    :param batch_size: the maximum number of points per batch
     """
-    file_ = open_url(entity_points_url)
-    file_.encoding = "utf-8"
-    file_type = file_.headers["Content-Type"]
-    entities_generator = load_entities(file_, mimetype=file_type)
-    entities_generator = ensure_dict(entities_generator)
-    return entities_generator
+    with open_url(entity_points_url, stream=True) as file_:
+        yield from iter_entity_point_batches(file_, batch_size=batch_size)
 
 
 def load_entity_points_and_idx_to_id(entity_points_url: str):
@@ -70,65 +60,28 @@ def load_entity_points_and_idx_to_id(entity_points_url: str):
     Loads in entity points, given their url.
     :param entity_points_url: url to the entity points
     """
-    entity_generator = get_entity_generator(entity_points_url)
-    id_to_idx = {}
-    idx = 0
-
-    # Check for duplicates and set index for elements
-    ent = None
-    for ent in entity_generator:
-        if ent["ID"] in id_to_idx:
-            raise ValueError("Duplicate ID: ", ent["ID"])
-
-        id_to_idx[ent["ID"]] = idx
-        idx += 1
-
-    # Set array with correct size
-    points_cnt = len(id_to_idx)
-    dimensions = len(ent.keys() - {"ID", "href"})
-    points_arr = np.empty((points_cnt, dimensions))
-
-    # Go through elements again and insert them at the correct index
-    entity_generator = get_entity_generator(entity_points_url)
-    for ent in entity_generator:
-        idx = id_to_idx[ent["ID"]]
-        points_arr[idx] = get_point(ent)
+    with open_url(entity_points_url, stream=True) as file_:
+        entity_points = load_entity_points(file_)
+    return entity_points.points, entity_points.id_to_idx
 
-    return points_arr, id_to_idx
 
-
-def load_kernel_matrix(kernel_url: str) -> (dict, dict, List[List[float]]):
+def load_kernel_matrix(kernel_url: str) -> (dict, dict, np.ndarray):
     """
     Loads in a kernel matrix, given its url
-    :param kernel_url: url to the kernel matrix
+    :param kernel_url: url to the kernel matrix (json pair list or binary matrix)
     """
-    kernel_json = open_url(kernel_url).json()
-    id_to_idx_X = {}
-    id_to_idx_Y = {}
-    idx_X = 0
-    idx_Y = 0
-    for entry in kernel_json:
-        if entry["entity_1_ID"] not in id_to_idx_Y:
-            id_to_idx_Y[entry["entity_1_ID"]] = idx_Y
-            idx_Y += 1
-        if entry["entity_2_ID"] not in id_to_idx_X:
-            id_to_idx_X[entry["entity_2_ID"]] = idx_X
-            idx_X += 1
-    kernel_matrix = np.zeros((len(id_to_idx_Y), len(id_to_idx_X)))
+    with open_url(kernel_url, stream=True) as kernel_data:
+        kernel = load_entity_matrix(kernel_data, "kernel")
+    id_to_idx_X = kernel.column_index
+    id_to_idx_Y = kernel.row_index
+    # missing kernel values are treated as 0
+    kernel_matrix = np.nan_to_num(kernel.to_numpy(), nan=0.0)
 
     if id_to_idx_Y.keys() == id_to_idx_X.keys():
+        # use the same order for rows and columns
+        kernel_matrix = kernel_matrix[[id_to_idx_Y[id_] for id_ in kernel.column_ids]]
         id_to_idx_Y = id_to_idx_X
 
-    for entry in kernel_json:
-        ent_id_Y = entry["entity_1_ID"]
-        ent_id_X = entry["entity_2_ID"]
-        kernel = entry["kernel"]
-
-        ent_idx_Y = id_to_idx_Y[ent_id_Y]
-        ent_idx_X = id_to_idx_X[ent_id_X]
-
-        kernel_matrix[ent_idx_Y, ent_idx_X] = kernel
-
     return id_to_idx_X, id_to_idx_Y, kernel_matrix
 
 
@@ -151,6 +104,7 @@ def get_pca(input_params: dict):
             svd_solver=input_params["solver"].value,
             tol=input_params["tol"],
             iterated_power=input_params["iterated_power"],
+            random_state=RANDOM_STATE,
         )
     elif pca_type == PCATypeEnum.incremental:
         return IncrementalPCA(
@@ -164,6 +118,7 @@ def get_pca(input_params: dict):
             ridge_alpha=input_params["ridge_alpha"],
             max_iter=input_params["max_itr"],
             tol=input_params["tol"],
+            random_state=RANDOM_STATE,
         )
     elif pca_type == PCATypeEnum.kernel:
         eigen_solver = input_params["solver"].value
@@ -179,6 +134,7 @@ def get_pca(input_params: dict):
             eigen_solver=eigen_solver,
             tol=input_params["tol"],
             iterated_power=input_params["iterated_power"],
+            random_state=RANDOM_STATE,
         )
     raise ValueError(f"PCA with type {pca_type} not implemented!")
 
@@ -210,19 +166,19 @@ def get_dim_attributes(dim):
     return dim_attributes
 
 
-def prepare_stream_output(entity_generator, pca, dim_attributes):
+def prepare_stream_output(point_batches, pca, dim_attributes):
     """
     This method is a generator, preparing each entity point for the final output. This method is used, when using the
     incremental pca. Since the advantage of the incremental pca is that not every point has to be in memory at once,
-    this method loads in each point one by one and therefore keeps the advantage of the incremental pca.
-    :param entity_generator: generator of points
+    this method loads in the points batch by batch and therefore keeps the advantage of the incremental pca.
+    :param point_batches: generator of batches of entity IDs and points
     :param pca: a fitted pca
     :param dim_attributes: List of dimension attributes
     """
-    for ent in entity_generator:
-        point = ent["point"]
-        transformed_ent = pca.transform([point])[0]
-        yield get_entity_dict(ent["ID"], transformed_ent, dim_attributes)
+    for ids, points in point_batches:
+        transformed_points = pca.transform(points)
+        for ID, transformed_point in zip(ids, transformed_points):
+            yield get_entity_dict(ID, transformed_point, dim_attributes)
 
 
 def prepare_static_output(transformed_points, id_to_idx, dim_attributes):
@@ -296,39 +252,19 @@ def batch_fitting(entity_points_url, pca, batch_size):
     :param batch_size: int how big the batchs for fitting should be.
     :return: list of dimension attributes
     """
-    entity_generator = get_entity_generator(entity_points_url)
-    # get First element to get the correct array size
-    el = get_point(next(entity_generator)["point"])
-    batch = np.empty((batch_size, len(el)))
-    prev_batch = np.empty((batch_size, len(el)))
-    prev_batch[0] = el
-    idx = 1
-    # Init prev_batch
-    for el in entity_generator:
-        # append element
-        prev_batch[idx] = get_point(el["point"])
-        idx += 1
-        # check if we reached the batch_size
-        if idx == batch_size:
-            idx = 0
-            break
-    for el in entity_generator:
-        # check if we reached the batch_size
-        if idx == batch_size:
-            batch = np.array(batch)
-            pca.partial_fit(prev_batch)
-            prev_batch = batch.copy()
-            idx = 0
-        # append element
-        batch[idx] = get_point(el["point"])
-        idx += 1
-    if idx != 0:
-        if idx < pca.n_components:
-            batch = np.concatenate((prev_batch, batch[:idx]))
-        else:
-            pca.partial_fit(prev_batch)
-            batch = batch[:idx]
-        pca.partial_fit(batch)
+    # only the last batch can be smaller than batch_size
+    n_components = pca.n_components or 0
+    prev_batch = None
+    for _, batch in get_point_batches(entity_points_url, batch_size):
+        if prev_batch is not None:
+            if len(batch) < n_components:
+                # too small for a partial fit, fit it together with the previous batch
+                batch = np.concatenate((prev_batch, batch))
+            else:
+                pca.partial_fit(prev_batch)
+        prev_batch = batch
+    if prev_batch is not None:
+        pca.partial_fit(prev_batch)
 
     dim = get_output_dimensionality(pca)
     dim_attributes = get_dim_attributes(dim)
@@ -495,10 +431,10 @@ def calculation_task(self, db_id: int) -> str:
         batch_size = input_params["batch_size"]
         dim_attributes = batch_fitting(entity_points_url, pca, batch_size)
         entity_points = prepare_stream_output(
-            get_entity_generator(entity_points_url), pca, dim_attributes
+            get_point_batches(entity_points_url, batch_size), pca, dim_attributes
         )
         entity_points_for_plot = prepare_stream_output(
-            get_entity_generator(entity_points_url), pca, dim_attributes
+            get_point_batches(entity_points_url, batch_size), pca, dim_attributes
         )
     elif (
         input_params["pca_type"] == PCATypeEnum.kernel.value
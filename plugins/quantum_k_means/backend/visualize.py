@@ -14,25 +14,19 @@
 
 import pandas as pd
 import plotly.express as px
-import numpy as np
 
 
-def plot_data(data_points, clusters, only_first_100=True):
+def plot_data(ids, points, clusters, only_first_100=True):
     if only_first_100:
-        data_points = data_points[:100]
+        ids = ids[:100]
+        points = points[:100]
 
-    dim = len(data_points[0]["point"])
+    dim = points.shape[1]
     cluster_dict = {}
     for cluster_entry in clusters:
         cluster_dict[cluster_entry["ID"]] = int(cluster_entry["cluster"])
 
-    points = np.empty((len(data_points), dim))
-    ids = []
-    cluster = []
-    for i, entity in enumerate(data_points):
-        points[i] = np.array(entity["point"], dtype=float)
-        ids.append(entity["ID"])
-        cluster.append(cluster_dict[entity["ID"]])
+    cluster = [cluster_dict[ID] for ID in ids]
 
     if dim >= 3:
         df = pd.DataFrame(
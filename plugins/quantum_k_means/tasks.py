@@ -26,54 +26,17 @@ from .schemas import (
 )
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
-from qhana_plugin_runner.plugin_utils.entity_marshalling import (
-    save_entities,
-    load_entities,
-    ensure_dict,
-)
+from qhana_plugin_runner.plugin_utils.entity_marshalling import save_entities
+from qhana_plugin_runner.plugin_utils.entity_points import load_entity_points
 from qhana_plugin_runner.requests import open_url
 from qhana_plugin_runner.storage import STORE
 
-import numpy as np
-
 from .backend.visualize import plot_data
 
 
 TASK_LOGGER = get_task_logger(__name__)
 
 
-def get_point(ent):
-    dimension_keys = list(ent.keys())
-    dimension_keys.remove("ID")
-    dimension_keys.remove("href")
-
-    dimension_keys.sort()
-    point = np.empty(
-        (
-            len(
-                dimension_keys,
-            )
-        )
-    )
-    for idx, d in enumerate(dimension_keys):
-        point[idx] = ent[d]
-    return point
-
-
-def get_entity_generator(entity_points_url: str):
-    """
-    Return a generator for the entity points, given an url to them.
-    :param entity_points_url: url to the entity points
-    """
-    file_ = open_url(entity_points_url)
-    file_.encoding = "utf-8"
-    file_type = file_.headers["Content-Type"]
-    entities_generator = load_entities(file_, mimetype=file_type)
-    entities_generator = ensure_dict(entities_generator)
-    for ent in entities_generator:
-        yield {"ID": ent["ID"], "href": ent.get("href", ""), "point": get_point(ent)}
-
-
 @CELERY.task(name=f"{QKMeans.instance.identifier}.calculation_task", bind=True)
 def calculation_task(self, db_id: int) -> str:
     # get parameters
@@ -117,25 +80,10 @@ def calculation_task(self, db_id: int) -> str:
 
     # load data from file
 
-    entity_points = list(get_entity_generator(entity_points_url))
-    id_to_idx = {}
-
-    idx = 0
-
-    for ent in entity_points:
-        if ent["ID"] in id_to_idx:
-            raise ValueError("Duplicate ID: ", ent["ID"])
-
-        id_to_idx[ent["ID"]] = idx
-        idx += 1
-
-    points_cnt = len(id_to_idx)
-    dimensions = len(entity_points[0]["point"])
-    points_arr = np.zeros((points_cnt, dimensions))
-
-    for ent in entity_points:
-        idx = id_to_idx[ent["ID"]]
-        points_arr[idx] = ent["point"]
+    with open_url(entity_points_url, stream=True) as file_:
+        entity_points = load_entity_points(file_)
+    id_to_idx = entity_points.id_to_idx
+    points_arr = entity_points.points
 
     max_qbits = backend.get_max_num_qbits(ibmq_token, custom_backend)
     if max_qbits is None:
@@ -164,7 +112,7 @@ def calculation_task(self, db_id: int) -> str:
             "application/json",
         )
 
-    fig = plot_data(entity_points, entity_clusters)
+    fig = plot_data(entity_points.ids, points_arr, entity_clusters)
     if fig is not None:
         fig.update_layout(showlegend=False)
 
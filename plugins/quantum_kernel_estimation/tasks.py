@@ -15,7 +15,7 @@
 import os
 from tempfile import SpooledTemporaryFile
 
-from typing import Optional, List
+from typing import Optional
 
 from celery.utils.log import get_task_logger
 
@@ -27,11 +27,12 @@ from .schemas import (
 )
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
-from qhana_plugin_runner.plugin_utils.entity_marshalling import (
-    save_entities,
-    load_entities,
-    ensure_dict,
+from qhana_plugin_runner.plugin_utils.entity_marshalling import save_entities
+from qhana_plugin_runner.plugin_utils.entity_matrix import (
+    MATRIX_MIMETYPE,
+    save_entity_matrix,
 )
+from qhana_plugin_runner.plugin_utils.entity_points import load_entity_points
 from qhana_plugin_runner.requests import open_url
 from qhana_plugin_runner.storage import STORE
 
@@ -41,60 +42,10 @@ import numpy as np
 TASK_LOGGER = get_task_logger(__name__)
 
 
-def get_point(ent):
-    dimension_keys = list(ent.keys())
-    dimension_keys.remove("ID")
-    dimension_keys.remove("href")
-
-    dimension_keys.sort()
-    point = np.empty(
-        (
-            len(
-                dimension_keys,
-            )
-        )
-    )
-    for idx, d in enumerate(dimension_keys):
-        point[idx] = ent[d]
-    return point
-
-
-def get_entity_generator(entity_points_url: str):
-    """
-    Return a generator for the entity points, given an url to them.
-    :param entity_points_url: url to the entity points
-    """
-    file_ = open_url(entity_points_url)
-    file_.encoding = "utf-8"
-    file_type = file_.headers["Content-Type"]
-    entities_generator = load_entities(file_, mimetype=file_type)
-    entities_generator = ensure_dict(entities_generator)
-    for ent in entities_generator:
-        yield {"ID": ent["ID"], "href": ent.get("href", ""), "point": get_point(ent)}
-
-
-def get_indices_and_point_arr(entity_points_url: str) -> (dict, List[List[float]]):
-    entity_points = list(get_entity_generator(entity_points_url))
-    id_to_idx = {}
-
-    idx = 0
-
-    for ent in entity_points:
-        if ent["ID"] in id_to_idx:
-            raise ValueError("Duplicate ID: ", ent["ID"])
-
-        id_to_idx[ent["ID"]] = idx
-        idx += 1
-
-    points_cnt = len(id_to_idx)
-    dimensions = len(entity_points[0]["point"])
-    points_arr = np.zeros((points_cnt, dimensions))
-
-    for ent in entity_points:
-        idx = id_to_idx[ent["ID"]]
-        points_arr[idx] = ent["point"]
-
-    return id_to_idx, points_arr
+def get_indices_and_point_arr(entity_points_url: str) -> (dict, np.ndarray):
+    with open_url(entity_points_url, stream=True) as file_:
+        entity_points = load_entity_points(file_)
+    return entity_points.id_to_idx, entity_points.points
 
 
 @CELERY.task(name=f"{QKE.instance.identifier}.calculation_task", bind=True)
@@ -173,6 +124,21 @@ def calculation_task(self, db_id: int) -> str:
             "application/json",
         )
 
+    with SpooledTemporaryFile(mode="wb") as output:
+        save_entity_matrix(
+            kernel_matrix,
+            output,
+            row_ids=list(id_to_idx_y),
+            column_ids=list(id_to_idx_x),
+        )
+        STORE.persist_task_result(
+            db_id,
+            output,
+            "kernel.bin",
+            "custom/kernel-matrix",
+            MATRIX_MIMETYPE,
+        )
+
     with SpooledTemporaryFile(mode="w") as output:
         output.write(representative_circuit)
         STORE.persist_task_result(
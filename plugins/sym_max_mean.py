@@ -13,10 +13,19 @@
 # limitations under the License.
 import json
 from http import HTTPStatus
-from io import StringIO
+from io import TextIOWrapper
 from json import dumps, loads
-from tempfile import SpooledTemporaryFile
-from typing import Mapping, Optional, List, Dict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
 from zipfile import ZipFile
 
 import marshmallow as ma
@@ -56,6 +65,9 @@ from qhana_plugin_runner.storage import STORE
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
 from qhana_plugin_runner.util.plugins import QHAnaPluginBase, plugin_identifier
 
+if TYPE_CHECKING:
+    import numpy as np
+
 _plugin_name = "sym-max-mean"
 __version__ = "v0.1.0"
 _identifier = plugin_identifier(_plugin_name, __version__)
@@ -237,21 +249,150 @@ class SymMaxMean(QHAnaPluginBase):
         return SYM_MAX_MEAN_BLP
 
     def get_requirements(self) -> str:
-        return ""
+        return "numpy>=1.21"
 
 
 TASK_LOGGER = get_task_logger(__name__)
 
 
-def _get_sim(elem_sims: Dict, val1, val2) -> float:
-    if (val1, val2) in elem_sims:
-        return elem_sims[(val1, val2)]["similarity"]
-    elif (val2, val1) in elem_sims:
-        return elem_sims[(val2, val2)]["similarity"]
-    else:
+SYM_MAX_MEAN_BLOCK_SIZE = 2**22
+"""Maximum number of element similarities gathered at once (bounds the memory usage)."""
+
+
+def _encode_values(
+    entities: List[Dict[str, Any]], attribute: str
+) -> Tuple[Dict[Any, int], List[Optional[List[int]]]]:
+    """Encode the values of an attribute of all entities as integer codes.
+
+    Returns:
+        Tuple[Dict[Any, int], List[Optional[List[int]]]]: the codes of all values and the list of value codes for each entity (None for missing values)
+    """
+    value_codes: Dict[Any, int] = {}
+    encoded: List[Optional[List[int]]] = []
+    for ent in entities:
+        values = ent[attribute]
+        if values is None:
+            encoded.append(None)  # TODO: add handling of missing values
+            continue
+        if not isinstance(values, list):
+            values = [values]
+        if not values:
+            encoded.append(None)  # nothing to compare
+            continue
+        encoded.append([value_codes.setdefault(v, len(value_codes)) for v in values])
+    return value_codes, encoded
+
+
+def _get_element_similarity_matrix(
+    element_similarities: Iterable[Dict[str, Any]], value_codes: Dict[Any, int]
+) -> "np.ndarray":
+    """Compile the element similarities into a dense matrix indexed by the value codes.
+
+    Element similarities that are only given for one direction are used for both directions.
+
+    Raises:
+        ValueError: if the similarity of two values is missing
+    """
+    import numpy as np
+
+    size = len(value_codes)
+    matrix = np.full((size, size), np.nan)
+    for element in element_similarities:
+        source = value_codes.get(element["source"])
+        target = value_codes.get(element["target"])
+        if source is not None and target is not None:
+            similarity = element["similarity"]
+            matrix[source, target] = np.nan if similarity is None else similarity
+    matrix = np.where(np.isnan(matrix), matrix.T, matrix)
+
+    missing = np.argwhere(np.isnan(matrix))
+    if len(missing):
+        values = list(value_codes.keys())
         raise ValueError(
-            "No element similarity value found for " + str(val1) + " and " + str(val2)
+            "No element similarity value found for "
+            + str(values[missing[0][0]])
+            + " and "
+            + str(values[missing[0][1]])
         )
+    return matrix
+
+
+def _sym_max_mean_matrix(
+    encoded: List[Optional[List[int]]], element_similarities: "np.ndarray"
+) -> "np.ndarray":
+    """Calculate the Sym Max Mean of all entity pairs.
+
+    ``mean_max[i, j]`` is the average (over the values ``a`` of entity ``i``) of the maximum
+    similarity of ``a`` to all values of entity ``j``.
+    The Sym Max Mean of ``i`` and ``j`` is the mean of ``mean_max[i, j]`` and ``mean_max[j, i]``.
+
+    Args:
+        encoded (List[Optional[List[int]]]): the value codes of the entities (None for missing values)
+        element_similarities (np.ndarray): the element similarities indexed by the value codes
+
+    Returns:
+        np.ndarray: the Sym Max Mean of all entity pairs (NaN if an entity has no values)
+    """
+    import numpy as np
+
+    entity_count = len(encoded)
+    value_count = element_similarities.shape[0]
+    lengths = np.array([len(v) if v else 0 for v in encoded], dtype=np.intp)
+    max_length = max(int(lengths.max(initial=0)), 1)
+
+    # pad the value lists with an extra code that is never the maximum
+    padded = np.full((entity_count, max_length), value_count, dtype=np.intp)
+    for i, values in enumerate(encoded):
+        if values:
+            padded[i, : len(values)] = values
+    similarities = np.full((value_count, value_count + 1), -np.inf)
+    similarities[:, :value_count] = element_similarities
+
+    # max_sims[a, j] is the maximum similarity of value a to all values of entity j
+    max_sims = np.empty((value_count, entity_count))
+    block_size = max(SYM_MAX_MEAN_BLOCK_SIZE // max(value_count * max_length, 1), 1)
+    for start in range(0, entity_count, block_size):
+        end = start + block_size
+        np.max(similarities[:, padded[start:end]], axis=2, out=max_sims[:, start:end])
+    # the maximum similarity starts at 0 (and entities without values get 0)
+    np.maximum(max_sims, 0.0, out=max_sims)
+
+    # weights[i, a] is the number of occurrences of a in entity i divided by the number of values of i
+    weights = np.zeros((entity_count, value_count))
+    codes = np.fromiter(
+        (code for values in encoded if values for code in values), dtype=np.intp
+    )
+    np.add.at(weights, (np.repeat(np.arange(entity_count), lengths), codes), 1.0)
+    weights /= np.maximum(lengths, 1)[:, np.newaxis]
+
+    mean_max = weights @ max_sims
+    sym_max_mean = (mean_max + mean_max.T) / 2.0
+
+    missing = lengths == 0
+    sym_max_mean[missing, :] = np.nan
+    sym_max_mean[:, missing] = np.nan
+    return sym_max_mean
+
+
+def get_attribute_similarities(
+    entities: List[Dict[str, Any]], attribute: str, sym_max_mean: "np.ndarray"
+) -> Iterator[Dict[str, Any]]:
+    """Generate the attribute similarity entities of all entity pairs (upper triangle)."""
+    for i, ent1 in enumerate(entities):
+        row = sym_max_mean[i].tolist()
+
+        for j in range(i, len(entities)):
+            ent2 = entities[j]
+            similarity = row[j]
+
+            yield {
+                "ID": ent1["ID"] + "__" + ent2["ID"] + "__" + attribute,
+                "entity_1_ID": ent1["ID"],
+                "entity_2_ID": ent2["ID"],
+                "href": "",
+                # NaN marks missing values
+                "similarity": None if similarity != similarity else similarity,
+            }
 
 
 @CELERY.task(name=f"{SymMaxMean.instance.identifier}.calculation_task", bind=True)
@@ -293,93 +434,29 @@ def calculation_task(self, db_id: int) -> str:
         # removes .json from file name to get the name of the attribute
         attr_name = file_name[:-5]
 
-        element_similarities[attr_name] = {
-            (element["source"], element["target"]): element for element in json.load(file)
-        }
-
-    tmp_zip_file = SpooledTemporaryFile(mode="wb")
-    zip_file = ZipFile(tmp_zip_file, "w")
-
-    for attribute in attributes:
-        elem_sims = element_similarities[attribute]
-        attribute_similarities = []
-
-        for i in range(len(entities)):
-            for j in range(i, len(entities)):
-                ent1 = entities[i]
-                ent2 = entities[j]
-
-                ent_attr1 = ent1[attribute]
-                ent_attr2 = ent2[attribute]
-
-                if ent_attr1 is None or ent_attr2 is None:
-                    sym_max_mean = None  # TODO: add handling of missing values
-                else:
-                    if not isinstance(ent_attr1, list):
-                        ent_attr1 = [ent_attr1]
-
-                    if not isinstance(ent_attr2, list):
-                        ent_attr2 = [ent_attr2]
-
-                    # calculate Sym Max Mean
-
-                    sum1 = 0.0
-                    sum2 = 0.0
-
-                    for a in ent_attr1:
-                        # get maximum similarity
-                        max_sim = 0.0
+        element_similarities[attr_name] = json.load(file)
 
-                        for b in ent_attr2:
-                            sim = _get_sim(elem_sims, a, b)
-
-                            if sim > max_sim:
-                                max_sim = sim
-
-                        sum1 += max_sim
-
-                    # calculate the average of the maximum similarities
-                    avg1 = sum1 / len(ent_attr1)
-
-                    for b in ent_attr2:
-                        max_sim = 0.0
-
-                        for a in ent_attr1:
-                            sim = _get_sim(elem_sims, b, a)
-
-                            if sim > max_sim:
-                                max_sim = sim
-
-                        sum2 += max_sim
-
-                    # calculate the average of the maximum similarities
-                    avg2 = sum2 / len(ent_attr2)
-
-                    sym_max_mean = (avg1 + avg2) / 2.0
-
-                attribute_similarities.append(
-                    {
-                        "ID": ent1["ID"] + "__" + ent2["ID"] + "__" + attribute,
-                        "entity_1_ID": ent1["ID"],
-                        "entity_2_ID": ent2["ID"],
-                        "href": "",
-                        "similarity": sym_max_mean,
-                    }
-                )
-
-        with StringIO() as file:
-            save_entities(attribute_similarities, file, "application/json")
-            file.seek(0)
-            zip_file.writestr(attribute + ".json", file.read())
-
-    zip_file.close()
-
-    STORE.persist_task_result(
+    with STORE.open_task_result_writer(
         db_id,
-        tmp_zip_file,
         "sym_max_mean.zip",
         "custom/attribute-similarities",
         "application/zip",
-    )
+        mode="b",
+    ) as output:
+        with ZipFile(output, "w") as zip_file:
+            for attribute in attributes:
+                value_codes, encoded = _encode_values(entities, attribute)
+                elem_sims = _get_element_similarity_matrix(
+                    element_similarities[attribute], value_codes
+                )
+                sym_max_mean = _sym_max_mean_matrix(encoded, elem_sims)
+
+                zipped_file = zip_file.open(attribute + ".json", "w", force_zip64=True)
+                with TextIOWrapper(zipped_file, encoding="utf-8") as text_file:
+                    save_entities(
+                        get_attribute_similarities(entities, attribute, sym_max_mean),
+                        text_file,
+                        "application/json",
+                    )
 
     return "Result stored in file"
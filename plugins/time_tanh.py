@@ -12,12 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
-import math
 from http import HTTPStatus
-from io import StringIO
+from io import TextIOWrapper
 from json import dumps, loads
-from tempfile import SpooledTemporaryFile
-from typing import Mapping, Optional, List
+from typing import Any, Dict, List, Mapping, Optional
 from zipfile import ZipFile
 
 import marshmallow as ma
@@ -236,11 +234,78 @@ class TimeTanh(QHAnaPluginBase):
         return TIME_TANH_BLP
 
     def get_requirements(self) -> str:
-        return ""
+        return "numpy>=1.21"
 
 
 TASK_LOGGER = get_task_logger(__name__)
 
+TIME_TANH_BLOCK_SIZE = 2**20
+"""Maximum number of similarities calculated at once (bounds the memory usage)."""
+
+
+def get_distinct_values(entities: List[Dict[str, Any]], attribute: str) -> List[Any]:
+    """Collect the distinct values of an attribute in the order of their first occurrence.
+
+    Values are converted to integers if possible.
+    """
+    values: Dict[Any, None] = {}
+
+    for entity in entities:
+        if attribute not in entity:
+            continue
+
+        value = entity[attribute]
+
+        if value is not None:
+            try:
+                value = int(value)
+            except ValueError as e:
+                TASK_LOGGER.info(
+                    "Found value that could not be converted to an integer: " + str(e)
+                )
+
+        values.setdefault(value, None)
+
+    return list(values.keys())
+
+
+def calculate_similarities(values: List[Any], factor: float) -> List[Dict[str, Any]]:
+    """Calculate ``1 - tanh(|a - b| * factor)`` for all pairs of the distinct values.
+
+    Pairs with a missing or non integer value get a similarity of None.
+    """
+    import numpy as np
+
+    numbers = [value for value in values if isinstance(value, int)]
+    number_positions = {number: i for i, number in enumerate(numbers)}
+    number_array = np.array(numbers, dtype=np.float64)
+
+    similarities = []
+    block_size = max(TIME_TANH_BLOCK_SIZE // max(len(numbers), 1), 1)
+    rows: List[List[float]] = []
+
+    for i, val1 in enumerate(values):
+        position = number_positions.get(val1) if isinstance(val1, int) else None
+
+        if position is not None and position % block_size == 0:
+            # calculate the similarities of the next block of rows at once
+            block = number_array[position : position + block_size]
+            rows = (
+                1 - np.tanh(np.abs(block[:, np.newaxis] - number_array) * factor)
+            ).tolist()
+
+        row = None if position is None else rows[position % block_size]
+
+        for val2 in values[i:]:
+            if row is None or not isinstance(val2, int):
+                sim = None
+            else:
+                sim = row[number_positions[val2]]
+
+            similarities.append({"source": val1, "target": val2, "similarity": sim})
+
+    return similarities
+
 
 @CELERY.task(name=f"{TimeTanh.instance.identifier}.calculation_task", bind=True)
 def calculation_task(self, db_id: int) -> str:
@@ -275,59 +340,21 @@ def calculation_task(self, db_id: int) -> str:
 
     # calculate similarity values for all possible value pairs
 
-    tmp_zip_file = SpooledTemporaryFile(mode="wb")
-    zip_file = ZipFile(tmp_zip_file, "w")
-
-    for attribute in attributes:
-        similarities = {}
-
-        for i in range(len(entities)):
-            for j in range(i, len(entities)):
-                ent1 = entities[i]
-                ent2 = entities[j]
-
-                if attribute in ent1 and attribute in ent2:
-                    val1 = ent1[attribute]
-                    val2 = ent2[attribute]
-
-                    if val1 is None or val2 is None:
-                        sim = None
-                    else:
-                        try:
-                            val1 = int(val1)
-                            val2 = int(val2)
-
-                            sim = 1 - math.tanh(math.fabs((val1 - val2)) * factor)
-                        except ValueError as e:
-                            TASK_LOGGER.info(
-                                "Found value that could not be converted to an integer: "
-                                + str(e)
-                            )
-                            sim = None
-
-                    if (val1, val2) not in similarities and (
-                        val2,
-                        val1,
-                    ) not in similarities:
-                        similarities[(val1, val2)] = {
-                            "source": val1,
-                            "target": val2,
-                            "similarity": sim,
-                        }
-
-        with StringIO() as file:
-            save_entities(similarities.values(), file, "application/json")
-            file.seek(0)
-            zip_file.writestr(attribute + ".json", file.read())
-
-    zip_file.close()
-
-    STORE.persist_task_result(
+    with STORE.open_task_result_writer(
         db_id,
-        tmp_zip_file,
         "time_tanh.zip",
         "custom/element-similarities",
         "application/zip",
-    )
+        mode="b",
+    ) as output:
+        with ZipFile(output, "w") as zip_file:
+            for attribute in attributes:
+                # the similarities only depend on the (few) distinct values, not on the entities
+                values = get_distinct_values(entities, attribute)
+                similarities = calculate_similarities(values, factor)
+
+                zipped_file = zip_file.open(attribute + ".json", "w", force_zip64=True)
+                with TextIOWrapper(zipped_file, encoding="utf-8") as text_file:
+                    save_entities(similarities, text_file, "application/json")
 
     return "Result stored in file"
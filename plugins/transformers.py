@@ -12,12 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
-import math
 from enum import Enum
 from http import HTTPStatus
-from io import StringIO
-from tempfile import SpooledTemporaryFile
-from typing import Mapping, Optional, List
+from io import TextIOWrapper
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Mapping, Optional
 from zipfile import ZipFile
 
 import marshmallow as ma
@@ -54,6 +52,9 @@ from qhana_plugin_runner.storage import STORE
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
 from qhana_plugin_runner.util.plugins import QHAnaPluginBase, plugin_identifier
 
+if TYPE_CHECKING:
+    import numpy as np
+
 _plugin_name = "sim-to-dist-transformers"
 __version__ = "v0.2.0"
 _identifier = plugin_identifier(_plugin_name, __version__)
@@ -262,12 +263,62 @@ class Transformers(QHAnaPluginBase):
         return TRANSFORMERS_BLP
 
     def get_requirements(self) -> str:
-        return ""
+        return "numpy>=1.21"
 
 
 TASK_LOGGER = get_task_logger(__name__)
 
 
+def get_transformer_function(
+    transformer: TransformersEnum,
+) -> Callable[["np.ndarray"], "np.ndarray"]:
+    """Get a function that transforms an array of similarities into an array of distances."""
+    import numpy as np
+
+    if transformer == TransformersEnum.linear_inverse:
+        return lambda sim: 1.0 - sim
+    elif transformer == TransformersEnum.exponential_inverse:
+        return lambda sim: np.exp(-sim)
+    elif transformer == TransformersEnum.gaussian_inverse:
+        return lambda sim: np.exp(-sim * sim)
+    elif transformer == TransformersEnum.polynomial_inverse:
+        alpha = 1.0
+        beta = 1.0
+
+        return lambda sim: 1.0 / (1.0 + np.power(sim / alpha, beta))
+    elif transformer == TransformersEnum.square_inverse:
+        max_sim = 1.0
+
+        return lambda sim: (1.0 / np.sqrt(2.0)) * np.sqrt(2.0 * max_sim - 2 * sim)
+
+    raise ValueError(f"Unknown transformer {transformer}")
+
+
+def get_attribute_distances(
+    attr_elem_sims: List[Dict[str, Any]],
+    transform: Callable[["np.ndarray"], "np.ndarray"],
+) -> Iterator[Dict[str, Any]]:
+    """Transform all similarities of an attribute at once and yield the distance entities."""
+    import numpy as np
+
+    similarities = np.array(
+        [sim_entity["similarity"] for sim_entity in attr_elem_sims], dtype=np.float64
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        distances = transform(similarities).tolist()
+
+    for sim_entity, dist in zip(attr_elem_sims, distances):
+        yield {
+            "ID": sim_entity["ID"],
+            "entity_1_ID": sim_entity["entity_1_ID"],
+            "entity_2_ID": sim_entity["entity_2_ID"],
+            "href": "",
+            # NaN marks missing similarities (and similarities outside of the valid range)
+            "distance": None if dist != dist else dist,
+        }
+
+
 @CELERY.task(name=f"{Transformers.instance.identifier}.calculation_task", bind=True)
 def calculation_task(self, db_id: int) -> str:
     # get parameters
@@ -292,65 +343,42 @@ def calculation_task(self, db_id: int) -> str:
     transformer = input_params.transformer
     TASK_LOGGER.info(f"Loaded input parameters from db: transformer='{transformer}'")
 
-    # load data from file
-
-    element_similarities = {}
-
-    for file, file_name in get_files_from_zip_url(attribute_similarities_url):
-        # removes .json from file name to get the name of the attribute
-        attr_name = file_name[:-5]
-
-        element_similarities[attr_name] = json.load(file)
-
-    tmp_zip_file = SpooledTemporaryFile(mode="wb")
-    zip_file = ZipFile(tmp_zip_file, "w")
-
-    for attribute in attributes:
-        attribute_distances = []
-        attr_elem_sims = element_similarities[attribute]
-
-        for sim_entity in attr_elem_sims:
-            sim = sim_entity["similarity"]
-            dist = None
-
-            if transformer == TransformersEnum.linear_inverse:
-                dist = 1.0 - sim
-            elif transformer == TransformersEnum.exponential_inverse:
-                dist = math.exp(-sim)
-            elif transformer == TransformersEnum.gaussian_inverse:
-                dist = math.exp(-sim * sim)
-            elif transformer == TransformersEnum.polynomial_inverse:
-                alpha = 1.0
-                beta = 1.0
-
-                dist = 1.0 / (1.0 + pow(sim / alpha, beta))
-            elif transformer == TransformersEnum.square_inverse:
-                max_sim = 1.0
-                dist = (1.0 / math.sqrt(2.0)) * math.sqrt(2.0 * max_sim - 2 * sim)
-
-            attribute_distances.append(
-                {
-                    "ID": sim_entity["ID"],
-                    "entity_1_ID": sim_entity["entity_1_ID"],
-                    "entity_2_ID": sim_entity["entity_2_ID"],
-                    "href": "",
-                    "distance": dist,
-                }
-            )
-
-        with StringIO() as file:
-            save_entities(attribute_distances, file, "application/json")
-            file.seek(0)
-            zip_file.writestr(attribute + ".json", file.read())
+    transform = get_transformer_function(transformer)
 
-    zip_file.close()
+    remaining_attributes = set(attributes)
 
-    STORE.persist_task_result(
+    with STORE.open_task_result_writer(
         db_id,
-        tmp_zip_file,
         "attr_dist.zip",
         "custom/attribute-distances",
         "application/zip",
-    )
+        mode="b",
+    ) as output:
+        with ZipFile(output, "w") as zip_file:
+            for file, file_name in get_files_from_zip_url(attribute_similarities_url):
+                # removes .json from file name to get the name of the attribute
+                attr_name = file_name[:-5]
+
+                if attr_name not in remaining_attributes:
+                    continue
+
+                remaining_attributes.remove(attr_name)
+                attr_elem_sims = json.load(file)
+
+                # stream the distances directly into the zip file
+                zipped_file = zip_file.open(attr_name + ".json", "w", force_zip64=True)
+                with TextIOWrapper(zipped_file, encoding="utf-8") as text_file:
+                    save_entities(
+                        get_attribute_distances(attr_elem_sims, transform),
+                        text_file,
+                        "application/json",
+                    )
+
+                del attr_elem_sims
+
+            if remaining_attributes:
+                raise KeyError(
+                    f"No similarities found for the attributes {sorted(remaining_attributes)}!"
+                )
 
     return "Result stored in file"
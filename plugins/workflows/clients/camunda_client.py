@@ -4,9 +4,11 @@ import re
 from pathlib import Path
 from typing import List, Optional, Sequence
 
-import requests
+from requests import Session
 from requests.exceptions import HTTPError
 
+from qhana_plugin_runner.requests import REQUEST_SESSION
+
 from .. import Workflows
 from ..exceptions import WorkflowDeploymentError
 from ..datatypes.camunda_datatypes import CamundaConfig, ExternalTask, HumanTask
@@ -26,9 +28,12 @@ class CamundaClient:
         self,
         camunda_config: CamundaConfig,
         timeout: int = config.get("request_timeout", 5 * 60),
+        session: Optional[Session] = None,
     ):
         self.camunda_config = camunda_config
         self.timeout = timeout
+        # reuse pooled connections to the camunda engine
+        self.session = session if session is not None else REQUEST_SESSION
 
     def lock(self, external_task_id: str):
         """
@@ -36,7 +41,7 @@ class CamundaClient:
         :param task: The task to be locked
         """
         # TODO: Instead of just setting a high lock duration, automatically re-lock when expired
-        response = requests.post(
+        response = self.session.post(
             f"{self.camunda_config.base_url}/external-task/{external_task_id}/lock",
             json={"workerId": self.camunda_config.worker_id, "lockDuration": "999999999"},
             timeout=self.timeout,
@@ -44,7 +49,7 @@ class CamundaClient:
         response.raise_for_status()
 
     def get_locked_external_tasks_count(self) -> int:
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/external-task/count",
             params={
                 "workerId": self.camunda_config.worker_id,
@@ -70,7 +75,7 @@ class CamundaClient:
             if limit < 1:
                 raise ValueError("The limit must not be smaller than 1!")
             params["maxResults"] = str(limit)
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/external-task",
             params=params,
             timeout=self.timeout,
@@ -88,7 +93,7 @@ class CamundaClient:
         Unlocks an external task so that other workers can use it
         :param task: The task to be locked
         """
-        response = requests.post(
+        response = self.session.post(
             f"{self.camunda_config.base_url}/external-task/{external_task_id}/unlock",
             timeout=self.timeout,
         )
@@ -110,7 +115,7 @@ class CamundaClient:
         Check if a task is locked
         :return: Locked status
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/external-task/{external_task_id}",
             timeout=self.timeout,
         )
@@ -133,7 +138,7 @@ class CamundaClient:
         # Completing an external task always requires specifying output variables. This output variable should not be
         # used, instead refer to error_code and error_message for further exception handling.
         output_variables = {"output": {"value": "Exception thrown.", "type": "String"}}
-        response = requests.post(
+        response = self.session.post(
             url=f"{self.camunda_config.base_url}/external-task/{external_task_id}/bpmnError",
             json={
                 "workerId": self.camunda_config.worker_id,
@@ -151,7 +156,7 @@ class CamundaClient:
         :param external_task_id: The id of the completed task
         :param result: Return values for the external task
         """
-        response = requests.post(
+        response = self.session.post(
             f"{self.camunda_config.base_url}/external-task/{external_task_id}/complete",
             json={"workerId": self.camunda_config.worker_id, "variables": result},
             timeout=self.timeout,
@@ -164,7 +169,7 @@ class CamundaClient:
         :param human_task_id: Human task id
         :param result: User input result
         """
-        response = requests.post(
+        response = self.session.post(
             f"{self.camunda_config.base_url}/task/{human_task_id}/complete",
             json={"workerId": self.camunda_config.worker_id, "variables": result},
             timeout=self.timeout,
@@ -173,7 +178,7 @@ class CamundaClient:
 
     def get_human_tasks(self, process_instance_id: str) -> Sequence[HumanTask]:
         """Get all active human tasks of a given process instance."""
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/task",
             params={
                 "processInstanceId": process_instance_id,
@@ -185,7 +190,7 @@ class CamundaClient:
         return [HumanTask.deserialize(t) for t in response.json()]
 
     def get_human_task_form_variables(self, human_task_id: str):
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/task/{human_task_id}/form-variables",
             timeout=self.timeout,
         )
@@ -213,7 +218,7 @@ class CamundaClient:
         :param external_task_execution_id: The execution_id of the external task
         :return: Local variables
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/execution/{external_task_execution_id}/localVariables",
             timeout=self.timeout,
         )
@@ -227,7 +232,7 @@ class CamundaClient:
         :param external_task
         :return: The value for a global variable
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/process-instance/{process_instance_id}/variables/{name}",
             timeout=self.timeout,
         )
@@ -240,7 +245,7 @@ class CamundaClient:
         Retrieves all workflow instance variables marked as workflow output
         :return: workflow output variables
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/process-instance/{process_instance_id}/variables",
             timeout=self.timeout,
         )
@@ -259,7 +264,7 @@ class CamundaClient:
         Retrieves all workflow instance variables marked as workflow output from a completed workflow.
         :return: workflow output variables
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/history/variable-instance",
             params={
                 "processInstanceId": process_instance_id,
@@ -277,7 +282,7 @@ class CamundaClient:
         :param task_id: The task to get the execution id for
         :return: The execution id of an external task
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/external-task/{task_id}",
             timeout=self.timeout,
         )
@@ -291,7 +296,7 @@ class CamundaClient:
         :param task_id: The task id for a human task
         :return: Rendered HTML form
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/task/{task_id}/rendered-form",
             timeout=self.timeout,
         )
@@ -306,7 +311,7 @@ class CamundaClient:
         if bpmn_location is None:
             raise ValueError("No BPMN File specified!")
         with bpmn_location.open(mode="rb") as bpmn:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.camunda_config.base_url}/deployment/create",
                 params={
                     "deployment-name": bpmn_location.name,
@@ -319,7 +324,7 @@ class CamundaClient:
             response.raise_for_status()
 
         deployment_id = response.json().get("id", None)
-        process_def_response = requests.get(
+        process_def_response = self.session.get(
             url=f"{self.camunda_config.base_url}/process-definition",
             params={
                 "deploymentId": deployment_id,
@@ -340,7 +345,7 @@ class CamundaClient:
         """
         Create a workflow instance from the deployed BPMN model
         """
-        response = requests.post(
+        response = self.session.post(
             url=f"{self.camunda_config.base_url}/process-definition/{process_definition_id}/start",
             json={"variables": {}},
             timeout=self.timeout,
@@ -356,7 +361,7 @@ class CamundaClient:
         Checks if the process is still in the process list and thus active
         :return: Process status
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/process-instance/{process_instance_id}",
             timeout=self.timeout,
         )
@@ -374,7 +379,7 @@ class CamundaClient:
         Checks if the process instance was completed successully.
         :return: Process status
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.camunda_config.base_url}/history/process-instance/{process_instance_id}",
             timeout=self.timeout,
         )
@@ -4,9 +4,10 @@ import http.client
 import json
 from typing import TYPE_CHECKING, List, Optional, Sequence, Dict, Any
 
-import requests
 from celery.utils.log import get_task_logger
-from requests import HTTPError
+from requests import HTTPError, Session
+
+from qhana_plugin_runner.requests import REQUEST_SESSION
 
 from .. import Workflows
 from ..datatypes.qhana_datatypes import QhanaInput, QhanaOutput, QhanaPlugin
@@ -34,8 +35,11 @@ class QhanaTaskClient:
 
     def __init__(
         self,
+        session: Optional[Session] = None,
     ):
         self.timeout: int = config.get("request_timeout", 5 * 60)
+        # reuse pooled connections to the plugins
+        self.session = session if session is not None else REQUEST_SESSION
 
     def call_qhana_plugin(self, plugin: Dict[str, Any], params):
         process_endpoint: Optional[str] = None
@@ -53,7 +57,7 @@ class QhanaTaskClient:
                 "The plugin does not contain a valid URL for the processing endpoint!"
             )
 
-        response = requests.post(process_endpoint, data=params, timeout=self.timeout)
+        response = self.session.post(process_endpoint, data=params, timeout=self.timeout)
 
         response.raise_for_status()
 
@@ -63,7 +67,7 @@ class QhanaTaskClient:
         return response.url
 
     def call_plugin_step(self, href: str, params):
-        response = requests.post(href, data=params, timeout=self.timeout)
+        response = self.session.post(href, data=params, timeout=self.timeout)
         response.raise_for_status()
 
     def get_micro_frontend(self, plugin: Dict[str, Any]):
@@ -85,7 +89,7 @@ class QhanaTaskClient:
                 "The plugin does not contain a valid URL for the user interface endpoint!"
             )
 
-        response = requests.get(ui_endpoint, timeout=self.timeout)
+        response = self.session.get(ui_endpoint, timeout=self.timeout)
         response.raise_for_status()
         return response.text
 
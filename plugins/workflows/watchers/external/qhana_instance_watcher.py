@@ -1,12 +1,12 @@
 from typing import cast
 
-import requests
 from celery.utils.functional import maybe_list
 from celery.utils.log import get_task_logger
 from requests.exceptions import ConnectionError, HTTPError, RequestException
 
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.registry_client import PLUGIN_REGISTRY_CLIENT
+from qhana_plugin_runner.requests import REQUEST_SESSION
 
 from ... import Workflows
 from ...clients.camunda_client import CamundaClient
@@ -241,7 +241,7 @@ def qhana_step_watcher(
 def check_task_status(self, url: str, external_task_id: str, last_step_count=0):
     # TODO: Timeout if no result after a long time (or workflow task removed)
     try:
-        response = requests.get(url, timeout=config.get("request_timeout", 5 * 60))
+        response = REQUEST_SESSION.get(url, timeout=config.get("request_timeout", 5 * 60))
         response.raise_for_status()
         contents = response.json()
 
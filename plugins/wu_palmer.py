@@ -12,13 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
-from functools import lru_cache
 from http import HTTPStatus
-from io import StringIO
+from io import TextIOWrapper
 from json import dumps, loads
 from pathlib import PurePath
-from tempfile import SpooledTemporaryFile
-from typing import Mapping, Optional, List, Dict, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
 from zipfile import ZipFile
 
 import marshmallow as ma
@@ -58,6 +66,9 @@ from qhana_plugin_runner.storage import STORE
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
 from qhana_plugin_runner.util.plugins import QHAnaPluginBase, plugin_identifier
 
+if TYPE_CHECKING:
+    import numpy as np
+
 _plugin_name = "wu-palmer"
 __version__ = "v0.2.0"
 _identifier = plugin_identifier(_plugin_name, __version__)
@@ -268,156 +279,229 @@ class WuPalmer(QHAnaPluginBase):
         return WU_PALMER_BLP
 
     def get_requirements(self) -> str:
-        return ""
+        return "numpy>=1.21"
 
 
 TASK_LOGGER = get_task_logger(__name__)
 
 
-def load_taxonomy_as_node_paths(taxonomy: Dict) -> Dict[str, Tuple[str, ...]]:
-    nodes: Dict[str, Tuple[str, ...]] = {}
-    edges: Dict[str, str] = {}
-    root_node: Optional[str] = ""
-
-    if taxonomy["type"] != "tree":
-        TASK_LOGGER.warn("taxonomy is not a tree")
-        return None
+def _get_node_id(node: Any) -> Optional[str]:
+    if isinstance(node, str):
+        return node
+    elif isinstance(node, dict):
+        return node["ID"]
+    elif isinstance(node, tuple):
+        return node[0]
+    TASK_LOGGER.warn("entity has an unsupported type")
+    return None
 
-    for relation in taxonomy["relations"]:
-        if relation["target"] != relation["source"]:
-            edges[relation["target"]] = relation["source"]
 
-    for node in taxonomy["entities"]:
-        node_id: str
-
-        if isinstance(node, str):
-            node_id = node
-        elif isinstance(node, dict):
-            node_id = node["ID"]
-        elif isinstance(node, tuple):
-            node_id = node[0]
-        else:
-            TASK_LOGGER.warn("entity has an unsupported type")
-            continue
+class TaxonomyIndex:
+    """Lowest common ancestor index of a taxonomy (tree or forest).
 
-        ancestors = [node_id]
-        visited = {node_id}
-        current_node_id = node_id
+    The nodes are mapped to integer indices. The index stores the depth of every node
+    and the ``2**k``-th ancestors of every node (binary lifting), so that the lowest common
+    ancestors of many node pairs can be computed as one vectorized batch in
+    ``O(log(depth))`` numpy operations.
 
-        for _ in range(len(edges)):
-            current_node_id = edges.get(current_node_id, None)
+    Index 0 is a virtual node (depth -1) that is the parent of all root nodes.
+    """
 
-            if current_node_id is None:
-                break
+    def __init__(self, taxonomy: Dict) -> None:
+        import numpy as np
 
-            if current_node_id in visited:
-                TASK_LOGGER.warn(
-                    f"cycle detected, node {current_node_id} already visited"
-                )
-                return None
+        if taxonomy["type"] != "tree":
+            raise ValueError("taxonomy is not a tree")
 
-            ancestors.append(current_node_id)
-            visited.add(current_node_id)
+        self.node_index: Dict[str, int] = {}
 
-        if root_node is not None:
-            if root_node == ancestors[-1]:
-                root_node = None
+        for node in taxonomy["entities"]:
+            node_id = _get_node_id(node)
+            if node_id is not None:
+                self.node_index.setdefault(node_id, len(self.node_index) + 1)
 
-            if not root_node:
-                root_node = ancestors[-1]
+        parents: List[int] = [0] * (len(self.node_index) + 1)
 
-        nodes[node_id] = tuple(ancestors)[::-1]
-
-    return nodes
+        for relation in taxonomy["relations"]:
+            if relation["target"] == relation["source"]:
+                continue
+            source = self.node_index.setdefault(
+                relation["source"], len(self.node_index) + 1
+            )
+            target = self.node_index.setdefault(
+                relation["target"], len(self.node_index) + 1
+            )
+            parents.extend([0] * (len(self.node_index) + 1 - len(parents)))
+            parents[target] = source
+
+        depths: List[Optional[int]] = [None] * len(parents)
+        depths[0] = -1
+
+        for node in range(1, len(parents)):
+            path = []
+            current = node
+            while depths[current] is None:
+                if len(path) >= len(parents):
+                    raise ValueError(f"cycle detected in taxonomy at node {node}")
+                path.append(current)
+                current = parents[current]
+            depth = depths[current]
+            for current in reversed(path):
+                depth += 1
+                depths[current] = depth
+
+        self.depths = np.array(depths, dtype=np.intp)
+        levels = max(int(self.depths.max(initial=0)).bit_length(), 1)
+        ancestors = np.empty((levels, len(parents)), dtype=np.intp)
+        ancestors[0] = parents
+        for level in range(1, levels):
+            ancestors[level] = ancestors[level - 1][ancestors[level - 1]]
+        self.ancestors = ancestors
+
+    def get_indices(self, nodes: Iterable[str]) -> "np.ndarray":
+        """Get the integer indices of the nodes.
+
+        Raises:
+            KeyError: if a node is not part of the taxonomy
+        """
+        import numpy as np
+
+        try:
+            return np.array([self.node_index[n] for n in nodes], dtype=np.intp)
+        except KeyError as err:
+            raise KeyError(f"node {err.args[0]} not in taxonomy") from err
+
+    def lowest_common_ancestors(
+        self, nodes_a: "np.ndarray", nodes_b: "np.ndarray"
+    ) -> "np.ndarray":
+        """Get the lowest common ancestors of the node pairs given as two index arrays.
+
+        Nodes in different trees of a forest have the virtual node 0 as their common ancestor.
+        """
+        import numpy as np
+
+        deeper_is_a = self.depths[nodes_a] >= self.depths[nodes_b]
+        deeper = np.where(deeper_is_a, nodes_a, nodes_b)
+        other = np.where(deeper_is_a, nodes_b, nodes_a)
+
+        # lift the deeper nodes to the depth of the other nodes
+        depth_difference = self.depths[deeper] - self.depths[other]
+        for level, ancestors in enumerate(self.ancestors):
+            deeper = np.where((depth_difference >> level) & 1, ancestors[deeper], deeper)
+
+        # lift both nodes as long as their ancestors differ
+        for ancestors in self.ancestors[::-1]:
+            ancestors_deeper = ancestors[deeper]
+            ancestors_other = ancestors[other]
+            differs = ancestors_deeper != ancestors_other
+            deeper = np.where(differs, ancestors_deeper, deeper)
+            other = np.where(differs, ancestors_other, other)
+
+        return np.where(deeper == other, deeper, self.ancestors[0][deeper])
+
+    def wu_palmer_similarities(
+        self, nodes_a: "np.ndarray", nodes_b: "np.ndarray", root_node_depth: int
+    ) -> "np.ndarray":
+        """Calculate the Wu-Palmer similarity of the node pairs given as two index arrays.
+
+        Args:
+            nodes_a (np.ndarray): indices of the first nodes
+            nodes_b (np.ndarray): indices of the second nodes
+            root_node_depth (int): 0 if the root node has a meaning in the taxonomy, else 1
+        """
+        import numpy as np
+
+        lowest_common_ancestors = self.lowest_common_ancestors(nodes_a, nodes_b)
+        # the depths start at 0, the path lengths used by Wu-Palmer start at 1 (the root)
+        common_ancestor_depth = self.depths[lowest_common_ancestors] + 1 - root_node_depth
+        denominator = (
+            self.depths[nodes_a] + self.depths[nodes_b] + 2 - (2 * root_node_depth)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarities = (2 * common_ancestor_depth) / denominator
+        return np.where(denominator == 0, 1.0, similarities)
 
 
 class WuPalmerCache:
     def __init__(self, taxonomies: Dict[str, Dict], root_has_meaning_in_taxonomy: bool):
         self._taxonomies = taxonomies
-        self._node_path_cache: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self._taxonomy_indexes: Dict[str, TaxonomyIndex] = {}
 
         if root_has_meaning_in_taxonomy:
             self._root_node_depth = 0
         else:
             self._root_node_depth = 1
 
-    @lru_cache
-    def calculate_similarity(self, tax_name: str, node_a: str, node_b: str) -> float:
-        if tax_name not in self._node_path_cache:
-            self._node_path_cache[tax_name] = load_taxonomy_as_node_paths(
-                self._taxonomies[tax_name]
-            )
+    def get_taxonomy_index(self, tax_name: str) -> TaxonomyIndex:
+        if tax_name not in self._taxonomy_indexes:
+            self._taxonomy_indexes[tax_name] = TaxonomyIndex(self._taxonomies[tax_name])
 
-        node_paths = self._node_path_cache[tax_name]
+        return self._taxonomy_indexes[tax_name]
 
-        if node_a not in node_paths:
-            raise KeyError(f"node {node_a} not in node paths of taxonomy {tax_name}")
+    def calculate_pairwise_similarities(
+        self, tax_name: str, nodes: Sequence[str]
+    ) -> "np.ndarray":
+        """Calculate the Wu-Palmer similarities of all pairs of the given nodes in one batch.
 
-        if node_b not in node_paths:
-            raise KeyError(f"node {node_b} not in node paths of taxonomy {tax_name}")
+        Returns:
+            np.ndarray: a symmetric matrix with the similarity of ``nodes[i]`` and ``nodes[j]`` at ``[i, j]``
+        """
+        import numpy as np
 
-        ancestors_a = node_paths[node_a]
-        ancestors_b = node_paths[node_b]
+        taxonomy_index = self.get_taxonomy_index(tax_name)
+        indices = taxonomy_index.get_indices(nodes)
 
-        common_ancestor_depth = 0
-        common_ancestor_depth -= self._root_node_depth
+        rows, columns = np.triu_indices(len(indices))
+        similarities = np.empty((len(indices), len(indices)))
+        similarities[rows, columns] = taxonomy_index.wu_palmer_similarities(
+            indices[rows], indices[columns], self._root_node_depth
+        )
+        similarities[columns, rows] = similarities[rows, columns]
 
-        for a, b in zip(ancestors_a, ancestors_b):
-            if a != b:
-                break
+        return similarities
 
-            common_ancestor_depth += 1
 
-        denominator = len(ancestors_a) + len(ancestors_b) - (2 * self._root_node_depth)
+def get_distinct_values(entities: List[Dict[str, Any]], attribute: str) -> List[Any]:
+    """Collect the distinct values of an attribute in the order of their first occurrence."""
+    values: Dict[Any, None] = {}
 
-        if denominator == 0:
-            return 1
-        else:
-            wu_palmer_similarity = (2 * common_ancestor_depth) / denominator
+    for entity in entities:
+        if attribute not in entity:
+            continue
 
-            return wu_palmer_similarity
+        entity_values = entity[attribute]
 
+        if not isinstance(entity_values, list):
+            entity_values = [entity_values]
 
-def add_similarities_for_entities(
-    similarities: Dict[Tuple[any, any], Dict],
-    entity1: Dict[str, any],
-    entity2: Dict[str, any],
-    attribute: str,
-    entities_metadata: Dict,
-    wu_palmer_cache: WuPalmerCache,
-):
-    if attribute not in entity1 or attribute not in entity2:
-        return
+        for value in entity_values:
+            values.setdefault(value, None)
 
-    values1 = entity1[attribute]
-    values2 = entity2[attribute]
+    return list(values.keys())
 
-    # extract taxonomy name from refTarget
-    file_name: str = entities_metadata[attribute]["refTarget"].split(":")[1]
-    tax_name: str = PurePath(file_name).stem
 
-    if not isinstance(values1, list):
-        values1 = [values1]
+def calculate_similarities(
+    values: List[Any], tax_name: str, wu_palmer_cache: WuPalmerCache
+) -> List[Dict[str, Any]]:
+    """Calculate the similarities of all pairs of the distinct values of an attribute."""
+    nodes = [value for value in values if value is not None]
+    node_similarities = wu_palmer_cache.calculate_pairwise_similarities(tax_name, nodes)
+    node_positions = {node: i for i, node in enumerate(nodes)}
 
-    if not isinstance(values2, list):
-        values2 = [values2]
+    similarities = []
 
-    for val1 in values1:
-        for val2 in values2:
-            if val1 is None or val2 is None:
+    for i, val1 in enumerate(values):
+        row = None if val1 is None else node_similarities[node_positions[val1]].tolist()
+
+        for val2 in values[i:]:
+            if row is None or val2 is None:
                 sim = None
             else:
-                # sorting the values reduces cache misses and is possible because Wu-Palmer is commutative
-                sorted_val1, sorted_val2 = sorted((val1, val2))
-                sim = wu_palmer_cache.calculate_similarity(
-                    tax_name, sorted_val1, sorted_val2
-                )
+                sim = row[node_positions[val2]]
+
+            similarities.append({"source": val1, "target": val2, "similarity": sim})
 
-            similarities[(val1, val2)] = {
-                "source": val1,
-                "target": val2,
-                "similarity": sim,
-            }
+    return similarities
 
 
 def load_input_parameters(
@@ -496,36 +580,25 @@ def calculation_task(self, db_id: int) -> str:
 
     wu_palmer_cache = WuPalmerCache(taxonomies, root_has_meaning_in_taxonomy)
 
-    tmp_zip_file = SpooledTemporaryFile(mode="wb")
-    zip_file = ZipFile(tmp_zip_file, "w")
-
-    for attribute in attributes:
-        similarities = {}
-
-        for i in range(len(entities)):
-            for j in range(i, len(entities)):
-                add_similarities_for_entities(
-                    similarities,
-                    entities[i],
-                    entities[j],
-                    attribute,
-                    entities_metadata,
-                    wu_palmer_cache,
-                )
-
-        with StringIO() as file:
-            save_entities(similarities.values(), file, "application/json")
-            file.seek(0)
-            zip_file.writestr(attribute + ".json", file.read())
-
-    zip_file.close()
-
-    STORE.persist_task_result(
+    with STORE.open_task_result_writer(
         db_id,
-        tmp_zip_file,
         "wu_palmer.zip",
         "custom/element-similarities",
         "application/zip",
-    )
+        mode="b",
+    ) as output:
+        with ZipFile(output, "w") as zip_file:
+            for attribute in attributes:
+                # extract taxonomy name from refTarget
+                file_name: str = entities_metadata[attribute]["refTarget"].split(":")[1]
+                tax_name: str = PurePath(file_name).stem
+
+                # the similarities only depend on the (few) distinct values, not on the entities
+                values = get_distinct_values(entities, attribute)
+                similarities = calculate_similarities(values, tax_name, wu_palmer_cache)
+
+                zipped_file = zip_file.open(attribute + ".json", "w", force_zip64=True)
+                with TextIOWrapper(zipped_file, encoding="utf-8") as text_file:
+                    save_entities(similarities, text_file, "application/json")
 
     return "Result stored in file"
@@ -13,7 +13,6 @@
 # limitations under the License.
 from http import HTTPStatus
 from json import dumps, loads
-from tempfile import SpooledTemporaryFile
 from typing import Mapping, Optional
 from zipfile import ZipFile
 
@@ -43,7 +42,10 @@ from qhana_plugin_runner.api.util import (
 )
 from qhana_plugin_runner.celery import CELERY
 from qhana_plugin_runner.db.models.tasks import ProcessingTask
-from qhana_plugin_runner.plugin_utils.zip_utils import get_files_from_zip_url
+from qhana_plugin_runner.plugin_utils.zip_utils import (
+    copy_zip_members,
+    open_zip_url,
+)
 from qhana_plugin_runner.storage import STORE
 from qhana_plugin_runner.tasks import save_task_error, save_task_result
 from qhana_plugin_runner.util.plugins import QHAnaPluginBase, plugin_identifier
@@ -241,25 +243,13 @@ def calculation_task(self, db_id: int) -> str:
     zip2_url: Optional[str] = loads(task_data.parameters or "{}").get("zip2_url", None)
     TASK_LOGGER.info(f"Loaded input parameters from db: zip2_url='{zip2_url}'")
 
-    tmp_zip_file = SpooledTemporaryFile(mode="wb")
-    merged_zip_file = ZipFile(tmp_zip_file, "w")
-
-    # load data from the files
-
-    for file, file_name in get_files_from_zip_url(zip1_url):
-        merged_zip_file.writestr(file_name, file.read())
-
-    for file, file_name in get_files_from_zip_url(zip2_url):
-        merged_zip_file.writestr(file_name, file.read())
-
-    merged_zip_file.close()
-
-    STORE.persist_task_result(
-        db_id,
-        tmp_zip_file,
-        "merged.zip",
-        "*",
-        "application/zip",
-    )
+    # copy the compressed members without decompressing them
+    with STORE.open_task_result_writer(
+        db_id, "merged.zip", "*", "application/zip", mode="b"
+    ) as output:
+        with ZipFile(output, "w") as merged_zip_file:
+            for zip_url in (zip1_url, zip2_url):
+                with open_zip_url(zip_url) as zip_file:
+                    copy_zip_members(zip_file, merged_zip_file)
 
     return "Result stored in file"
@@ -103,6 +103,9 @@ def create_app(test_config: Optional[Dict[str, Any]] = None):
             celery_conf["result_backend"] = environ["RESULT_BACKEND"]
             config["CELERY"] = celery_conf
 
+        if "TASK_EVENTS_URL" in environ:
+            config["TASK_EVENTS_URL"] = environ["TASK_EVENTS_URL"]
+
         if "CELERY_QUEUE" in environ:
             celery_conf = config.get("CELERY", {})
             celery_conf["task_default_queue"] = environ["CELERY_QUEUE"]
@@ -125,6 +128,31 @@ def create_app(test_config: Optional[Dict[str, Any]] = None):
         if "URL_MAP" in os.environ:
             config["URL_REWRITE_RULES"] = loads(os.environ["URL_MAP"])
 
+        for key in (
+            "REQUEST_POOL_CONNECTIONS",
+            "REQUEST_POOL_MAXSIZE",
+            "REQUEST_CONNECT_TIMEOUT",
+            "REQUEST_READ_TIMEOUT",
+            "REQUEST_RETRIES",
+        ):
+            if key in os.environ:
+                config[key] = int(os.environ[key])
+
+        for key in (
+            "TASK_RESULT_CACHE_TTL",
+            "TASK_CLEANUP_INTERVAL",
+            "TASK_CLEANUP_MAX_AGE",
+            "TASK_CLEANUP_TEMP_FILE_MAX_AGE",
+        ):
+            if key in os.environ:
+                config[key] = int(os.environ[key])
+
+        if "URL_CACHE_PATH" in os.environ:
+            config["URL_CACHE_PATH"] = os.environ["URL_CACHE_PATH"]
+
+        if "URL_CACHE_MAX_SIZE" in os.environ:
+            config["URL_CACHE_MAX_SIZE"] = int(os.environ["URL_CACHE_MAX_SIZE"])
+
         if "DEFAULT_FILE_STORE" in os.environ:
             config["DEFAULT_FILE_STORE"] = os.environ["DEFAULT_FILE_STORE"]
 
@@ -205,7 +233,8 @@ def create_app(test_config: Optional[Dict[str, Any]] = None):
     register_helpers(app)
     register_markdown_filter(app)
 
-    # register request helpers with request session
+    # configure connection pooling and retries and register request helpers with request session
+    requests.configure_request_session(requests.REQUEST_SESSION, app.config)
     register_additional_schemas(requests.REQUEST_SESSION)
     # register the plugin registry client
     register_plugin_registry_client(app)
@@ -17,7 +17,7 @@
 from http import HTTPStatus
 
 import marshmallow as ma
-from flask.globals import current_app
+from flask.globals import current_app, request
 from flask.helpers import send_file
 from flask.views import MethodView
 from flask_smorest import abort
@@ -25,6 +25,8 @@ from flask_smorest import abort
 from qhana_plugin_runner.api.util import MaBaseSchema
 from qhana_plugin_runner.api.util import SecurityBlueprint as SmorestBlueprint
 from qhana_plugin_runner.db.models.tasks import TaskFile
+from qhana_plugin_runner.storage import STORE, LocalFileStore
+from qhana_plugin_runner.util.compression import open_decompressed
 
 FILES_API = SmorestBlueprint(
     "files-api",
@@ -43,6 +45,15 @@ class FileSecurityTagSchema(MaBaseSchema):
     )
 
 
+def _is_local_file(task_file: TaskFile) -> bool:
+    """Check if the task file is stored by a file store using the local file system."""
+    try:
+        store = STORE[task_file.storage_provider]
+    except KeyError:
+        return False
+    return isinstance(store, LocalFileStore)
+
+
 @FILES_API.route("/<int:file_id>/")
 class FileView(MethodView):
     """Download task result file stored in the local file-system store."""
@@ -51,13 +62,31 @@ class FileView(MethodView):
     @FILES_API.response(
         HTTPStatus.OK,
     )
+    @FILES_API.alt_response(
+        HTTPStatus.PARTIAL_CONTENT,
+        description="The requested byte range of the file (for requests with a Range header).",
+        success=True,
+    )
+    @FILES_API.alt_response(
+        HTTPStatus.NOT_MODIFIED,
+        description="The file matches the ETag in the If-None-Match header.",
+        success=True,
+    )
     def get(self, query_data, file_id: int):
-        """Get the task file information by file id."""
+        """Get the task file information by file id.
+
+        Supports conditional requests (``If-None-Match``) and ``Range`` requests.
+        The ETag of a file is the sha256 hash of its content (if known).
+
+        Compressed files are sent with a ``Content-Encoding`` header if the
+        client accepts the encoding and are decompressed on the fly otherwise
+        (without support for ``Range`` requests).
+        """
         security_tag = query_data["file_id"]  # prevent simple file id enumeration attacs
         task_file: TaskFile = TaskFile.get_by_id(file_id)
         if (
             not task_file
-            or task_file.storage_provider != "local_filesystem"
+            or not _is_local_file(task_file)
             or task_file.security_tag != security_tag
         ):
             abort(HTTPStatus.NOT_FOUND, message="File not found.")
@@ -65,8 +94,45 @@ class FileView(MethodView):
             current_app.logger.warning(
                 f"The temporary file {task_file.file_name} was exposed as a task result."
             )
-        return send_file(
-            task_file.file_storage_data,
-            mimetype=task_file.mimetype,
-            download_name=task_file.file_name,
-        )
+        is_immutable = task_file.content_hash and task_file.file_type != "temp-file"
+        max_age = current_app.config.get("TASK_FILE_MAX_AGE") if is_immutable else None
+        # fall back to the default ETag (based on mtime and size) for files without hash
+        etag = task_file.content_hash if task_file.content_hash else True
+        content_encoding = task_file.content_encoding
+
+        if content_encoding and not request.accept_encodings[content_encoding]:
+            # client does not support the encoding, decompress the file on the fly
+            response = send_file(
+                open_decompressed(task_file.file_storage_data, content_encoding),
+                mimetype=task_file.mimetype,
+                download_name=task_file.file_name,
+                conditional=True,  # handles If-None-Match headers
+                etag=etag,
+                max_age=max_age,
+            )
+            if task_file.file_size is not None and response.status_code == HTTPStatus.OK:
+                response.content_length = task_file.file_size
+        else:
+            if content_encoding:
+                # the encoded representation needs a different strong ETag
+                etag = f"{task_file.content_hash}-{content_encoding}"
+            response = send_file(
+                task_file.file_storage_data,
+                mimetype=task_file.mimetype,
+                download_name=task_file.file_name,
+                conditional=True,  # handles If-None-Match and Range headers
+                etag=etag,
+                max_age=max_age,
+            )
+            if content_encoding:
+                response.content_encoding = content_encoding
+            # advertise range support also in full responses (e.g. for the zip utils)
+            response.accept_ranges = "bytes"
+        if content_encoding:
+            response.vary.add("Accept-Encoding")
+        # the URL contains the secret security tag, shared caches must not store the file
+        response.cache_control.public = False
+        response.cache_control.private = True
+        if is_immutable:
+            response.cache_control.immutable = True
+        return response
@@ -16,11 +16,16 @@
 
 from dataclasses import dataclass, field
 from http import HTTPStatus
-from typing import Any, Dict, List, Optional, Sequence
+from time import monotonic, sleep
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
 import marshmallow as ma
+from flask import Response, json, stream_with_context
+from flask.globals import current_app, request
 from flask.views import MethodView
 from flask_smorest import abort
+from redis import RedisError
+from werkzeug.http import quote_etag
 
 from qhana_plugin_runner.api.plugin_schemas import (
     ProgressMetadata,
@@ -30,8 +35,14 @@ from qhana_plugin_runner.api.plugin_schemas import (
 )
 from qhana_plugin_runner.api.util import MaBaseSchema
 from qhana_plugin_runner.api.util import SecurityBlueprint as SmorestBlueprint
+from qhana_plugin_runner.db.db import DB
 from qhana_plugin_runner.db.models.tasks import ProcessingTask, Step, TaskFile
 from qhana_plugin_runner.storage import STORE
+from qhana_plugin_runner.task_events import (
+    TASK_STATUS_EVENT,
+    TaskEventSubscription,
+    get_task_event_broker,
+)
 
 TASKS_API = SmorestBlueprint(
     "tasks-api",
@@ -85,14 +96,45 @@ class OutputDataMetadataSchema(MaBaseSchema):
 class TaskData:
     status: str
     log: Optional[str] = None
+    log_cursor: Optional[int] = None
     progress: Optional[ProgressMetadata] = None
     steps: Sequence[StepMetadata] = field(default_factory=list)
     outputs: Sequence[OutputDataMetadata] = field(default_factory=list)
 
 
+class TaskEventsQuerySchema(MaBaseSchema):
+    log_after = ma.fields.Integer(
+        required=False,
+        allow_none=True,
+        data_key="log-after",
+        metadata={
+            "description": "Only return log entries added after the entry with this cursor (the logCursor of a previous response)."
+        },
+    )
+
+
+class TaskStatusQuerySchema(TaskEventsQuerySchema):
+    wait = ma.fields.Float(
+        required=False,
+        allow_none=True,
+        validate=ma.validate.Range(min=0),
+        metadata={
+            "description": "Wait up to this many seconds for a change of the task if the task still matches the ETag in the If-None-Match header."
+        },
+    )
+
+
 class TaskStatusSchema(MaBaseSchema):
     status = ma.fields.String(required=True, allow_none=False, dump_only=True)
     log = ma.fields.String(required=False, allow_none=True, dump_only=True)
+    log_cursor = ma.fields.Integer(
+        required=False,
+        allow_none=True,
+        dump_only=True,
+        metadata={
+            "description": "The cursor of the last log entry. Use it as log-after query parameter to only get new log entries."
+        },
+    )
     progress = ma.fields.Nested(
         ProgressMetadataSchema, required=False, allow_none=True, dump_only=True
     )
@@ -115,6 +157,8 @@ class TaskStatusSchema(MaBaseSchema):
         if data["log"] == None:
             del data["log"]
             del data["outputs"]
+        if data["logCursor"] == None:
+            del data["logCursor"]
         if data["steps"] == None:
             del data["steps"]
         if data["progress"] == None:
@@ -122,70 +166,253 @@ class TaskStatusSchema(MaBaseSchema):
         return data
 
 
-@TASKS_API.route("/<int:task_id>/")
-class TaskView(MethodView):
-    """Task status resource."""
+def _get_task_etag(task_id: int, version: int, log_after: Optional[int]) -> str:
+    if log_after is None:
+        return f"{task_id}-{version}"
+    return f"{task_id}-{version}-{log_after}"
 
-    @TASKS_API.response(HTTPStatus.OK, TaskStatusSchema())
-    def get(self, task_id: int):
-        """Get the current task status."""
-        task_data: Optional[ProcessingTask] = ProcessingTask.get_by_id(id_=task_id)
-        if task_data is None:
-            abort(HTTPStatus.NOT_FOUND, message="Task not found.")
-            return  # return for type checker, abort raises exception
 
-        progress = None
-        if task_data.progress_value:
-            progress = {
-                "value": task_data.progress_value,
-                "start": task_data.progress_start,
-                "target": task_data.progress_target,
-                "unit": task_data.progress_unit,
-            }
-
-        steps: Optional[List[StepMetadata]] = None
-        if len(task_data.steps) > 0:
-            steps = []
-            step: Step
-            for step in task_data.steps:
-                steps.append(
-                    StepMetadata(
-                        href=step.href,
-                        uiHref=step.ui_href,
-                        stepId=step.step_id,
-                        cleared=step.cleared,
-                    )
-                )
+def _wait_for_task_change(
+    task_id: int, version: int, log_after: Optional[int], wait: float
+) -> Optional[int]:
+    """Wait until the task no longer matches the If-None-Match header or the wait time is over.
 
-        if not task_data.is_finished:
-            return TaskData(
-                progress=progress,
-                steps=steps,
-                status=task_data.status,
-                log=task_data.task_log,
-            )
+    Returns:
+        Optional[int]: the current version of the task (None if the task was deleted)
+    """
+    max_wait = current_app.config.get("TASK_STATUS_MAX_WAIT", 30)
+    poll_interval = current_app.config.get("TASK_STATUS_POLL_INTERVAL", 0.5)
+    deadline = monotonic() + min(wait, max_wait)
+    current_version: Optional[int] = version
+    while current_version is not None and request.if_none_match.contains_weak(
+        _get_task_etag(task_id, current_version, log_after)
+    ):
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            break
+        # end the current transaction to see changes committed by other transactions
+        DB.session.rollback()
+        sleep(min(poll_interval, remaining))
+        current_version = ProcessingTask.get_version(task_id)
+    return current_version
 
-        outputs: List[OutputDataMetadata] = []
-
-        for file_ in TaskFile.get_task_result_files(task_data):
-            if file_.file_type is None or file_.mimetype is None:
-                continue  # result files must have file and mime type set
-            href = STORE[file_.storage_provider].get_task_file_url(file_)
-            outputs.append(
-                OutputDataMetadata(
-                    data_type=file_.file_type,
-                    content_type=file_.mimetype,
-                    href=href,
-                    name=file_.file_name,
+
+def _get_task_status(task_data: ProcessingTask, log_after: Optional[int]) -> TaskData:
+    """Collect the status of the task (only log entries after the cursor are included)."""
+    log_entries = task_data.get_task_log_entries(after=log_after)
+    log = "\n".join(entry.text for entry in log_entries)
+    log_cursor = log_entries[-1].id if log_entries else log_after
+
+    progress = None
+    if task_data.progress_value:
+        progress = {
+            "value": task_data.progress_value,
+            "start": task_data.progress_start,
+            "target": task_data.progress_target,
+            "unit": task_data.progress_unit,
+        }
+
+    steps: Optional[List[StepMetadata]] = None
+    if len(task_data.steps) > 0:
+        steps = []
+        step: Step
+        for step in task_data.steps:
+            steps.append(
+                StepMetadata(
+                    href=step.href,
+                    uiHref=step.ui_href,
+                    stepId=step.step_id,
+                    cleared=step.cleared,
                 )
             )
 
+    if not task_data.is_finished:
         return TaskData(
             progress=progress,
             steps=steps,
             status=task_data.status,
-            log=task_data.task_log,
-            outputs=outputs,
+            log=log,
+            log_cursor=log_cursor,
         )
 
+    outputs: List[OutputDataMetadata] = []
+
+    file_: TaskFile
+    for file_ in task_data.outputs:
+        if file_.file_type == "temp-file":
+            continue  # only result files are outputs
+        if file_.file_type is None or file_.mimetype is None:
+            continue  # result files must have file and mime type set
+        href = STORE[file_.storage_provider].get_task_file_url(file_)
+        outputs.append(
+            OutputDataMetadata(
+                data_type=file_.file_type,
+                content_type=file_.mimetype,
+                href=href,
+                name=file_.file_name,
+            )
+        )
+
+    return TaskData(
+        progress=progress,
+        steps=steps,
+        status=task_data.status,
+        log=log,
+        log_cursor=log_cursor,
+        outputs=outputs,
+    )
+
+
+@TASKS_API.route("/<int:task_id>/")
+class TaskView(MethodView):
+    """Task status resource."""
+
+    @TASKS_API.arguments(TaskStatusQuerySchema, location="query", as_kwargs=True)
+    @TASKS_API.response(HTTPStatus.OK, TaskStatusSchema())
+    @TASKS_API.alt_response(
+        HTTPStatus.NOT_MODIFIED,
+        description="The task has not changed since the response with the ETag in the If-None-Match header.",
+        success=True,
+    )
+    def get(
+        self,
+        task_id: int,
+        log_after: Optional[int] = None,
+        wait: Optional[float] = None,
+    ):
+        """Get the current task status.
+
+        Use the ``log-after`` query parameter with the ``logCursor`` of a
+        previous response to only get the log entries added since then.
+
+        The ETag of the response changes with every change of the task.
+        Conditional requests (``If-None-Match``) are answered with 304 if the
+        task has not changed. Set ``wait`` to wait for a change (long polling)
+        instead of answering with 304 immediately.
+        """
+        # only the version is queried to answer conditional requests
+        version = ProcessingTask.get_version(task_id)
+        if version is not None and wait:
+            version = _wait_for_task_change(task_id, version, log_after, wait)
+        if version is None:
+            abort(HTTPStatus.NOT_FOUND, message="Task not found.")
+            return  # return for type checker, abort raises exception
+
+        etag = _get_task_etag(task_id, version, log_after)
+        headers = {"ETag": quote_etag(etag), "Cache-Control": "no-cache"}
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+        task_data: Optional[ProcessingTask] = ProcessingTask.get_by_id_with_relations(
+            id_=task_id
+        )
+        if task_data is None:
+            abort(HTTPStatus.NOT_FOUND, message="Task not found.")
+            return  # return for type checker, abort raises exception
+        if task_data.version != version:
+            # the task changed in the meantime, the ETag must match the response
+            headers["ETag"] = quote_etag(
+                _get_task_etag(task_id, task_data.version, log_after)
+            )
+
+        return _get_task_status(task_data, log_after), HTTPStatus.OK, headers
+
     # TODO add delete endpoint (and maybe serve result from different endpoint)
+
+
+def _format_event(event: str, data: str, id_: Optional[int]) -> str:
+    """Format a server-sent event."""
+    lines = [f"event: {event}"]
+    if id_ is not None:
+        lines.append(f"id: {id_}")
+    lines.extend(f"data: {line}" for line in data.splitlines())
+    return "\n".join(lines) + "\n\n"
+
+
+def _stream_task_events(
+    task_id: int, subscription: TaskEventSubscription, log_after: Optional[int]
+) -> Iterator[str]:
+    """Send the task status whenever the task changes until the task is finished."""
+    keep_alive = current_app.config.get("TASK_EVENTS_KEEP_ALIVE", 15)
+    max_duration = current_app.config.get("TASK_EVENTS_MAX_DURATION", 60 * 60)
+    deadline = monotonic() + max_duration
+    schema = TaskStatusSchema()
+    event: Optional[str] = TASK_STATUS_EVENT
+    sent_version: Optional[int] = None
+    while True:
+        if event is None and ProcessingTask.get_version(task_id) != sent_version:
+            # changes without a notification (e.g. progress updates) are found here
+            event = TASK_STATUS_EVENT
+        if event is None:
+            yield ": keep-alive\n\n"
+        else:
+            task_data = ProcessingTask.get_by_id_with_relations(id_=task_id)
+            if task_data is None:
+                return  # the task was deleted
+            # read before yielding, the task may change until the generator resumes
+            is_finished = task_data.is_finished
+            if task_data.version != sent_version:
+                # multiple notifications may be answered by a single event
+                sent_version = task_data.version
+                task_status = _get_task_status(task_data, log_after)
+                log_after = task_status.log_cursor
+                data = json.dumps(schema.dump(task_status))
+                yield _format_event(event, data, log_after)
+            if is_finished:
+                return
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return  # clients reconnect with the id of the last event
+        event = subscription.get(timeout=min(keep_alive, remaining))
+        # end the current transaction to see changes committed by other transactions
+        DB.session.rollback()
+
+
+@TASKS_API.route("/<int:task_id>/events/")
+class TaskEventsView(MethodView):
+    """Task status event stream."""
+
+    @TASKS_API.arguments(TaskEventsQuerySchema, location="query", as_kwargs=True)
+    @TASKS_API.response(
+        HTTPStatus.OK,
+        content_type="text/event-stream",
+        description="Server-sent events containing the task status (see the task status resource).",
+    )
+    def get(self, task_id: int, log_after: Optional[int] = None):
+        """Get the task status as a stream of server-sent events.
+
+        The first event (``status``) contains the current task status. Further
+        events are sent when the status, progress, steps or outputs of the task
+        change (``status``, ``step`` and ``finished`` events). Changes without a
+        notification (e.g. progress updates of plugins) are sent with the next
+        keep-alive interval. The stream ends after the task finished.
+
+        Each event only contains the log entries added since the last event.
+        The id of an event is the ``logCursor`` of the task status, reconnecting
+        clients continue the log after the ``Last-Event-ID``.
+        """
+        if ProcessingTask.get_version(task_id) is None:
+            abort(HTTPStatus.NOT_FOUND, message="Task not found.")
+            return  # return for type checker, abort raises exception
+
+        last_event_id = request.headers.get("Last-Event-ID", "")
+        if log_after is None and last_event_id.isdigit():
+            log_after = int(last_event_id)
+
+        try:
+            # subscribe before the first event to not miss any change
+            subscription = get_task_event_broker(current_app).subscribe(task_id)
+        except RedisError:
+            abort(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                message="Task events are not available, poll the task status instead.",
+            )
+            return  # return for type checker, abort raises exception
+
+        response = Response(
+            stream_with_context(_stream_task_events(task_id, subscription, log_after)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        response.call_on_close(subscription.close)
+        return response
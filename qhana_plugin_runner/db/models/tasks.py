@@ -16,7 +16,7 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from typing import List, Optional, Sequence, Union
 
-from sqlalchemy.orm import relation, relationship
+from sqlalchemy.orm import joinedload, relation, relationship
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.ext.orderinglist import OrderingList, ordering_list
 from sqlalchemy.sql import sqltypes as sql
@@ -80,7 +80,9 @@ class ProcessingTask:
         progress_target (float): progress target value.
         progress_unit (str): progress unit (default: "%").
         task_status (Optional[str], optional): the status string of the plugin execution, can only be ``PENDING``, ``SUCCESS``, or ``ERROR``.
-        task_log (str): the task log, task metadata or the error of the finished task. All data results should be file outputs of the task!
+        version (int): counter that is increased with every change of the task, its steps, log entries or output files (e.g. to use as ETag).
+        result_cache_key (Optional[str], optional): the key of the task result in the result cache (only set for plugins using the result cache, see :py:mod:`~qhana_plugin_runner.result_cache`).
+        task_log (str): the task log, task metadata or the error of the finished task (read only, see :meth:`add_task_log_entry` and :meth:`get_task_log_entries`). All data results should be file outputs of the task!
         outputs (List[TaskFile], optional): the output data (files) of the task
     """
 
@@ -131,7 +133,14 @@ class ProcessingTask:
         default=None, metadata={"sa": Column(sql.String(100))}
     )
 
-    task_log: str = field(default="", metadata={"sa": Column(sql.Text(), nullable=False)})
+    version: int = field(
+        default=0,
+        metadata={"sa": Column(sql.Integer(), nullable=False, server_default="0")},
+    )
+
+    result_cache_key: Optional[str] = field(
+        default=None, metadata={"sa": Column(sql.String(64), nullable=True)}
+    )
 
     outputs: List["TaskFile"] = field(
         default_factory=list,
@@ -211,18 +220,35 @@ class ProcessingTask:
         if commit:
             DB.session.commit()
 
+    @property
+    def task_log(self) -> str:
+        """The complete task log (all log entries separated by new lines)."""
+        return "\n".join(entry.text for entry in self.get_task_log_entries())
+
+    def get_task_log_entries(
+        self, after: Optional[int] = None
+    ) -> Sequence["TaskLogEntry"]:
+        """Get the log entries of this task in the order they were added.
+
+        Args:
+            after (Optional[int], optional): only return entries with an id greater than this cursor. Defaults to None.
+        """
+        if self.id is None:
+            return []
+        return TaskLogEntry.get_task_log_entries(self.id, after=after)
+
     def add_task_log_entry(self, task_log: str, commit: bool = False):
-        """Appends ``task_log`` separated by a new line.
+        """Appends ``task_log`` as a new log entry.
+
+        Log entries are stored as separate rows, existing entries are never rewritten.
 
         Args:
             task_log (str): new entry to be added
         """
-        if self.task_log:
-            self.task_log += "\n" + task_log
-        else:
-            self.task_log = task_log
-
         DB.session.add(self)
+        if self.id is None:
+            DB.session.flush()  # generate the task id for the log entry
+        DB.session.add(TaskLogEntry(task_id=self.id, text=task_log))
         if commit:
             DB.session.commit()
 
@@ -237,6 +263,85 @@ class ProcessingTask:
         """Get the object instance by the object id from the database. (None if not found)"""
         return DB.session.execute(select(cls).filter_by(id=id_)).scalar_one_or_none()
 
+    @classmethod
+    def get_by_id_with_relations(cls, id_: int) -> Optional["ProcessingTask"]:
+        """Get the object instance by the object id with its steps and outputs loaded in the same query. (None if not found)"""
+        query = (
+            select(cls)
+            .filter_by(id=id_)
+            .options(joinedload(cls.steps), joinedload(cls.outputs))
+        )
+        return DB.session.execute(query).unique().scalar_one_or_none()
+
+    @classmethod
+    def get_version(cls, id_: int) -> Optional[int]:
+        """Get only the current version of the task from the database. (None if not found)"""
+        return DB.session.execute(
+            select(cls.version).filter_by(id=id_)
+        ).scalar_one_or_none()
+
+
+@listens_for(ProcessingTask, "before_update")
+def _increase_task_version(mapper, connection, target: ProcessingTask):
+    # increase the version in the database as the loaded version may be stale
+    target.version = ProcessingTask.__table__.c.version + 1  # type: ignore
+
+
+def _increase_task_version_by_id(connection, task_id: Optional[int]):
+    """Increase the version of a task that was changed without updating the task row."""
+    if task_id is None:
+        return
+    table = ProcessingTask.__table__
+    connection.execute(
+        table.update().where(table.c.id == task_id).values(version=table.c.version + 1)
+    )
+
+
+@REGISTRY.mapped
+@dataclass
+class TaskLogEntry:
+    """A single entry of the log of a :class:`ProcessingTask`.
+
+    Attributes:
+        id (int, optional): automatically generated database id. The ids of the entries of a task are increasing, use the id of the last known entry as a cursor to get newer entries.
+        task_id (int): the id of the :class:`ProcessingTask` the entry belongs to
+        text (str): the log entry
+        created_at (datetime, optional): the moment the entry was added. (default :py:func:`~datetime.datetime.utcnow`)
+    """
+
+    __tablename__ = "TaskLogEntry"
+
+    __sa_dataclass_metadata_key__ = "sa"
+
+    id: int = field(init=False, metadata={"sa": Column(sql.INTEGER(), primary_key=True)})
+    task_id: int = field(
+        metadata={
+            "sa": Column(
+                sql.INTEGER(), ForeignKey(ProcessingTask.id), index=True, nullable=False
+            )
+        }
+    )
+    text: str = field(metadata={"sa": Column(sql.Text(), nullable=False)})
+    created_at: datetime = field(
+        default_factory=datetime.utcnow,
+        metadata={"sa": Column(sql.TIMESTAMP(timezone=True))},
+    )
+
+    @classmethod
+    def get_task_log_entries(
+        cls, task_id: int, after: Optional[int] = None
+    ) -> Sequence["TaskLogEntry"]:
+        """Get the log entries of a task ordered by their id.
+
+        Args:
+            task_id (int): the id of the task
+            after (Optional[int], optional): only return entries with an id greater than this cursor. Defaults to None.
+        """
+        query = select(cls).filter(cls.task_id == task_id)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return DB.session.execute(query.order_by(cls.id)).scalars().all()
+
 
 @REGISTRY.mapped
 @dataclass
@@ -268,6 +373,15 @@ class TaskFile:
     created_at: datetime = field(
         default=datetime.utcnow(), metadata={"sa": Column(sql.TIMESTAMP(timezone=True))}
     )
+    file_size: Optional[int] = field(
+        default=None, metadata={"sa": Column(sql.BigInteger(), nullable=True)}
+    )
+    content_hash: Optional[str] = field(
+        default=None, metadata={"sa": Column(sql.String(64), index=True, nullable=True)}
+    )
+    content_encoding: Optional[str] = field(
+        default=None, metadata={"sa": Column(sql.String(32), nullable=True)}
+    )
     task_id: Optional[int] = field(
         default=None,
         init=False,
@@ -298,3 +412,77 @@ class TaskFile:
             cls.task == task if isinstance(task, ProcessingTask) else cls.task_id == task,
         )
         return DB.session.execute(select(cls).filter(*filter_)).scalars().all()
+
+
+@REGISTRY.mapped
+@dataclass
+class TaskResultCacheEntry:
+    """An entry of the result cache pointing to the task that computed the result.
+
+    Attributes:
+        id (int, optional): automatically generated database id.
+        cache_key (str): the key of the result (see :py:func:`~qhana_plugin_runner.result_cache.get_result_cache_key`)
+        task_id (int): the id of the finished :class:`ProcessingTask` with the result files
+        size (int): the total size of the result files in bytes
+        created_at (datetime, optional): the moment the result was added to the cache. (default :py:func:`~datetime.datetime.utcnow`)
+        last_used_at (datetime, optional): the moment the result was last reused. (default :py:func:`~datetime.datetime.utcnow`)
+    """
+
+    __tablename__ = "TaskResultCacheEntry"
+
+    __sa_dataclass_metadata_key__ = "sa"
+
+    id: int = field(init=False, metadata={"sa": Column(sql.INTEGER(), primary_key=True)})
+    cache_key: str = field(
+        metadata={"sa": Column(sql.String(64), index=True, nullable=False)}
+    )
+    task_id: int = field(
+        metadata={
+            "sa": Column(
+                sql.INTEGER(), ForeignKey(ProcessingTask.id), index=True, nullable=False
+            )
+        }
+    )
+    size: int = field(
+        default=0, metadata={"sa": Column(sql.BigInteger(), nullable=False)}
+    )
+    created_at: datetime = field(
+        default_factory=datetime.utcnow,
+        metadata={"sa": Column(sql.TIMESTAMP(timezone=True), index=True)},
+    )
+    last_used_at: datetime = field(
+        default_factory=datetime.utcnow,
+        metadata={"sa": Column(sql.TIMESTAMP(timezone=True))},
+    )
+
+    def save(self, commit: bool = False):
+        """Add this object to the current session and optionally commit the session to persist all objects in the session."""
+        DB.session.add(self)
+        if commit:
+            DB.session.commit()
+
+    @classmethod
+    def get_latest(
+        cls, cache_key: str, created_after: datetime
+    ) -> Optional["TaskResultCacheEntry"]:
+        """Get the most recent entry with the cache key that was created after the given moment. (None if not found)"""
+        query = (
+            select(cls)
+            .filter(cls.cache_key == cache_key, cls.created_at > created_after)
+            .order_by(cls.created_at.desc(), cls.id.desc())
+            .limit(1)
+        )
+        return DB.session.execute(query).scalar_one_or_none()
+
+
+@listens_for(Step, "after_insert")
+@listens_for(Step, "after_update")
+@listens_for(TaskLogEntry, "after_insert")
+@listens_for(TaskFile, "after_insert")
+@listens_for(TaskFile, "after_update")
+@listens_for(TaskFile, "after_delete")
+def _increase_related_task_version(
+    mapper, connection, target: Union[Step, TaskLogEntry, TaskFile]
+):
+    task_id = target.id if isinstance(target, Step) else target.task_id
+    _increase_task_version_by_id(connection, task_id)
@@ -0,0 +1,345 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing a binary columnar file format for entities.
+
+The format stores every attribute of the entities as one typed column.
+Numeric columns are stored as raw little-endian blocks that can be used as
+:py:class:`numpy.ndarray` views (e.g. of a memory mapped file) without creating
+python objects for the individual values.
+
+Layout of a file::
+
+    MAGIC | column blocks (64 byte aligned) | footer (utf-8 json) | footer size (uint64) | MAGIC
+
+The json footer contains the number of rows and the column metadata
+(name, type and the offset and size of the column blocks).
+Supported column types are ``"float64"``, ``"int64"``, ``"bool"`` (one byte per value),
+``"string"`` (utf-8) and ``"json"`` (json encoded values, used for all other columns).
+String and json columns use an ``int64`` offsets block with ``rows + 1`` entries and a data block.
+"""
+
+import sys
+from array import array
+from json import dumps, loads
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+from struct import Struct
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from ..util.request_helpers import map_local_file
+
+MAGIC = b"QHACOL01"
+BLOCK_ALIGNMENT = 64
+
+_FOOTER_SIZE = Struct("<Q")
+
+_INT64_MIN = -(2**63)
+_INT64_MAX = 2**63 - 1
+
+_ARRAY_TYPECODES = {"float64": "d", "int64": "q", "bool": "B"}
+_NUMPY_DTYPES = {"float64": "<f8", "int64": "<i8", "bool": "?"}
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _value_type(value: Any) -> str:
+    """Get the column type of a single value."""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int64" if _INT64_MIN <= value <= _INT64_MAX else "json"
+    if isinstance(value, float):
+        return "float64"
+    if isinstance(value, str):
+        return "string"
+    return "json"
+
+
+class _ColumnBuilder:
+    """Collect the values of a single column in the most compact representation possible.
+
+    The column type is widened (``int64`` -> ``float64``, anything else -> ``json``)
+    if a value does not fit the current column type.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.type: Optional[str] = None
+        self.values: Union[array, List[Any]] = []
+
+    def append(self, value: Any):
+        value_type = _value_type(value)
+        if self.type is None:
+            self.type = value_type
+            if value_type in _ARRAY_TYPECODES:
+                self.values = array(_ARRAY_TYPECODES[value_type])
+        elif value_type != self.type:
+            self._widen(value_type)
+        self.values.append(value)
+
+    def _widen(self, value_type: str):
+        if {self.type, value_type} == {"int64", "float64"}:
+            if self.type == "int64":
+                self.type = "float64"
+                self.values = array("d", self.values)
+            return
+        if self.type == "bool":
+            self.values = [bool(v) for v in self.values]
+        elif self.type != "string" and self.type != "json":
+            self.values = self.values.tolist()
+        self.type = "json"
+
+    def blocks(self) -> List[bytes]:
+        """Encode the column values into the binary blocks of the column."""
+        if self.type in _ARRAY_TYPECODES:
+            assert isinstance(self.values, array)
+            values = self.values
+            if _BIG_ENDIAN:
+                values = array(values.typecode, values)
+                values.byteswap()
+            return [values.tobytes()]
+        if self.type == "json":
+            encoded = [dumps(v, separators=(",", ":")).encode() for v in self.values]
+        else:
+            encoded = [v.encode() for v in self.values]
+        offsets = array("q", [0])
+        position = 0
+        for value in encoded:
+            position += len(value)
+            offsets.append(position)
+        if _BIG_ENDIAN:
+            offsets.byteswap()
+        return [offsets.tobytes(), b"".join(encoded)]
+
+
+def save_entity_columns(
+    entities: Iterable[Dict[str, Any]],
+    file_: IO[bytes],
+    attributes: Optional[Sequence[str]] = None,
+):
+    """Write entities into a binary file using the columnar entity format.
+
+    If ``attributes`` is not given, the attributes of the first entity are used as columns.
+    Missing attribute values are stored as ``None`` (forcing a ``"json"`` column).
+    Attributes not in the list of columns are ignored.
+
+    Args:
+        entities (Iterable[Dict[str, Any]]): the entities to write
+        file_ (IO[bytes]): the binary file to write the entities into
+        attributes (Optional[Sequence[str]], optional): the attributes to store as columns. Defaults to None.
+    """
+    columns: Optional[List[_ColumnBuilder]] = None
+    if attributes is not None:
+        columns = [_ColumnBuilder(name) for name in attributes]
+    rows = 0
+    for entity in entities:
+        if columns is None:
+            columns = [_ColumnBuilder(name) for name in entity.keys()]
+        for column in columns:
+            column.append(entity.get(column.name))
+        rows += 1
+    if columns is None:
+        columns = []
+
+    file_.write(MAGIC)
+    position = len(MAGIC)
+
+    def write_block(block: bytes) -> Dict[str, int]:
+        nonlocal position
+        padding = -position % BLOCK_ALIGNMENT
+        if padding:
+            file_.write(b"\x00" * padding)
+            position += padding
+        file_.write(block)
+        offset = position
+        position += len(block)
+        return {"offset": offset, "size": len(block)}
+
+    column_metadata: List[Dict[str, Any]] = []
+    for column in columns:
+        blocks = column.blocks()
+        metadata: Dict[str, Any] = {
+            "name": column.name,
+            "type": column.type if column.type is not None else "json",
+            "data": write_block(blocks[-1]),
+        }
+        if len(blocks) > 1:
+            metadata["offsets"] = write_block(blocks[0])
+        column_metadata.append(metadata)
+        column.values = []  # free memory early
+
+    footer = dumps(
+        {"version": 1, "rows": rows, "columns": column_metadata}, separators=(",", ":")
+    ).encode()
+    file_.write(footer)
+    file_.write(_FOOTER_SIZE.pack(len(footer)))
+    file_.write(MAGIC)
+
+
+class ColumnInfo(NamedTuple):
+    """Metadata of a single column of an :py:class:`EntityColumns` object."""
+
+    name: str
+    type: str
+    data_offset: int
+    data_size: int
+    offsets_offset: Optional[int] = None
+
+
+class EntityColumns:
+    """Read only access to entities stored in the binary columnar format.
+
+    The data is never copied.
+    The buffer can be any object supporting the buffer protocol
+    (e.g. :py:class:`bytes` or a :py:class:`~mmap.mmap` of a file).
+
+    Use :py:meth:`array` to get a numpy view of a numeric column,
+    :py:meth:`values` to get the values of a column as a python list
+    and :py:meth:`iter_entities` to read the entities row by row.
+    """
+
+    def __init__(self, buffer: Any) -> None:
+        self.buffer = memoryview(buffer).cast("B")
+        if (
+            len(self.buffer) < 2 * len(MAGIC) + _FOOTER_SIZE.size
+            or self.buffer[: len(MAGIC)] != MAGIC
+            or self.buffer[-len(MAGIC) :] != MAGIC
+        ):
+            raise ValueError("The data is not in the binary columnar entity format!")
+        footer_end = len(self.buffer) - len(MAGIC) - _FOOTER_SIZE.size
+        (footer_size,) = _FOOTER_SIZE.unpack_from(self.buffer, footer_end)
+        footer = loads(bytes(self.buffer[footer_end - footer_size : footer_end]))
+        if footer.get("version") != 1:
+            raise ValueError(
+                f"Unsupported version {footer.get('version')} of the binary columnar entity format!"
+            )
+        self.rows: int = footer["rows"]
+        self.columns: Dict[str, ColumnInfo] = {}
+        for column in footer["columns"]:
+            self.columns[column["name"]] = ColumnInfo(
+                name=column["name"],
+                type=column["type"],
+                data_offset=column["data"]["offset"],
+                data_size=column["data"]["size"],
+                offsets_offset=column["offsets"]["offset"]
+                if "offsets" in column
+                else None,
+            )
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "EntityColumns":
+        """Memory map a local file in the binary columnar format."""
+        with open(path, mode="rb") as file_:
+            return cls(mmap(file_.fileno(), 0, access=ACCESS_READ))
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def attributes(self) -> List[str]:
+        """The names of all columns (in the order they were written)."""
+        return list(self.columns.keys())
+
+    def _data(self, column: ColumnInfo) -> memoryview:
+        return self.buffer[column.data_offset : column.data_offset + column.data_size]
+
+    def array(self, name: str):
+        """Get a numpy array view of a numeric (``float64``, ``int64`` or ``bool``) column.
+
+        The returned array is read only and shares the memory with the underlying buffer.
+
+        Raises:
+            KeyError: if the column does not exist
+            TypeError: if the column is not numeric
+        """
+        import numpy as np
+
+        column = self.columns[name]
+        if column.type not in _NUMPY_DTYPES:
+            raise TypeError(
+                f"Column '{name}' of type {column.type} cannot be viewed as a numpy array."
+            )
+        return np.frombuffer(
+            self.buffer,
+            dtype=_NUMPY_DTYPES[column.type],
+            count=self.rows,
+            offset=column.data_offset,
+        )
+
+    def values(self, name: str) -> List[Any]:
+        """Get the values of a column as a list of python values.
+
+        Raises:
+            KeyError: if the column does not exist
+        """
+        column = self.columns[name]
+        data = self._data(column)
+        if column.type in _ARRAY_TYPECODES:
+            values = array(_ARRAY_TYPECODES[column.type])
+            values.frombytes(data)
+            if _BIG_ENDIAN:
+                values.byteswap()
+            if column.type == "bool":
+                return [bool(v) for v in values]
+            return values.tolist()
+        assert column.offsets_offset is not None
+        offsets = array("q")
+        offsets.frombytes(
+            self.buffer[
+                column.offsets_offset : column.offsets_offset + 8 * (self.rows + 1)
+            ]
+        )
+        if _BIG_ENDIAN:
+            offsets.byteswap()
+        raw = bytes(data)
+        decode = loads if column.type == "json" else bytes.decode
+        return [decode(raw[start:end]) for start, end in zip(offsets, offsets[1:])]
+
+    def iter_entities(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the entities as dicts."""
+        names = self.attributes
+        columns = [self.values(name) for name in names]
+        for row in zip(*columns):
+            yield dict(zip(names, row))
+
+
+def load_entity_columns(file_: Any) -> EntityColumns:
+    """Load entities in the binary columnar format from a :py:class:`~requests.Response` like object.
+
+    The body of responses reading from a local file (e.g. ``file://`` URLs) is
+    memory mapped. Other response bodies are read completely, as the format
+    requires random access.
+
+    Args:
+        file_ (ResponseLike): the object to load the entities from (must have a ``content`` attribute)
+
+    Returns:
+        EntityColumns: the loaded columns
+    """
+    buffer = map_local_file(file_)
+    if buffer is not None:
+        return EntityColumns(buffer)
+    return EntityColumns(file_.content)
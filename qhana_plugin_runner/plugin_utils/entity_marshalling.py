@@ -14,13 +14,16 @@
 
 """Module containing helpers to marshall and unmarshall entities into csv or json files."""
 
+from codecs import getincrementaldecoder
 from collections import namedtuple
 from csv import QUOTE_ALL, Dialect, reader, register_dialect, writer
-from json import dump, dumps, loads
-from json.decoder import JSONDecoder
+from io import TextIOWrapper
+from json import dumps, loads
+from json.decoder import JSONDecodeError, JSONDecoder
 from keyword import iskeyword
 from typing import (
     Any,
+    BinaryIO,
     Callable,
     ClassVar,
     Dict,
@@ -42,6 +45,11 @@ from unicodedata import category, normalize
 
 from typing_extensions import Protocol
 
+from ..util.request_helpers import get_local_file_path
+
+COLUMNAR_MIMETYPE = "application/X-columns+binary"
+"""The mimetype of the binary columnar entity format (see :py:mod:`~qhana_plugin_runner.plugin_utils.entity_columns`)."""
+
 
 class EntityTupleMixin:
     """A mixin class to provide entity metadata (e.g. attribute names) and
@@ -149,6 +157,130 @@ class ResponseLike(Protocol):
     ) -> Iterator[Any]:
         ...
 
+    def iter_content(
+        self, chunk_size: Optional[int] = 1, decode_unicode: bool = False
+    ) -> Iterator[Any]:
+        ...
+
+
+JSON_STREAM_CHUNK_SIZE = 2**16
+"""The chunk size (in bytes) used to read json files in :py:func:`load_entities`."""
+
+_JSON_WHITESPACE = " \t\n\r"
+_JSON_NUMBER_CHARS = "0123456789+-.eE"
+
+
+def _iter_json_values(chunks: Iterable[Union[str, bytes]]) -> Iterator[Any]:
+    """Incrementally decode a json document from a stream of chunks.
+
+    If the document is a json array, the array items are yielded one at a time
+    as soon as they are fully read. Any other json document is yielded as a single value.
+    Only the current item is kept in memory (plus the chunk it ends in).
+
+    Byte chunks are decoded as UTF-8 (as required by :rfc:`8259`), str chunks are used as is.
+
+    Args:
+        chunks (Iterable[Union[str, bytes]]): the chunks of the json document
+
+    Raises:
+        JSONDecodeError: if the document is not valid json
+
+    Yields:
+        Iterator[Any]: the decoded items of the json array (or the single decoded document)
+    """
+    decoder = JSONDecoder()
+    text_decoder = getincrementaldecoder("utf-8-sig")()
+    chunk_iter = iter(chunks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+
+    def read_more(min_size: int = 1) -> bool:
+        """Append chunks to the buffer until ``min_size`` unread characters are available.
+
+        Already consumed characters are dropped from the buffer.
+        Returns False if no new data could be read.
+        """
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        parts = [buffer[pos:]]
+        size = len(parts[0])
+        start_size = size
+        while size < min_size:
+            chunk = next(chunk_iter, None)
+            if chunk is None:
+                exhausted = True
+                parts.append(text_decoder.decode(b"", final=True))
+                break
+            if isinstance(chunk, bytes):
+                chunk = text_decoder.decode(chunk)
+            parts.append(chunk)
+            size += len(chunk)
+        buffer = "".join(parts)
+        pos = 0
+        return len(buffer) > start_size
+
+    def next_token() -> Optional[str]:
+        """Skip whitespace and return the next character without consuming it."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return None
+
+    def decode_value() -> Any:
+        """Decode the next complete json value starting at the current position."""
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # a value ending at the end of the buffer may be incomplete (e.g. numbers)
+                # and numbers followed by number characters may be split (e.g. "1." + "5")
+                is_complete = end < len(buffer) and not (
+                    isinstance(value, (int, float)) and buffer[end] in _JSON_NUMBER_CHARS
+                )
+                if is_complete or exhausted:
+                    pos = end
+                    return value
+            except JSONDecodeError:
+                if exhausted:
+                    raise
+            # grow the buffer geometrically to avoid quadratic re-parsing of large values
+            read_more(min_size=2 * (len(buffer) - pos) + 1)
+
+    first = next_token()
+    if first is None:
+        raise JSONDecodeError("Expecting value", buffer, pos)
+
+    if first != "[":
+        yield decode_value()
+    else:
+        pos += 1  # consume "["
+        token = next_token()
+        if token == "]":
+            pos += 1
+        else:
+            while True:
+                if token is None:
+                    raise JSONDecodeError("Unexpected end of data", buffer, pos)
+                yield decode_value()
+                token = next_token()
+                if token == ",":
+                    pos += 1
+                    token = next_token()
+                    continue
+                if token == "]":
+                    pos += 1
+                    break
+                raise JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+
+    if next_token() is not None:
+        raise JSONDecodeError("Extra data", buffer, pos)
+
 
 def entity_attribute_sort_key(attribute_name: str):
     """A sort key function that can be used to sort keys from a dictionary before passing
@@ -225,6 +357,22 @@ def ensure_tuple(
             yield item
 
 
+def _iter_lines(file_: ResponseLike) -> Iterator[str]:
+    """Iterate over the lines of a response.
+
+    Responses reading from a local file are read directly from the file
+    (bypassing the chunking of :py:meth:`~requests.Response.iter_lines`).
+    """
+    if get_local_file_path(file_) is not None:
+        raw = file_.raw  # type: ignore
+        if not raw.closed and not getattr(file_, "_content_consumed", False):
+            encoding = getattr(file_, "encoding", None) or "utf-8"
+            with TextIOWrapper(raw, encoding=encoding, newline="") as text_file:
+                yield from text_file
+            return
+    yield from file_.iter_lines(decode_unicode=True)
+
+
 def load_entities(
     file_: ResponseLike,
     mimetype: str,
@@ -236,6 +384,11 @@ def load_entities(
 
     Attributes of entities are either deserialized as json or as strings (csv).
 
+    Json arrays are parsed incrementally from the chunks of ``file_.iter_content``,
+    so only one entity has to be held in memory at a time. Use ``stream=True``
+    with :py:func:`~qhana_plugin_runner.requests.open_url` to also avoid buffering
+    the response body.
+
     If the mimetype is "text/csv" this method returns a stream of namedtuples.
     For json dicts are returned. Use the generator functions :py:func:`~qhana_plugin_runner.plugin_utils.entity_marshalling.ensure_dict`
     and :py:func:`~qhana_plugin_runner.plugin_utils.entity_marshalling.ensure_tuple`
@@ -248,7 +401,7 @@ def load_entities(
 
     Args:
         file_ (ResponseLike): the object to load the entities from
-        mimetype (str): the mime type to use for deserialization (supported mimetypes: "application/json", "application/X-lines+json" and "text/csv")
+        mimetype (str): the mime type to use for deserialization (supported mimetypes: "application/json", "application/X-lines+json", "application/X-columns+binary" and "text/csv")
         csv_dialect (str, optional): the csv dialect to use (only used with csv mimetype). Defaults to "default".
         tuple_ (Optional[Type[NamedTuple]], optional): the namedtuple class to use (only used with csv mimetype). Defaults to None.
         process_csv_header (Optional[Callable[[Sequence[str]], Sequence[str]]]): a callback used to process the csv header. Defaults to None.
@@ -257,21 +410,25 @@ def load_entities(
         ValueError: For unknown mimetypes
 
     Yields:
-        Generator[Union[Dict[str, Any], NamedTuple], None, None]: a stream of deserialized entities (dicts for json and tuples for csv)
+        Generator[Union[Dict[str, Any], NamedTuple], None, None]: a stream of deserialized entities (dicts for json and the columnar format and tuples for csv)
     """
     if mimetype == "application/json":
-        result = file_.json()
-        if isinstance(result, list):
-            yield from iter(result)
-            return
-        else:
-            yield result
+        if not callable(getattr(file_, "iter_content", None)):
+            # fallback for response like objects that cannot be streamed
+            result = file_.json()
+            if isinstance(result, list):
+                yield from iter(result)
+            else:
+                yield result
             return
+        yield from _iter_json_values(
+            file_.iter_content(chunk_size=JSON_STREAM_CHUNK_SIZE)
+        )
     elif mimetype == "application/X-lines+json":
-        for line in file_.iter_lines(decode_unicode=True):
+        for line in _iter_lines(file_):
             yield loads(line)
     elif mimetype == "text/csv":
-        csv_reader = reader(file_.iter_lines(decode_unicode=True), csv_dialect)
+        csv_reader = reader(_iter_lines(file_), csv_dialect)
         header: Sequence[str] = next(csv_reader)
         if process_csv_header:
             header = tuple(process_csv_header(header))
@@ -281,13 +438,17 @@ def load_entities(
             assert tuple_ is not None
 
         yield from (tuple_(row) for row in csv_reader if row)
+    elif mimetype == COLUMNAR_MIMETYPE:
+        from .entity_columns import load_entity_columns
+
+        yield from load_entity_columns(file_).iter_entities()
     else:
         raise ValueError(f"Loading entities from {mimetype} files is not implemented!")
 
 
 def save_entities(
     entities: Iterable[Union[Dict[str, Any], NamedTuple]],
-    file_: TextIO,
+    file_: Union[TextIO, BinaryIO],
     mimetype: str,
     attributes: Optional[Sequence[str]] = None,
     csv_dialect: str = "default",
@@ -300,10 +461,13 @@ def save_entities(
     The function :py:func:`~qhana_plugin_runner.plugin_utils.entity_marshalling.entity_attribute_sort_key`
     can be used to achieve that order.
 
+    The binary columnar format (``"application/X-columns+binary"``) requires a file opened in binary mode.
+    If no ``attributes`` are given the attributes of the first entity are used as columns.
+
     Args:
         entities (Iterable[Union[Dict[str, Any], NamedTuple]]): an iterable of entities as returned by :py:func:`~qhana_plugin_runner.plugin_utils.entity_marshalling.load_entities`
-        file_ (TextIO): the file to write the entities into
-        mimetype (str): the mime type to use for serialization (supported mimetypes: "application/json", "application/X-lines+json" and "text/csv")
+        file_ (Union[TextIO, BinaryIO]): the file to write the entities into
+        mimetype (str): the mime type to use for serialization (supported mimetypes: "application/json", "application/X-lines+json", "application/X-columns+binary" and "text/csv")
         attributes (Optional[Sequence[str]], optional): A list of attributes in the order they should appear in the csv file. MUST be valid python identifiers! All entities must have all attributes specified here! Defaults to None.
         csv_dialect (str, optional): the csv dialect to use. Defaults to "default".
         tuple_ (Optional[Type[NamedTuple]], optional): the namedtuple class to use (only used with csv mimetype, passed to ``ensure_tuple``). Defaults to None.
@@ -313,8 +477,13 @@ def save_entities(
         ValueError: For unknown mimetypes
     """
     if mimetype == "application/json":
-        dump(list(ensure_dict(entities)), file_, separators=(",", ":"))
-        file_.write("\n")
+        # write the entities one by one instead of building the complete list first
+        separator = "["
+        for entity in ensure_dict(entities):
+            file_.write(separator)
+            file_.write(dumps(entity, separators=(",", ":")))
+            separator = ","
+        file_.write("[]\n" if separator == "[" else "]\n")
     elif mimetype == "application/X-lines+json":
         for entity in ensure_dict(entities):
             file_.write(f"{dumps(entity)}\n")
@@ -328,5 +497,9 @@ def save_entities(
         if tuple_ is None:
             tuple_ = namedtuple("Entites", attributes)
         csv_writer.writerows(ensure_tuple(entities, tuple_=tuple_))
+    elif mimetype == COLUMNAR_MIMETYPE:
+        from .entity_columns import save_entity_columns
+
+        save_entity_columns(ensure_dict(entities), file_, attributes=attributes)
     else:
         raise ValueError(f"Saving entities to {mimetype} files is not implemented!")
@@ -0,0 +1,424 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing a compact binary file format for pairwise entity values.
+
+Similarities, distances and kernels between two lists of entities are stored as
+one ``float64`` matrix together with the entity IDs of the rows and columns.
+Symmetric matrices can be stored as a packed upper triangular matrix (including the diagonal).
+Missing values are stored as ``NaN``.
+
+Layout of a file::
+
+    MAGIC | matrix data (little-endian float64, 64 byte aligned) | footer (utf-8 json) | footer size (uint64) | MAGIC
+
+The json footer contains the layout (``"dense"`` or ``"upper-triangular"``),
+the shape, the offset of the matrix data and the row and column IDs.
+
+This module requires :py:mod:`numpy`. Plugins using it must declare numpy as a requirement.
+
+The pair-list format (one json object per entity pair) is still supported by
+:py:func:`load_entity_matrix` and can be produced with :py:func:`iter_matrix_pairs`.
+The attribute similarity and distance plugins still produce pair lists.
+"""
+
+from itertools import chain
+from json import dumps, loads
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+from struct import Struct
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from ..util.request_helpers import map_local_file
+from .entity_marshalling import JSON_STREAM_CHUNK_SIZE, _iter_json_values
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MATRIX_MIMETYPE = "application/X-matrix+binary"
+"""The mimetype of the binary entity matrix format."""
+
+MAGIC = b"QHAMAT01"
+BLOCK_ALIGNMENT = 64
+
+DENSE = "dense"
+UPPER_TRIANGULAR = "upper-triangular"
+
+_FOOTER_SIZE = Struct("<Q")
+_DTYPE = "<f8"
+
+
+class EntityMatrix:
+    """A matrix of pairwise values between the entities of the rows and columns.
+
+    For the ``"dense"`` layout :py:attr:`data` is a 2d array.
+    For the ``"upper-triangular"`` layout :py:attr:`data` contains the packed
+    upper triangle (row by row, including the diagonal) of a symmetric matrix.
+    Use :py:meth:`to_numpy` to always get the full 2d matrix.
+    """
+
+    def __init__(
+        self,
+        data: "np.ndarray",
+        row_ids: Sequence[str],
+        column_ids: Optional[Sequence[str]] = None,
+        layout: str = DENSE,
+    ) -> None:
+        if layout not in (DENSE, UPPER_TRIANGULAR):
+            raise ValueError(f"Unknown matrix layout {layout}!")
+        if layout == UPPER_TRIANGULAR and column_ids is not None:
+            if list(column_ids) != list(row_ids):
+                raise ValueError("Upper triangular matrices must be symmetric!")
+        self.data = data
+        self.layout = layout
+        self.row_ids: List[str] = list(row_ids)
+        self.column_ids: List[str] = (
+            self.row_ids if column_ids is None else list(column_ids)
+        )
+        self._row_index: Optional[Dict[str, int]] = None
+        self._column_index: Optional[Dict[str, int]] = None
+
+    @property
+    def shape(self):
+        return (len(self.row_ids), len(self.column_ids))
+
+    @property
+    def row_index(self) -> Dict[str, int]:
+        """A map from the row entity IDs to the row index."""
+        if self._row_index is None:
+            self._row_index = {id_: i for i, id_ in enumerate(self.row_ids)}
+        return self._row_index
+
+    @property
+    def column_index(self) -> Dict[str, int]:
+        """A map from the column entity IDs to the column index."""
+        if self._column_index is None:
+            self._column_index = {id_: i for i, id_ in enumerate(self.column_ids)}
+        return self._column_index
+
+    def to_numpy(self) -> "np.ndarray":
+        """Get the full 2d matrix.
+
+        Dense matrices are returned without copying the data.
+        """
+        if self.layout == DENSE:
+            return self.data.reshape(self.shape)
+        import numpy as np
+
+        size = len(self.row_ids)
+        matrix = np.empty((size, size), dtype=np.float64)
+        rows, columns = np.triu_indices(size)
+        matrix[rows, columns] = self.data
+        matrix[columns, rows] = self.data
+        return matrix
+
+    @classmethod
+    def from_buffer(cls, buffer: Any) -> "EntityMatrix":
+        """Read a matrix in the binary format from any object supporting the buffer protocol.
+
+        The matrix data is not copied.
+
+        Raises:
+            ValueError: if the buffer does not contain a matrix in the binary format
+        """
+        import numpy as np
+
+        view = memoryview(buffer).cast("B")
+        if not is_entity_matrix(view):
+            raise ValueError("The data is not in the binary entity matrix format!")
+        footer_end = len(view) - len(MAGIC) - _FOOTER_SIZE.size
+        (footer_size,) = _FOOTER_SIZE.unpack_from(view, footer_end)
+        footer = loads(bytes(view[footer_end - footer_size : footer_end]))
+        if footer.get("version") != 1:
+            raise ValueError(
+                f"Unsupported version {footer.get('version')} of the binary entity matrix format!"
+            )
+        rows, columns = footer["shape"]
+        count = rows * columns
+        if footer["layout"] == UPPER_TRIANGULAR:
+            count = rows * (rows + 1) // 2
+        data = np.frombuffer(view, dtype=_DTYPE, count=count, offset=footer["offset"])
+        if footer["layout"] == DENSE:
+            data = data.reshape((rows, columns))
+        return cls(
+            data,
+            row_ids=footer["row_ids"],
+            column_ids=footer.get("column_ids"),
+            layout=footer["layout"],
+        )
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "EntityMatrix":
+        """Memory map a local file in the binary entity matrix format."""
+        with open(path, mode="rb") as file_:
+            return cls.from_buffer(mmap(file_.fileno(), 0, access=ACCESS_READ))
+
+
+def is_entity_matrix(data: Union[bytes, memoryview, mmap]) -> bool:
+    """Check if the data starts and ends with the magic bytes of the binary matrix format."""
+    return (
+        len(data) >= 2 * len(MAGIC) + _FOOTER_SIZE.size
+        and data[: len(MAGIC)] == MAGIC
+        and data[-len(MAGIC) :] == MAGIC
+    )
+
+
+class EntityMatrixWriter:
+    """Write a matrix in the binary entity matrix format row block by row block.
+
+    Use as a context manager or call :py:meth:`close` after writing all rows
+    (the file itself is not closed).
+    For ``symmetric=True`` only the upper triangle of the rows passed to
+    :py:meth:`write_rows` is stored.
+
+    Args:
+        file_ (IO[bytes]): the binary file to write to
+        row_ids (Sequence[str]): the entity IDs of the rows
+        column_ids (Optional[Sequence[str]], optional): the entity IDs of the columns. Defaults to the row IDs.
+        symmetric (bool, optional): store the matrix in the upper triangular layout. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        file_: IO[bytes],
+        row_ids: Sequence[str],
+        column_ids: Optional[Sequence[str]] = None,
+        symmetric: bool = False,
+    ) -> None:
+        if symmetric and column_ids is not None and list(column_ids) != list(row_ids):
+            raise ValueError("Symmetric matrices must have the same row and column IDs!")
+        self.file_ = file_
+        self.row_ids = list(row_ids)
+        self.column_ids = None if column_ids is None else list(column_ids)
+        self.symmetric = symmetric
+        self.rows_written = 0
+        self.file_.write(MAGIC)
+        padding = -len(MAGIC) % BLOCK_ALIGNMENT
+        self.file_.write(b"\x00" * padding)
+        self.offset = len(MAGIC) + padding
+
+    @property
+    def shape(self):
+        columns = self.row_ids if self.column_ids is None else self.column_ids
+        return (len(self.row_ids), len(columns))
+
+    def write_rows(self, rows: "np.ndarray"):
+        """Write the next rows of the matrix.
+
+        Args:
+            rows (np.ndarray): a 2d array with the full rows (all columns) to write
+
+        Raises:
+            ValueError: if the rows have the wrong shape or there are too many rows
+        """
+        import numpy as np
+
+        rows = np.asarray(rows, dtype=_DTYPE)
+        if rows.ndim != 2 or rows.shape[1] != self.shape[1]:
+            raise ValueError(
+                f"Expected rows with {self.shape[1]} columns but got an array of shape {rows.shape}!"
+            )
+        if self.rows_written + rows.shape[0] > self.shape[0]:
+            raise ValueError("Cannot write more rows than the matrix has!")
+        if self.symmetric:
+            for offset, row in enumerate(rows, start=self.rows_written):
+                self.file_.write(np.ascontiguousarray(row[offset:]).tobytes())
+        else:
+            self.file_.write(np.ascontiguousarray(rows).tobytes())
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        """Write the footer of the matrix file.
+
+        Raises:
+            ValueError: if not all rows were written
+        """
+        if self.rows_written != self.shape[0]:
+            raise ValueError(
+                f"Only {self.rows_written} of {self.shape[0]} rows were written!"
+            )
+        footer_data: Dict[str, Any] = {
+            "version": 1,
+            "layout": UPPER_TRIANGULAR if self.symmetric else DENSE,
+            "dtype": _DTYPE,
+            "shape": list(self.shape),
+            "offset": self.offset,
+            "row_ids": self.row_ids,
+        }
+        if self.column_ids is not None:
+            footer_data["column_ids"] = self.column_ids
+        footer = dumps(footer_data, separators=(",", ":")).encode()
+        self.file_.write(footer)
+        self.file_.write(_FOOTER_SIZE.pack(len(footer)))
+        self.file_.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def save_entity_matrix(
+    matrix: "np.ndarray",
+    file_: IO[bytes],
+    row_ids: Sequence[str],
+    column_ids: Optional[Sequence[str]] = None,
+    symmetric: bool = False,
+):
+    """Write a complete matrix in the binary entity matrix format.
+
+    Args:
+        matrix (np.ndarray): the 2d matrix
+        file_ (IO[bytes]): the binary file to write to
+        row_ids (Sequence[str]): the entity IDs of the rows
+        column_ids (Optional[Sequence[str]], optional): the entity IDs of the columns. Defaults to the row IDs.
+        symmetric (bool, optional): store only the upper triangle of the matrix. Defaults to False.
+    """
+    with EntityMatrixWriter(file_, row_ids, column_ids, symmetric=symmetric) as writer:
+        writer.write_rows(matrix)
+
+
+def matrix_from_pairs(
+    pairs: Iterable[Dict[str, Any]], value_attribute: str, symmetric: bool = False
+) -> EntityMatrix:
+    """Build a dense matrix from entity pairs in the pair-list format.
+
+    The rows use the ``entity_1_ID`` and the columns the ``entity_2_ID`` of the pairs.
+    If ``symmetric`` is true, rows and columns share the same IDs and every value
+    is set for both orders of the pair.
+    Pairs without a value are set to ``NaN``.
+
+    Args:
+        pairs (Iterable[Dict[str, Any]]): the pairs with ``entity_1_ID``, ``entity_2_ID`` and the value attribute
+        value_attribute (str): the attribute containing the value (e.g. ``"distance"``)
+        symmetric (bool, optional): if the matrix is symmetric. Defaults to False.
+
+    Returns:
+        EntityMatrix: the matrix
+    """
+    import numpy as np
+
+    row_index: Dict[str, int] = {}
+    column_index: Dict[str, int] = row_index if symmetric else {}
+    row_positions: List[int] = []
+    column_positions: List[int] = []
+    values: List[float] = []
+
+    for pair in pairs:
+        row_id, column_id = pair["entity_1_ID"], pair["entity_2_ID"]
+        row_positions.append(row_index.setdefault(row_id, len(row_index)))
+        column_positions.append(column_index.setdefault(column_id, len(column_index)))
+        value = pair.get(value_attribute)
+        values.append(np.nan if value is None else value)
+
+    matrix = np.full((len(row_index), len(column_index)), np.nan, dtype=np.float64)
+    matrix[row_positions, column_positions] = values
+    if symmetric:
+        matrix[column_positions, row_positions] = values
+        return EntityMatrix(matrix, row_ids=list(row_index))
+    return EntityMatrix(matrix, row_ids=list(row_index), column_ids=list(column_index))
+
+
+def _iter_buffer_chunks(buffer: Any, chunk_size: int) -> Iterator[bytes]:
+    for start in range(0, len(buffer), chunk_size):
+        yield buffer[start : start + chunk_size]
+
+
+def load_entity_matrix(
+    file_: Any, value_attribute: str, symmetric: bool = False
+) -> EntityMatrix:
+    """Load a matrix from a :py:class:`~requests.Response` like object.
+
+    Supports the binary entity matrix format and the json pair-list format
+    (detected by the content of the file).
+
+    The body of responses reading from a local file (e.g. ``file://`` URLs) is
+    memory mapped. Pair lists are decoded incrementally (open the URL with
+    ``stream=True``), other binary matrices are read completely, as the format
+    requires random access.
+
+    Args:
+        file_ (ResponseLike): the object to load the matrix from (must have a ``content`` attribute)
+        value_attribute (str): the attribute containing the value in the pair-list format (e.g. ``"distance"``)
+        symmetric (bool, optional): if pairs in the pair-list format should be treated as symmetric. Defaults to False.
+
+    Returns:
+        EntityMatrix: the loaded matrix
+    """
+    chunks: Iterable[bytes]
+    buffer = map_local_file(file_)
+    if buffer is not None:
+        if is_entity_matrix(buffer):
+            return EntityMatrix.from_buffer(buffer)
+        chunks = _iter_buffer_chunks(buffer, JSON_STREAM_CHUNK_SIZE)
+    elif callable(getattr(file_, "iter_content", None)):
+        chunk_iter = iter(file_.iter_content(chunk_size=JSON_STREAM_CHUNK_SIZE))
+        head = b""
+        for chunk in chunk_iter:
+            head += chunk
+            if len(head) >= len(MAGIC):
+                break
+        chunks = chain((head,), chunk_iter)
+        if head.startswith(MAGIC):
+            return EntityMatrix.from_buffer(b"".join(chunks))
+    else:
+        content = file_.content
+        if is_entity_matrix(content):
+            return EntityMatrix.from_buffer(content)
+        chunks = (content,)
+    return matrix_from_pairs(
+        _iter_json_values(chunks), value_attribute, symmetric=symmetric
+    )
+
+
+def iter_matrix_pairs(
+    matrix: EntityMatrix, value_attribute: str
+) -> Iterator[Dict[str, Any]]:
+    """Export a matrix to the pair-list format.
+
+    Symmetric (upper triangular) matrices only produce pairs of the upper triangle.
+    ``NaN`` values are exported as ``None``. The ``ID`` of a pair is
+    ``"<entity_1_ID>_<entity_2_ID>"`` (like the entity distances of the aggregator plugin).
+
+    Args:
+        matrix (EntityMatrix): the matrix to export
+        value_attribute (str): the attribute to store the value in (e.g. ``"distance"``)
+
+    Yields:
+        Iterator[Dict[str, Any]]: dicts with ``ID``, ``entity_1_ID``, ``entity_2_ID`` and the value attribute
+    """
+    full_matrix = matrix.to_numpy()
+    for row, row_id in enumerate(matrix.row_ids):
+        start = row if matrix.layout == UPPER_TRIANGULAR else 0
+        row_values = full_matrix[row, start:].tolist()
+        for column_id, value in zip(matrix.column_ids[start:], row_values):
+            yield {
+                "ID": f"{row_id}_{column_id}",
+                "entity_1_ID": row_id,
+                "entity_2_ID": column_id,
+                value_attribute: None if value != value else value,
+            }
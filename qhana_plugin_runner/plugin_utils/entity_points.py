@@ -0,0 +1,221 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing helpers to load entity points (e.g. ``entity/vector``) into numpy arrays.
+
+This module requires :py:mod:`numpy`. Plugins using it must declare numpy as a requirement.
+"""
+
+from itertools import islice
+from operator import itemgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from werkzeug.http import parse_options_header
+
+from .entity_marshalling import COLUMNAR_MIMETYPE, ResponseLike, load_entities
+
+if TYPE_CHECKING:
+    import numpy as np
+
+NON_DIMENSION_ATTRIBUTES = ("ID", "href")
+"""Attributes of entity points that are never used as dimensions."""
+
+DEFAULT_BATCH_SIZE = 4096
+
+
+class EntityPoints(NamedTuple):
+    """Entity points loaded into a single float64 array (one row per entity)."""
+
+    ids: List[str]
+    id_to_idx: Dict[str, int]
+    dimensions: List[str]
+    points: "np.ndarray"
+
+
+def _get_dimensions(attributes: Sequence[str]) -> List[str]:
+    """Get the sorted dimension attributes from a list of all attributes."""
+    return sorted(a for a in attributes if a not in NON_DIMENSION_ATTRIBUTES)
+
+
+def _get_mimetype(file_: ResponseLike, mimetype: Optional[str]) -> str:
+    if mimetype is None:
+        mimetype = file_.headers["Content-Type"]  # type: ignore
+    # remove mimetype parameters, e.g. "; charset=utf-8"
+    return mimetype.split(";", maxsplit=1)[0].strip()
+
+
+def _iter_columnar_batches(
+    file_: ResponseLike, batch_size: int, dimensions: Optional[Sequence[str]]
+) -> Iterator[Tuple[List[str], "np.ndarray", List[str]]]:
+    import numpy as np
+
+    from .entity_columns import load_entity_columns
+
+    columns = load_entity_columns(file_)
+    if dimensions is None:
+        dimensions = _get_dimensions(columns.attributes)
+    ids = columns.values("ID")
+    arrays = [columns.array(d) for d in dimensions]
+    for start in range(0, len(columns), batch_size):
+        batch_ids = ids[start : start + batch_size]
+        batch = np.empty((len(batch_ids), len(arrays)), dtype=np.float64)
+        for i, array in enumerate(arrays):
+            batch[:, i] = array[start : start + batch_size]
+        yield batch_ids, batch, list(dimensions)
+
+
+def _iter_text_batches(
+    file_: ResponseLike,
+    mimetype: str,
+    batch_size: int,
+    dimensions: Optional[Sequence[str]],
+) -> Iterator[Tuple[List[str], "np.ndarray", List[str]]]:
+    import numpy as np
+
+    entities = load_entities(file_, mimetype=mimetype)
+    first = next(entities, None)
+    if first is None:
+        return
+
+    # resolve the attribute positions only once for all entities
+    get_id: Callable[[Any], Any]
+    get_values: Callable[[Any], Any]
+    if isinstance(first, dict):
+        if dimensions is None:
+            dimensions = _get_dimensions(list(first.keys()))
+        get_id = itemgetter("ID")
+        get_values = itemgetter(*dimensions)
+    else:
+        # csv files produce entity tuples
+        attributes = list(first.entity_attributes)  # type: ignore
+        if dimensions is None:
+            dimensions = _get_dimensions(attributes)
+        get_id = itemgetter(attributes.index("ID"))
+        get_values = itemgetter(*(attributes.index(d) for d in dimensions))
+    dimensions = list(dimensions)
+
+    if len(dimensions) == 1:
+        # itemgetter returns a single value instead of a tuple
+        get_single_value = get_values
+
+        def get_values(entity):
+            return (get_single_value(entity),)
+
+    rows = [first]
+    rows.extend(islice(entities, batch_size - 1))
+    while rows:
+        # numpy parses the values (including strings from csv files) in one go
+        batch = np.array([get_values(row) for row in rows], dtype=np.float64)
+        batch = batch.reshape((len(rows), len(dimensions)))
+        yield [get_id(row) for row in rows], batch, dimensions
+        rows = list(islice(entities, batch_size))
+
+
+def iter_entity_point_batches(
+    file_: ResponseLike,
+    mimetype: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dimensions: Optional[Sequence[str]] = None,
+) -> Iterator[Tuple[List[str], "np.ndarray"]]:
+    """Load entity points batch by batch.
+
+    The dimensions are all attributes except ``ID`` and ``href`` sorted by their name.
+    They are resolved only once (from the first entity or the csv header).
+
+    Args:
+        file_ (ResponseLike): the object to load the entities from
+        mimetype (Optional[str], optional): the mimetype of the entities. Defaults to the ``Content-Type`` header of the response.
+        batch_size (int, optional): the maximum number of entities per batch. Defaults to 4096.
+        dimensions (Optional[Sequence[str]], optional): the attributes to use as dimensions. Defaults to None.
+
+    Yields:
+        Iterator[Tuple[List[str], np.ndarray]]: the entity IDs of the batch and a float64 array with one row per entity
+    """
+    for ids, batch, _ in _iter_batches(file_, mimetype, batch_size, dimensions):
+        yield ids, batch
+
+
+def _iter_batches(
+    file_: ResponseLike,
+    mimetype: Optional[str],
+    batch_size: int,
+    dimensions: Optional[Sequence[str]],
+) -> Iterator[Tuple[List[str], "np.ndarray", List[str]]]:
+    mimetype = _get_mimetype(file_, mimetype)
+    headers = getattr(file_, "headers", None) or {}
+    _, content_type_options = parse_options_header(headers.get("Content-Type", ""))
+    if hasattr(file_, "encoding") and "charset" not in content_type_options:
+        # entity files are utf-8 encoded, prevent requests from using its
+        # default encoding (e.g. ISO-8859-1 for text/csv) or guessing one
+        file_.encoding = "utf-8"  # type: ignore
+    if mimetype == COLUMNAR_MIMETYPE:
+        return _iter_columnar_batches(file_, batch_size, dimensions)
+    return _iter_text_batches(file_, mimetype, batch_size, dimensions)
+
+
+def load_entity_points(
+    file_: ResponseLike,
+    mimetype: Optional[str] = None,
+    dimensions: Optional[Sequence[str]] = None,
+) -> EntityPoints:
+    """Load all entity points into a single float64 array in one pass over the data.
+
+    Supports all entity formats supported by :py:func:`~qhana_plugin_runner.plugin_utils.entity_marshalling.load_entities`.
+    The row of an entity in the array can be looked up with ``id_to_idx``.
+
+    Args:
+        file_ (ResponseLike): the object to load the entities from
+        mimetype (Optional[str], optional): the mimetype of the entities. Defaults to the ``Content-Type`` header of the response.
+        dimensions (Optional[Sequence[str]], optional): the attributes to use as dimensions. Defaults to all attributes except ``ID`` and ``href`` (sorted by name).
+
+    Raises:
+        ValueError: if an entity ID is not unique
+
+    Returns:
+        EntityPoints: the loaded entity points
+    """
+    import numpy as np
+
+    ids: List[str] = []
+    id_to_idx: Dict[str, int] = {}
+    batches: List["np.ndarray"] = []
+    resolved_dimensions: List[str] = [] if dimensions is None else list(dimensions)
+
+    for batch_ids, batch, resolved_dimensions in _iter_batches(
+        file_, mimetype, DEFAULT_BATCH_SIZE, dimensions
+    ):
+        for id_ in batch_ids:
+            if id_to_idx.setdefault(id_, len(ids)) != len(ids):
+                raise ValueError(f"Duplicate ID: {id_}")
+            ids.append(id_)
+        batches.append(batch)
+
+    if len(batches) == 1:
+        points = batches[0]
+    elif batches:
+        points = np.concatenate(batches)
+    else:
+        points = np.empty((0, len(resolved_dimensions)), dtype=np.float64)
+    return EntityPoints(ids, id_to_idx, resolved_dimensions, points)
@@ -1,22 +1,285 @@
-from io import BytesIO, TextIOWrapper
-from typing import IO, Any, Text, Tuple, Generator, Union
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing helpers to read zip files from URLs without loading them into memory.
+
+Depending on the URL and the server the zip file is read
+
+* directly from the file (``file://`` URLs),
+* with HTTP range requests (only the central directory and the opened members are fetched)
+* or from a local copy that is spooled to a temporary file above a size threshold.
+"""
+
+from contextlib import contextmanager
+from copy import copy
+from http import HTTPStatus
+from io import (
+    SEEK_CUR,
+    SEEK_END,
+    SEEK_SET,
+    BufferedReader,
+    BytesIO,
+    RawIOBase,
+    TextIOWrapper,
+)
+from struct import Struct
+from tempfile import TemporaryFile
+from typing import IO, Any, Generator, Iterator, Text, Tuple, Union
 from zipfile import ZipFile
 
+from requests.models import Response
+
 from qhana_plugin_runner.requests import open_url
 
+ZIP_SPOOL_THRESHOLD = 2**24
+"""Zip files larger than this (in bytes) are spooled to a temporary file or read with range requests."""
+
+ZIP_RANGE_BLOCK_SIZE = 2**20
+"""The minimum number of bytes fetched with a single range request."""
+
+_LOCAL_FILE_HEADER = Struct("<4s2B4HL2L2H")
+_LOCAL_FILE_HEADER_SIGNATURE = b"PK\003\004"
+_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP64_EXTRA_FIELD_ID = 0x0001
+_EXTRA_FIELD_HEADER = Struct("<2H")
+
+
+class HttpRangeFile(RawIOBase):
+    """A read only, seekable file backed by HTTP range requests.
+
+    Wrap it in a :py:class:`~io.BufferedReader` to avoid many small requests.
+    """
+
+    def __init__(self, url: str, size: int) -> None:
+        super().__init__()
+        self.url = url
+        self.size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self._position + offset
+        elif whence == SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence}).")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}.")
+        self._position = position
+        return position
+
+    def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer).cast("B")
+        end = min(self._position + len(view), self.size)
+        if end <= self._position:
+            return 0
+        with open_url(
+            self.url, headers={"Range": f"bytes={self._position}-{end - 1}"}
+        ) as response:
+            if response.status_code != HTTPStatus.PARTIAL_CONTENT:
+                raise IOError("The server did not respond with the requested range.")
+            data = response.content
+        if len(data) != end - self._position:
+            raise IOError("The server responded with a wrong range.")
+        view[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def _supports_range_requests(response: Response) -> bool:
+    return (
+        response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        and "Content-Encoding" not in response.headers
+        and response.url.startswith(("http://", "https://"))
+    )
+
+
+def _spool_response(response: Response, spool_threshold: int) -> IO[bytes]:
+    """Copy the response body into memory or into a temporary file if it is too large."""
+    buffer: IO[bytes] = BytesIO()
+    chunks = response.iter_content(chunk_size=2**16)
+    for chunk in chunks:
+        buffer.write(chunk)
+        if buffer.tell() > spool_threshold:
+            # SpooledTemporaryFile cannot be used here because of https://bugs.python.org/issue26175
+            spooled = TemporaryFile()
+            assert isinstance(buffer, BytesIO)
+            spooled.write(buffer.getbuffer())
+            buffer = spooled
+            for chunk in chunks:
+                buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+@contextmanager
+def open_zip_url(
+    url: str, spool_threshold: int = ZIP_SPOOL_THRESHOLD
+) -> Iterator[ZipFile]:
+    """Open a zip file from an URL without reading the whole file into memory.
+
+    Files from ``file://`` URLs are read directly.
+    Large zip files are read with HTTP range requests if the server supports them
+    (only the central directory and the members that are opened are fetched).
+    Otherwise the zip file is downloaded and spooled to a temporary file above the threshold.
+
+    Args:
+        url (str): the URL of the zip file
+        spool_threshold (int, optional): zip files larger than this are not kept in memory. Defaults to ZIP_SPOOL_THRESHOLD.
+
+    Yields:
+        Iterator[ZipFile]: the opened zip file
+    """
+    with open_url(url, stream=True) as response:
+        raw = response.raw
+        size = int(response.headers.get("Content-Length", 0))
+        file_: IO[bytes]
+        if hasattr(raw, "seekable") and raw.seekable():
+            # local files (e.g. from the FileAdapter) can be used directly
+            file_ = raw
+        elif size > spool_threshold and _supports_range_requests(response):
+            response.close()  # do not download the body
+            file_ = BufferedReader(
+                HttpRangeFile(url, size), buffer_size=ZIP_RANGE_BLOCK_SIZE
+            )
+        else:
+            file_ = _spool_response(response, spool_threshold)
+        try:
+            with ZipFile(file_) as zip_file:
+                yield zip_file
+        finally:
+            file_.close()
+
 
 def get_files_from_zip_url(
     url: str, mode="t"
 ) -> Generator[Tuple[Union[IO[bytes], IO[Text]], str], Any, None]:
-    with open_url(url) as taxonomy_data:
-        zip_bytes = taxonomy_data.content
-        # SpooledTemporaryFile cannot be used here because of https://bugs.python.org/issue26175
-        tmp_buffer = BytesIO(zip_bytes)
-        zip_file = ZipFile(tmp_buffer)
+    """Iterate over all files in a zip file from an URL.
 
+    Args:
+        url (str): the URL of the zip file
+        mode (str, optional): "t" to get text files and "b" to get binary files. Defaults to "t".
+
+    Yields:
+        Generator[Tuple[Union[IO[bytes], IO[Text]], str], Any, None]: the opened file and its name
+    """
+    with open_zip_url(url) as zip_file:
         for file_name in zip_file.namelist():
             with zip_file.open(file_name) as zipped_file:
                 if "b" in mode:
                     yield zipped_file, file_name
                 else:
-                    yield TextIOWrapper(zipped_file), file_name
+                    yield TextIOWrapper(zipped_file, encoding="utf-8"), file_name
+
+
+@contextmanager
+def open_file_from_zip_url(
+    url: str, file_name: str, mode="t"
+) -> Iterator[Union[IO[bytes], IO[Text]]]:
+    """Open a single file in a zip file from an URL.
+
+    Other files in the zip file are not downloaded if the server supports range requests.
+
+    Args:
+        url (str): the URL of the zip file
+        file_name (str): the name of the file in the zip file
+        mode (str, optional): "t" to open a text file and "b" to open a binary file. Defaults to "t".
+
+    Raises:
+        KeyError: if the zip file does not contain the file
+
+    Yields:
+        Iterator[Union[IO[bytes], IO[Text]]]: the opened file
+    """
+    with open_zip_url(url) as zip_file:
+        with zip_file.open(file_name) as zipped_file:
+            if "b" in mode:
+                yield zipped_file
+            else:
+                yield TextIOWrapper(zipped_file, encoding="utf-8")
+
+
+def _strip_zip64_extra_field(extra: bytes) -> bytes:
+    """Remove the zip64 extra field (it is recreated when the file header is written)."""
+    stripped = []
+    position = 0
+    while position + _EXTRA_FIELD_HEADER.size <= len(extra):
+        field_id, size = _EXTRA_FIELD_HEADER.unpack_from(extra, position)
+        end = position + _EXTRA_FIELD_HEADER.size + size
+        if field_id != _ZIP64_EXTRA_FIELD_ID:
+            stripped.append(extra[position:end])
+        position = end
+    return b"".join(stripped)
+
+
+def copy_zip_members(source: ZipFile, target: ZipFile, chunk_size: int = 2**20):
+    """Copy all members of a zip file into another zip file without recompressing them.
+
+    The compressed data of the members is copied as is, only the local file headers
+    and the central directory are written anew. The members are never decompressed.
+
+    Args:
+        source (ZipFile): the zip file to copy the members from (opened for reading)
+        target (ZipFile): the zip file to copy the members into (opened for writing or appending, may be a stream that is not seekable)
+        chunk_size (int, optional): the size of the chunks used to copy the data. Defaults to 2**20.
+
+    Raises:
+        ValueError: if the source or target zip file is in the wrong mode or a member is invalid
+    """
+    if source.mode != "r" or target.mode not in ("w", "x", "a"):
+        raise ValueError("Source must be opened for reading and target for writing!")
+    assert source.fp is not None and target.fp is not None
+
+    for info in source.infolist():
+        source.fp.seek(info.header_offset)
+        header = _LOCAL_FILE_HEADER.unpack(source.fp.read(_LOCAL_FILE_HEADER.size))
+        if header[0] != _LOCAL_FILE_HEADER_SIGNATURE:
+            raise ValueError(f"Bad local file header for member {info.filename}!")
+        # skip the file name and extra field of the local header
+        source.fp.seek(header[10] + header[11], SEEK_CUR)
+
+        new_info = copy(info)
+        # sizes and crc are known, no data descriptor is needed after the data
+        new_info.flag_bits &= ~_DATA_DESCRIPTOR_FLAG
+        new_info.extra = _strip_zip64_extra_field(info.extra)
+
+        if target._seekable:
+            target.fp.seek(target.start_dir)
+        new_info.header_offset = target.fp.tell()
+        target.fp.write(new_info.FileHeader())
+
+        remaining = info.compress_size
+        while remaining > 0:
+            data = source.fp.read(min(chunk_size, remaining))
+            if not data:
+                raise ValueError(f"Truncated data for member {info.filename}!")
+            target.fp.write(data)
+            remaining -= len(data)
+
+        # register the member in the central directory of the target
+        target.filelist.append(new_info)
+        target.NameToInfo[new_info.filename] = new_info
+        target.start_dir = target.fp.tell()
+        target._didModify = True
@@ -18,8 +18,8 @@ from typing import Dict, Optional, Sequence, Union
 
 from flask import Flask
 from flask.globals import current_app
-from requests import request
 
+from ..requests import REQUEST_SESSION
 from .types import ApiLink, ApiResponse, match_api_link
 from ..util.logging import get_logger
 
@@ -85,7 +85,7 @@ class PluginRegistryClient:
             get_logger(current_app, _REGISTRY_CLIENT_LOGGER).debug(
                 f"Requesting URL '{url}' with query params {query_params}"
             )
-        response = request("get", url, params=query_params)
+        response = REQUEST_SESSION.get(url, params=query_params)
 
         response_data = response.json()
         if response_data.keys() < _API_RESPONSE_MIN_KEYS:
@@ -14,17 +14,179 @@
 
 """Functions for opening files from external URLs."""
 
+import socket
+from pathlib import Path
 from re import Pattern
+from typing import Any, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
 
 from flask import Flask
 from flask.globals import current_app
 from requests import Session
-from requests.models import Response
+from requests.adapters import HTTPAdapter
+from requests.models import PreparedRequest, Response
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+from werkzeug.exceptions import HTTPException
+
+from .util.url_cache import UrlCache, is_plain_get_request
 
 REQUEST_SESSION = Session()
 
 
-def open_url(url: str, raise_on_error_status=True, **kwargs) -> Response:
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP adapter with a default timeout and optional TCP keep-alive for pooled connections.
+
+    Args:
+        timeout (Union[None, float, Tuple[Optional[float], Optional[float]]], optional): the timeout used for requests without an explicit timeout. Defaults to None.
+        tcp_keepalive (bool, optional): enable TCP keep-alive probes for pooled connections. Defaults to False.
+        **kwargs: further arguments passed to :py:class:`~requests.adapters.HTTPAdapter`
+    """
+
+    def __init__(
+        self,
+        timeout: Union[None, float, Tuple[Optional[float], Optional[float]]] = None,
+        tcp_keepalive: bool = False,
+        **kwargs,
+    ) -> None:
+        self.timeout = timeout
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request: PreparedRequest, timeout=None, **kwargs) -> Response:
+        if timeout is None:
+            timeout = self.timeout
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def configure_request_session(session: Session, config: Mapping[str, Any]):
+    """Mount HTTP adapters with the connection pool, timeout and retry settings from the config.
+
+    Config keys (all optional):
+
+    * ``"REQUEST_POOL_CONNECTIONS"``: number of hosts to keep connection pools for
+    * ``"REQUEST_POOL_MAXSIZE"``: maximum number of connections kept alive per host
+    * ``"REQUEST_POOL_BLOCK"``: wait for a free connection instead of opening a new connection if the pool is full
+    * ``"REQUEST_TCP_KEEPALIVE"``: enable TCP keep-alive probes for pooled connections
+    * ``"REQUEST_CONNECT_TIMEOUT"`` and ``"REQUEST_READ_TIMEOUT"``: timeouts (in seconds) of requests without an explicit timeout
+    * ``"REQUEST_RETRIES"``: number of retries for connection errors and the status codes in ``"REQUEST_RETRY_STATUS"``
+    * ``"REQUEST_RETRY_BACKOFF_FACTOR"``: the backoff factor for the exponential backoff between retries
+
+    Only idempotent requests (e.g. ``GET`` but not ``POST``) are retried after
+    the request was sent to the server.
+
+    Args:
+        session (Session): the session to mount the adapters in
+        config (Mapping[str, Any]): the config containing the settings (e.g. the flask app config)
+    """
+    retries = Retry(
+        total=config.get("REQUEST_RETRIES", 3),
+        backoff_factor=config.get("REQUEST_RETRY_BACKOFF_FACTOR", 0.5),
+        status_forcelist=config.get("REQUEST_RETRY_STATUS", (502, 503, 504)),
+        raise_on_status=False,  # return the last response to allow raise_for_status
+    )
+    for prefix in ("http://", "https://"):
+        adapter = PooledHTTPAdapter(
+            timeout=(
+                config.get("REQUEST_CONNECT_TIMEOUT", 10),
+                config.get("REQUEST_READ_TIMEOUT", 5 * 60),
+            ),
+            tcp_keepalive=config.get("REQUEST_TCP_KEEPALIVE", True),
+            pool_connections=config.get("REQUEST_POOL_CONNECTIONS", 10),
+            pool_maxsize=config.get("REQUEST_POOL_MAXSIZE", 10),
+            pool_block=config.get("REQUEST_POOL_BLOCK", False),
+            max_retries=retries,
+        )
+        old_adapter = session.adapters.get(prefix)
+        session.mount(prefix, adapter)
+        if old_adapter is not None:
+            old_adapter.close()  # close the pooled connections of the replaced adapter
+
+
+def get_url_cache(app: Flask) -> Optional[UrlCache]:
+    """Get the URL cache of the app (None if the cache is not enabled).
+
+    The cache is enabled by setting ``"URL_CACHE_PATH"`` in the app config.
+    A relative path will be interpreted relative to the app instance folder.
+    The size budget of the cache can be set with ``"URL_CACHE_MAX_SIZE"`` (in bytes)
+    and the maximum size of a single cached response with ``"URL_CACHE_MAX_ENTRY_SIZE"``.
+    """
+    if "url_cache" not in app.extensions:
+        cache: Optional[UrlCache] = None
+        cache_path = app.config.get("URL_CACHE_PATH")
+        if cache_path:
+            cache = UrlCache(
+                Path(app.instance_path) / cache_path,
+                max_size=app.config.get("URL_CACHE_MAX_SIZE", 2**30),
+                max_entry_size=app.config.get("URL_CACHE_MAX_ENTRY_SIZE"),
+            )
+        app.extensions["url_cache"] = cache
+    return app.extensions["url_cache"]
+
+
+def _open_local_task_file(app: Flask, url: str, **kwargs) -> Optional[Response]:
+    """Open a task file from the local file store directly if the URL points to the files api of this app.
+
+    The URL must contain the correct security tag of the file. Returns None
+    if the file cannot be read directly, e.g. because the URL points to
+    another plugin runner or the file is not on this machine.
+    """
+    url_parts = urlsplit(url)
+    if url_parts.scheme not in ("http", "https") or not is_plain_get_request(**kwargs):
+        return None
+    try:
+        endpoint, values = app.url_map.bind(url_parts.netloc).match(
+            url_parts.path, method="GET"
+        )
+    except HTTPException:
+        return None  # the URL does not point to an endpoint of this app
+    if endpoint != "files-api.FileView":
+        return None
+
+    # imported here to avoid circular imports
+    from .api.files_api import _is_local_file
+    from .db.models.tasks import TaskFile
+    from .util.request_helpers import build_file_response
+
+    security_tag = parse_qs(url_parts.query).get("file-id", [None])[0]
+    task_file: Optional[TaskFile] = TaskFile.get_by_id(values["file_id"])
+    if (
+        task_file is None
+        or task_file.security_tag != security_tag
+        or not _is_local_file(task_file)
+    ):
+        # also protects against matching URLs of other plugin runners
+        # as the security tag is a random token unique to this file
+        return None
+    try:
+        response = build_file_response(
+            url,
+            task_file.file_storage_data,
+            mimetype=task_file.mimetype,
+            content_encoding=task_file.content_encoding,
+            size=task_file.file_size,
+        )
+    except OSError:
+        return None  # the file is not accessible from this machine
+    if task_file.content_hash:
+        response.headers["ETag"] = f'"{task_file.content_hash}"'
+    if not kwargs.get("stream", False):
+        # read the body immediately like requests does for requests without streaming
+        response.content
+        response.raw.close()
+    return response
+
+
+def open_url(
+    url: str, raise_on_error_status=True, use_cache: bool = True, **kwargs
+) -> Response:
     """Open an url with request.
 
     (see :py:meth:`~requests.Session.request` for parameters)
@@ -35,7 +197,15 @@ def open_url(url: str, raise_on_error_status=True, **kwargs) -> Response:
     For streaming access set ``stream=True``.
 
     An appropriate exception is raised for an error status. To ignore an error status set ``raise_on_error_status=False``.
+
+    Task files of this plugin runner stored in the local file system (URLs of the
+    files api with a valid security tag) are read directly from the disk. Set
+    ``"URL_LOCAL_FILE_SHORTCUT"`` to ``False`` in the app config to disable this.
+
+    If the URL cache is enabled (see :py:func:`get_url_cache`) responses are
+    read from and stored in the cache. Set ``use_cache=False`` to bypass the cache.
     """
+    cache: Optional[UrlCache] = None
     if current_app:
         # apply rewrite rules from the current app context in sequence
         app: Flask = current_app
@@ -43,8 +213,17 @@ def open_url(url: str, raise_on_error_status=True, **kwargs) -> Response:
         replacement: str
         for pattern, replacement in app.config.get("URL_REWRITE_RULES", []):
             url = pattern.sub(replacement, url)
+        if app.config.get("URL_LOCAL_FILE_SHORTCUT", True):
+            response = _open_local_task_file(app, url, **kwargs)
+            if response is not None:
+                return response
+        if use_cache:
+            cache = get_url_cache(app)
 
-    url_data = REQUEST_SESSION.get(url, **kwargs)
+    if cache is not None and cache.is_cacheable_request(url, **kwargs):
+        url_data = cache.open(REQUEST_SESSION, url, **kwargs)
+    else:
+        url_data = REQUEST_SESSION.get(url, **kwargs)
     if raise_on_error_status:
         url_data.raise_for_status()
     return url_data
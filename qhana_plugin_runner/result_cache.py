@@ -0,0 +1,261 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing an opt-in cache for the results of processing tasks.
+
+Plugins with deterministic results can reuse the result files of an earlier
+task with the same task name, plugin version, parameters and inputs instead of
+computing them again::
+
+    db_task = ProcessingTask(task_name=calculation_task.name, parameters=...)
+    db_task.save(commit=True)
+    if complete_task_from_result_cache(
+        db_task, MyPlugin.instance.version, input_urls=[arguments.input_url]
+    ):
+        return redirect(url_for("tasks-api.TaskView", task_id=str(db_task.id)), HTTPStatus.SEE_OTHER)
+    # start the celery tasks as usual
+
+Results of tasks that finish successfully (see :py:func:`~qhana_plugin_runner.tasks.save_task_result`)
+are added to the cache. The inputs are identified by the ETag (or ``Last-Modified``
+header) of their URL without downloading them, tasks with inputs without these
+headers do not use the cache (see :py:func:`get_input_fingerprint`).
+
+Config keys:
+
+* ``"TASK_RESULT_CACHE_TTL"``: the time (in seconds) a result can be reused (``0`` disables the cache)
+* ``"TASK_RESULT_CACHE_MAX_SIZE"``: the maximum size (in bytes) of all cached result files,
+  the least recently used results are evicted first (``None`` for no limit)
+"""
+
+from datetime import datetime, timedelta
+from hashlib import sha256
+from json import dumps, loads
+from os import stat
+from secrets import token_urlsafe
+from typing import Any, Optional, Sequence
+
+from flask import current_app
+from requests.exceptions import RequestException
+from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import delete, select
+
+from qhana_plugin_runner.db.db import DB
+from qhana_plugin_runner.db.models.tasks import (
+    ProcessingTask,
+    TaskFile,
+    TaskResultCacheEntry,
+)
+from qhana_plugin_runner.requests import open_url
+from qhana_plugin_runner.task_events import TASK_FINISHED_EVENT, publish_task_event
+from qhana_plugin_runner.util.request_helpers import get_local_file_path
+
+
+def _get_ttl() -> int:
+    return current_app.config.get("TASK_RESULT_CACHE_TTL", 7 * 24 * 60 * 60)
+
+
+def _normalize_parameters(parameters: str) -> Any:
+    """Parse JSON parameters to make the cache key independent of their formatting and key order."""
+    try:
+        return loads(parameters)
+    except ValueError:
+        return parameters
+
+
+def get_input_fingerprint(url: str) -> Optional[str]:
+    """Get a string identifying the current content of an input URL without downloading it.
+
+    ``data:`` URLs contain their content and are hashed directly. For other URLs
+    the ``ETag`` or ``Last-Modified`` header of the response is used (task files
+    of this plugin runner have their content hash as ETag). Local files are
+    identified by their modification time and size.
+
+    Raises:
+        RequestException: if the URL cannot be opened
+
+    Returns:
+        Optional[str]: the fingerprint or None if the content cannot be identified without reading it
+    """
+    if url.startswith("data:"):
+        return f"sha256:{sha256(url.encode()).hexdigest()}"
+    with open_url(url, stream=True) as response:
+        etag = response.headers.get("ETag")
+        if etag:
+            return f"etag:{url} {etag}"
+        last_modified = response.headers.get("Last-Modified")
+        if last_modified:
+            size = response.headers.get("Content-Length", "")
+            return f"last-modified:{url} {last_modified} {size}"
+        local_path = get_local_file_path(response)
+        if local_path is not None:
+            file_stat = stat(local_path)
+            return f"file:{local_path} {file_stat.st_mtime_ns} {file_stat.st_size}"
+    return None  # hashing the content would block the request for large inputs
+
+
+def get_result_cache_key(
+    task_name: str,
+    plugin_version: str,
+    parameters: str,
+    input_fingerprints: Sequence[str],
+) -> str:
+    """Get the key of a task result in the result cache.
+
+    Args:
+        task_name (str): the name of the task
+        plugin_version (str): the version of the plugin computing the result
+        parameters (str): the parameters of the task (JSON parameters are normalized)
+        input_fingerprints (Sequence[str]): the fingerprints of the inputs (see :py:func:`get_input_fingerprint`)
+
+    Returns:
+        str: the sha256 hash of all arguments
+    """
+    key_data = {
+        "task": task_name,
+        "version": plugin_version,
+        "parameters": _normalize_parameters(parameters),
+        "inputs": list(input_fingerprints),
+    }
+    key = dumps(key_data, sort_keys=True, separators=(",", ":"))
+    return sha256(key.encode()).hexdigest()
+
+
+def complete_task_from_result_cache(
+    task: ProcessingTask, plugin_version: str, input_urls: Sequence[Optional[str]]
+) -> bool:
+    """Complete the task with the result of an earlier identical task if it is in the result cache.
+
+    On a cache hit the result files of the earlier task are attached to the
+    task (the files are shared, not copied) and the task is finished immediately.
+    Otherwise the cache key is stored in the task to add its result to the cache
+    once it finished successfully.
+
+    Args:
+        task (ProcessingTask): the new task (with task name and parameters set)
+        plugin_version (str): the version of the plugin computing the result
+        input_urls (Sequence[Optional[str]]): the URLs of all inputs of the task (empty URLs are ignored)
+
+    Returns:
+        bool: True if the task was completed from the cache, False if the task must be started
+    """
+    if not _get_ttl():
+        return False  # cache is disabled
+    try:
+        fingerprints = [get_input_fingerprint(url) for url in input_urls if url]
+    except (RequestException, OSError) as err:
+        current_app.logger.info(
+            f"Result cache not used for task {task.id}, inputs are not accessible: {err!r}"
+        )
+        return False
+    if None in fingerprints:
+        current_app.logger.info(
+            f"Result cache not used for task {task.id}, inputs have no ETag or Last-Modified header."
+        )
+        return False
+    task.result_cache_key = get_result_cache_key(
+        task.task_name, plugin_version, task.parameters, fingerprints
+    )
+    now = datetime.utcnow()
+    entry = TaskResultCacheEntry.get_latest(
+        task.result_cache_key, created_after=now - timedelta(seconds=_get_ttl())
+    )
+    cached_task = ProcessingTask.get_by_id(entry.task_id) if entry else None
+    if entry is None or cached_task is None:
+        task.save(commit=True)
+        return False
+
+    file_: TaskFile
+    for file_ in TaskFile.get_task_result_files(cached_task):
+        TaskFile(
+            task=task,
+            security_tag=token_urlsafe(32),
+            storage_provider=file_.storage_provider,
+            file_name=file_.file_name,
+            file_storage_data=file_.file_storage_data,
+            file_type=file_.file_type,
+            mimetype=file_.mimetype,
+            file_size=file_.file_size,
+            content_hash=file_.content_hash,
+            content_encoding=file_.content_encoding,
+        ).save()
+    entry.last_used_at = now
+
+    if cached_task.progress_value:
+        task.progress_start = cached_task.progress_start
+        task.progress_target = cached_task.progress_target
+        task.progress_unit = cached_task.progress_unit
+        task.progress_value = cached_task.progress_target
+    task.task_status = "SUCCESS"
+    task.finished_at = now
+    task.add_task_log_entry(
+        f"Reused the result of task {cached_task.id} from the result cache."
+    )
+    cached_log = cached_task.task_log
+    if cached_log:
+        task.add_task_log_entry(cached_log)
+    task.save(commit=True)
+    publish_task_event(task.id, TASK_FINISHED_EVENT)
+    return True
+
+
+def add_task_result_to_cache(task: ProcessingTask, commit: bool = True):
+    """Add the result files of a successfully finished task to the result cache.
+
+    Only tasks with a :py:attr:`~qhana_plugin_runner.db.models.tasks.ProcessingTask.result_cache_key`
+    (see :py:func:`complete_task_from_result_cache`) are added. Evicts old entries
+    afterwards (see :py:func:`evict_result_cache_entries`).
+    """
+    if not task.result_cache_key or task.multi_step or not _get_ttl():
+        return
+    size = sum(file_.file_size or 0 for file_ in TaskFile.get_task_result_files(task))
+    TaskResultCacheEntry(
+        cache_key=task.result_cache_key, task_id=task.id, size=size
+    ).save()
+    evict_result_cache_entries(commit=commit)
+
+
+def evict_result_cache_entries(commit: bool = True) -> int:
+    """Remove expired entries and the least recently used entries exceeding the size limit from the result cache.
+
+    Only the cache entries are removed, the tasks and their result files are kept.
+
+    Returns:
+        int: the number of removed entries
+    """
+    max_size: Optional[int] = current_app.config.get("TASK_RESULT_CACHE_MAX_SIZE")
+    expired_before = datetime.utcnow() - timedelta(seconds=_get_ttl())
+    removed = DB.session.execute(
+        delete(TaskResultCacheEntry)
+        .where(TaskResultCacheEntry.created_at <= expired_before)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if max_size is not None:
+        total_size = DB.session.execute(
+            select(func.coalesce(func.sum(TaskResultCacheEntry.size), 0))
+        ).scalar_one()
+        if total_size > max_size:
+            entries = DB.session.execute(
+                select(TaskResultCacheEntry).order_by(
+                    TaskResultCacheEntry.last_used_at, TaskResultCacheEntry.id
+                )
+            ).scalars()
+            for entry in entries:
+                if total_size <= max_size:
+                    break
+                DB.session.delete(entry)
+                total_size -= entry.size
+                removed += 1
+    if commit:
+        DB.session.commit()
+    return removed
@@ -14,15 +14,95 @@
 
 """Module containing a file store interface with a implementation for the local file system."""
 
+from contextlib import contextmanager
+from hashlib import sha256
+from io import BufferedWriter, RawIOBase, TextIOWrapper
+from os import replace, sep
 from pathlib import Path
 from secrets import token_urlsafe
-from shutil import copyfileobj
-from typing import IO, BinaryIO, ClassVar, Dict, Optional, TextIO, Type, Union
+from shutil import copyfileobj, rmtree
+from tempfile import SpooledTemporaryFile
+from time import time
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    ClassVar,
+    ContextManager,
+    Dict,
+    Iterator,
+    Optional,
+    TextIO,
+    Type,
+    Union,
+)
 
 from flask.app import Flask
 from flask.helpers import url_for
+from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import select
 
+from qhana_plugin_runner.db.db import DB
 from qhana_plugin_runner.db.models.tasks import ProcessingTask, TaskFile
+from qhana_plugin_runner.util.compression import (
+    CONTENT_ENCODING_SUFFIXES,
+    get_content_encoding,
+    is_compressible,
+    open_compressing_writer,
+)
+
+WRITER_BUFFER_SIZE = 2**20
+"""The buffer size of the streams returned by the task file writers."""
+
+
+class HashingWriter(RawIOBase):
+    """A write only stream that forwards all data to a target stream.
+
+    Counts the written bytes and computes the sha256 hash of the content on the fly.
+    Closing this stream does not close the target stream.
+    """
+
+    def __init__(self, target: IO[bytes]) -> None:
+        super().__init__()
+        self.target = target
+        self.size = 0
+        self._hash = sha256()
+
+    @property
+    def content_hash(self) -> str:
+        """The hex encoded sha256 hash of all data written so far."""
+        return self._hash.hexdigest()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        view = memoryview(data).cast("B")
+        self.target.write(view)
+        self._hash.update(view)
+        self.size += len(view)
+        return len(view)
+
+
+def _get_file_mode(file_: IO) -> str:
+    """Guess if a file object is opened in text (``"w"``) or binary (``"wb"``) mode."""
+    if isinstance(file_, TextIO):
+        return "w"
+    elif isinstance(file_, BinaryIO):
+        return "wb"
+    elif hasattr(file_, "mode"):
+        # try to guess if text or binary mode was used
+        return "wb" if ("b" in file_.mode) else "w"
+    raise ValueError("Cannot determine mode of file object!")
+
+
+def _seek_to_start(file_: IO):
+    """Seek to the beginning of a file (useful for in memory temp files that were just written)."""
+    if hasattr(file_, "seek") and callable(file_.seek):
+        try:
+            file_.seek(0)
+        except Exception:
+            pass  # assume the file object does not support seek
 
 
 class FileStoreInterface:
@@ -92,6 +172,75 @@ class FileStoreInterface:
         """
         raise NotImplementedError()
 
+    def open_task_result_writer(
+        self,
+        task_db_id: int,
+        file_name: str,
+        file_type: str,
+        mimetype: str,
+        mode: str = "t",
+        encoding: str = "utf-8",
+        commit: bool = True,
+    ) -> ContextManager[IO]:
+        """Open a writable stream for a task result file that is written directly to the storage.
+
+        The file information is stored in the database (including the size and the
+        sha256 hash of the content) when the context manager exits without an exception.
+
+        Usage::
+
+            with STORE.open_task_result_writer(
+                db_id, "entities.json", "entity/list", "application/json"
+            ) as output:
+                save_entities(entities, output, "application/json")
+
+        Args:
+            task_db_id (int): the id of the task in the database
+            file_name (str): the file name of the result file
+            file_type (str): the file type tag
+            mimetype (str): the mime type of the file (not optional for result files!)
+            mode (str, optional): "t" to get a text stream and "b" to get a binary stream. Defaults to "t".
+            encoding (str, optional): the encoding of text streams. Defaults to "utf-8".
+            commit (bool): if true commits the current DB transaction. Defaults to True.
+
+        Raises:
+            KeyError: if the task could not be found in the database
+
+        Returns:
+            ContextManager[IO]: a context manager yielding the writable stream
+        """
+        raise NotImplementedError()
+
+    def delete_task_file(self, file_info: TaskFile, commit: bool = True):
+        """Delete a task file from the storage and remove the file information from the database.
+
+        Args:
+            file_info (TaskFile): the information of the task file to delete
+            commit (bool): if true commits the current DB transaction. Defaults to True.
+        """
+        raise NotImplementedError()
+
+    def can_delete_task_file(self, file_info: TaskFile) -> bool:
+        """Check if :py:meth:`delete_task_file` is implemented for the task file.
+
+        Args:
+            file_info (TaskFile): the information of the task file
+
+        Returns:
+            bool: True if the file store of the task file can delete it
+        """
+        return type(self).delete_task_file is not FileStoreInterface.delete_task_file
+
+    def collect_garbage(self) -> int:
+        """Remove stored files that are no longer referenced by any task file.
+
+        File stores that cannot find unreferenced files do nothing.
+
+        Returns:
+            int: the number of removed files (or folders)
+        """
+        return 0
+
     def get_file_url(self, file_storage_data: str, external: bool = True) -> str:
         """Get a URL to the stored file.
 
@@ -211,6 +360,21 @@ class FileStore(FileStoreInterface):
         Returns:
             TaskFile: the file information stored in the database
         """
+        if self._supports_writer():
+            # stream the file through the writer to record its size and hash
+            mode = "b" if isinstance(file_, bytes) else "t"
+            if not isinstance(file_, (str, bytes)):
+                mode = "b" if "b" in _get_file_mode(file_) else "t"
+                _seek_to_start(file_)
+            with self._open_task_file_writer(
+                task_db_id, target, file_name, file_type, mimetype, mode, commit=commit
+            ) as writer:
+                if isinstance(file_, (str, bytes)):
+                    writer.write(file_)
+                else:
+                    copyfileobj(file_, writer)
+            return writer.file_info
+
         task = ProcessingTask.get_by_id(task_db_id)
         if not task:
             raise KeyError(f"No task with database id {task_db_id} found!")
@@ -229,6 +393,157 @@ class FileStore(FileStoreInterface):
         file_info.save(commit)
         return file_info
 
+    def _supports_writer(self) -> bool:
+        """True if the file store implements :py:meth:`_open_target_writer`."""
+        return type(self)._open_target_writer is not FileStore._open_target_writer
+
+    def _open_target_writer(
+        self, target: Union[Path, str], mimetype: str
+    ) -> ContextManager[IO[bytes]]:
+        """Open a binary stream writing directly to the target on the storage.
+
+        File store implementations that can write files incrementally should
+        implement this method. The stored file must be complete when the context
+        manager exits without an exception. If an exception is raised in the
+        context, the partially written file should be removed.
+
+        Args:
+            target (Union[Path, str]): the target path or filename
+            mimetype (str): the mime type of the file
+
+        Returns:
+            ContextManager[IO[bytes]]: a context manager yielding the writable stream
+        """
+        raise NotImplementedError()
+
+    def _get_content_encoding(self, mimetype: Optional[str]) -> Optional[str]:
+        """Get the content coding to compress a new file with (None for no compression).
+
+        Files are only compressed if ``"FILE_STORE_COMPRESSION"`` is set in the
+        app config (to ``"gzip"`` or ``"zstd"``) and if the mimetype compresses well.
+        """
+        if self.app is None or not is_compressible(mimetype):
+            return None
+        return self.app.config.get("FILE_STORE_COMPRESSION")
+
+    def _finish_target(
+        self,
+        target: Union[Path, str],
+        target_file: IO[bytes],
+        content_hash: str,
+        content_encoding: Optional[str],
+    ) -> str:
+        """Finish a file written with :py:meth:`_open_target_writer`.
+
+        Called after the target stream was closed successfully.
+
+        Args:
+            target (Union[Path, str]): the target path or filename
+            target_file (IO[bytes]): the (closed) stream returned by :py:meth:`_open_target_writer`
+            content_hash (str): the hex encoded sha256 hash of the (uncompressed) file content
+            content_encoding (Optional[str]): the content coding used to compress the file
+
+        Returns:
+            str: the file identifier stored in :py:attr:`~qhana_plugin_runner.db.models.tasks.TaskFile.file_storage_data`
+        """
+        return self._get_file_identifier(target)
+
+    @contextmanager
+    def _open_task_file_writer(
+        self,
+        task_db_id: int,
+        target: Union[Path, str],
+        file_name: str,
+        file_type: str,
+        mimetype: Optional[str] = None,
+        mode: str = "t",
+        encoding: str = "utf-8",
+        commit: bool = True,
+    ) -> Iterator[IO]:
+        """Open a writable stream for a task file and store the file information on success.
+
+        The stored :py:class:`~qhana_plugin_runner.db.models.tasks.TaskFile` is
+        available as the ``file_info`` attribute of the stream after the context
+        manager exited.
+
+        File stores that do not implement :py:meth:`_open_target_writer` get a
+        temporary file that is persisted with :py:meth:`persist_file` on exit.
+
+        Files are compressed transparently if compression is configured
+        (see :py:meth:`_get_content_encoding`). The size and hash stored in the
+        file information always refer to the uncompressed content.
+        """
+        task = ProcessingTask.get_by_id(task_db_id)
+        if not task:
+            raise KeyError(f"No task with database id {task_db_id} found!")
+        if not mimetype:
+            mimetype = "application/octet-stream"
+        if mode not in ("t", "b"):
+            raise ValueError(f"Unsupported mode '{mode}', use 't' or 'b'.")
+        if not self._supports_writer():
+            # file stores without a writer can only persist complete files
+            with SpooledTemporaryFile(max_size=WRITER_BUFFER_SIZE) as buffer:
+                hashing_writer = HashingWriter(buffer)
+                spooled_stream: Any = BufferedWriter(
+                    hashing_writer, buffer_size=WRITER_BUFFER_SIZE
+                )
+                if mode == "t":
+                    spooled_stream = TextIOWrapper(spooled_stream, encoding=encoding)
+                yield spooled_stream
+                spooled_stream.close()  # does not close the temporary file
+                buffer.seek(0)
+                self.persist_file(buffer, target, mimetype)
+            file_info = TaskFile(
+                task=task,
+                security_tag=token_urlsafe(32),
+                storage_provider=self.name,
+                file_name=file_name,
+                file_storage_data=self._get_file_identifier(target),
+                file_type=file_type,
+                mimetype=mimetype,
+                file_size=hashing_writer.size,
+                content_hash=hashing_writer.content_hash,
+            )
+            file_info.save(commit)
+            spooled_stream.file_info = file_info
+            return
+        content_encoding = self._get_content_encoding(mimetype)
+        if content_encoding:
+            target = f"{target}{CONTENT_ENCODING_SUFFIXES[content_encoding]}"
+        with self._open_target_writer(target, mimetype) as target_file:
+            compressor: Optional[IO[bytes]] = None
+            if content_encoding:
+                compressor = open_compressing_writer(
+                    target_file,
+                    content_encoding,
+                    level=self.app.config.get("FILE_STORE_COMPRESSION_LEVEL"),
+                )
+            hashing_writer = HashingWriter(compressor if compressor else target_file)
+            stream: Any = BufferedWriter(hashing_writer, buffer_size=WRITER_BUFFER_SIZE)
+            if mode == "t":
+                stream = TextIOWrapper(stream, encoding=encoding)
+            yield stream
+            stream.close()  # flushes all buffered data to the target
+            if compressor:
+                compressor.close()  # writes the end of the compressed stream
+        file_storage_data = self._finish_target(
+            target, target_file, hashing_writer.content_hash, content_encoding
+        )
+        file_info = TaskFile(
+            task=task,
+            security_tag=token_urlsafe(32),
+            storage_provider=self.name,
+            file_name=file_name,
+            file_storage_data=file_storage_data,
+            file_type=file_type,
+            mimetype=mimetype,
+            file_size=hashing_writer.size,
+            content_hash=hashing_writer.content_hash,
+            content_encoding=content_encoding,
+        )
+        file_info.save(commit)
+        stream.file_info = file_info
+
     def persist_task_result(
         self,
         task_db_id: int,
@@ -262,6 +577,28 @@ class FileStore(FileStoreInterface):
             commit=commit,
         )
 
+    def open_task_result_writer(
+        self,
+        task_db_id: int,
+        file_name: str,
+        file_type: str,
+        mimetype: str,
+        mode: str = "t",
+        encoding: str = "utf-8",
+        commit: bool = True,
+    ) -> ContextManager[IO]:
+        target = Path(f"task_{task_db_id}/out") / Path(file_name)
+        return self._open_task_file_writer(
+            task_db_id,
+            target,
+            file_name,
+            file_type,
+            mimetype,
+            mode=mode,
+            encoding=encoding,
+            commit=commit,
+        )
+
     def get_task_file_url(self, file_info: TaskFile, external: bool = True) -> str:
         return self.get_file_url(file_info.file_storage_data, external=external)
 
@@ -269,6 +606,9 @@ class FileStore(FileStoreInterface):
 class LocalFileStore(FileStore, name="local_filesystem"):
     """A file store implementation using the local file system."""
 
+    orphan_grace_period: ClassVar[float] = 3600
+    """Task folders modified more recently than this (in seconds) are never removed as orphaned."""
+
     def __init__(self, app: Flask) -> None:
         super().__init__(app=app)
         self._root_path: Optional[Path] = None
@@ -307,29 +647,96 @@ class LocalFileStore(FileStore, name="local_filesystem"):
     def persist_file(
         self, file_: Union[IO, str, bytes], target: Union[str, Path], mimetype: str
     ):
-        mode: str  # mode to open target file with
         if isinstance(file_, (str, bytes)):
             self.persist_raw_data(file_, target, mimetype)
             return
-        elif isinstance(file_, TextIO):
-            mode = "w"
-        elif isinstance(file_, BinaryIO):
-            mode = "wb"
-        elif hasattr(file_, "mode"):
-            # try to guess if text or binary mode was used
-            mode = "wb" if ("b" in file_.mode) else "w"
-        else:
-            raise ValueError("Cannot determine mode of file object!")
-        if hasattr(file_, "seek") and callable(file_.seek):
-            try:  # seek to beginning of a file (useful for in memory temp files that were just written)
-                file_.seek(0)
-            except Exception:
-                pass  # assume the file object does not support seek
+        mode = _get_file_mode(file_)  # mode to open target file with
+        _seek_to_start(file_)
         target_path = self._get_storage_root() / self.prepare_path(target)
         target_path.parent.mkdir(parents=True, exist_ok=True)
         with target_path.open(mode=mode) as target_file:
             copyfileobj(file_, target_file)
 
+    @contextmanager
+    def _open_target_writer(
+        self, target: Union[Path, str], mimetype: str
+    ) -> Iterator[IO[bytes]]:
+        target_path = self._get_storage_root() / self.prepare_path(target)
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with target_path.open(mode="wb", buffering=0) as target_file:
+                yield target_file
+        except BaseException:
+            target_path.unlink(missing_ok=True)  # remove incomplete files
+            raise
+
+    def _is_shared_file(self, file_info: TaskFile) -> bool:
+        """Check if other task files reference the same file (e.g. results reused from the result cache)."""
+        query = (
+            select(func.count())
+            .select_from(TaskFile)
+            .filter(
+                TaskFile.storage_provider == file_info.storage_provider,
+                TaskFile.file_storage_data == file_info.file_storage_data,
+                TaskFile.id != file_info.id,
+            )
+        )
+        return DB.session.execute(query).scalar_one() > 0
+
+    def _remove_empty_folders(self, folder: Path):
+        """Remove the folder and its parents inside the storage root if they are empty."""
+        root = self._get_storage_root()
+        while folder != root and root in folder.parents:
+            try:
+                folder.rmdir()
+            except OSError:
+                return  # folder is not empty or was removed concurrently
+            folder = folder.parent
+
+    def delete_task_file(self, file_info: TaskFile, commit: bool = True):
+        if not self._is_shared_file(file_info):
+            path = Path(file_info.file_storage_data)
+            path.unlink(missing_ok=True)
+            self._remove_empty_folders(path.parent)
+        DB.session.delete(file_info)
+        if commit:
+            DB.session.commit()
+
+    def _is_referenced_folder(self, folder: Path) -> bool:
+        """Check if a task file references a file inside the folder (e.g. a result reused from the result cache)."""
+        query = (
+            select(func.count())
+            .select_from(TaskFile)
+            .filter(
+                TaskFile.file_storage_data.startswith(f"{folder}{sep}", autoescape=True)
+            )
+        )
+        return DB.session.execute(query).scalar_one() > 0
+
+    def collect_garbage(self) -> int:
+        """Remove the folders of deleted tasks (``task_<id>/``) that are not referenced by any task file.
+
+        Folders modified within the :py:attr:`orphan_grace_period` are kept.
+
+        Returns:
+            int: the number of removed folders
+        """
+        removed = 0
+        for folder in self._get_storage_root().glob("task_*"):
+            try:
+                task_id = int(folder.name[5:])
+                if time() - folder.stat().st_mtime < self.orphan_grace_period:
+                    continue
+            except (ValueError, FileNotFoundError):
+                continue  # not a task folder or removed concurrently
+            if ProcessingTask.get_by_id(task_id) is not None:
+                continue
+            if self._is_referenced_folder(folder):
+                continue
+            rmtree(folder, ignore_errors=True)
+            removed += 1
+        return removed
+
     def get_file_url(self, file_storage_data: str, external: bool = True) -> str:
         if not external:
             # return an internal file url
@@ -337,8 +744,10 @@ class LocalFileStore(FileStore, name="local_filesystem"):
         raise NotImplementedError()  # TODO implement endpoint to download files by file path
 
     def get_task_file_url(self, file_info: TaskFile, external: bool = True) -> str:
-        if not external:
+        if not external and not file_info.content_encoding:
             return super().get_task_file_url(file_info, external=external)
+        # compressed files are only decompressed when read through the files api
+        # (or the local file shortcut of open_url) as file:// URLs are read as is
         return url_for(
             "files-api.FileView",
             file_id=file_info.id,
@@ -347,6 +756,129 @@ class LocalFileStore(FileStore, name="local_filesystem"):
         )
 
 
+class ContentAddressedFileStore(LocalFileStore, name="content_addressed"):
+    """A file store implementation using the local file system that deduplicates task files.
+
+    Task files are stored as blobs named by the sha256 hash of their content
+    (under ``blobs/`` in the ``"FILE_STORE_ROOT_PATH"``). Task files with the
+    same content share one blob. A blob is removed when the last task file
+    referencing it is deleted.
+
+    Set the config option ``DEFAULT_FILE_STORE`` to ``"content_addressed"`` to
+    set this as the default file store.
+    """
+
+    blob_grace_period: ClassVar[float] = 3600
+    """Blobs modified more recently than this (in seconds) are never removed.
+
+    Gives concurrent writers of the same content time to store their task file
+    information before the blob is considered unreferenced.
+    """
+
+    def _get_blob_root(self) -> Path:
+        return self._get_storage_root() / "blobs"
+
+    def _get_blob_path(
+        self, content_hash: str, content_encoding: Optional[str] = None
+    ) -> Path:
+        blob_name = content_hash + CONTENT_ENCODING_SUFFIXES.get(content_encoding, "")
+        return self._get_blob_root() / content_hash[:2] / content_hash[2:4] / blob_name
+
+    @contextmanager
+    def _open_target_writer(
+        self, target: Union[Path, str], mimetype: str
+    ) -> Iterator[IO[bytes]]:
+        # the blob name is only known after the content was written
+        temp_path = self._get_blob_root() / "tmp" / token_urlsafe(16)
+        temp_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with temp_path.open(mode="xb", buffering=0) as temp_file:
+                yield temp_file
+        except BaseException:
+            temp_path.unlink(missing_ok=True)  # remove incomplete files
+            raise
+
+    def _finish_target(
+        self,
+        target: Union[Path, str],
+        target_file: IO[bytes],
+        content_hash: str,
+        content_encoding: Optional[str],
+    ) -> str:
+        temp_path = Path(target_file.name)
+        blob_path = self._get_blob_path(content_hash, content_encoding)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        # replacing an existing blob is safe as the content is identical,
+        # the new modification time protects the blob from concurrent deletes
+        replace(temp_path, blob_path)
+        return str(blob_path)
+
+    def count_blob_references(
+        self, content_hash: str, content_encoding: Optional[str] = None
+    ) -> int:
+        """Count the task files referencing the blob with the given content hash (and compression)."""
+        query = (
+            select(func.count())
+            .select_from(TaskFile)
+            .filter_by(
+                storage_provider=self.name,
+                content_hash=content_hash,
+                content_encoding=content_encoding,
+            )
+        )
+        return DB.session.execute(query).scalar_one()
+
+    def _remove_blob_if_unreferenced(
+        self, content_hash: str, content_encoding: Optional[str] = None
+    ) -> bool:
+        blob_path = self._get_blob_path(content_hash, content_encoding)
+        try:
+            if time() - blob_path.stat().st_mtime < self.blob_grace_period:
+                return False
+        except FileNotFoundError:
+            return False
+        if self.count_blob_references(content_hash, content_encoding) > 0:
+            return False
+        blob_path.unlink(missing_ok=True)
+        return True
+
+    def delete_task_file(self, file_info: TaskFile, commit: bool = True):
+        content_hash, content_encoding = (
+            file_info.content_hash,
+            file_info.content_encoding,
+        )
+        DB.session.delete(file_info)
+        DB.session.flush()
+        if content_hash:
+            self._remove_blob_if_unreferenced(content_hash, content_encoding)
+        if commit:
+            DB.session.commit()
+
+    def collect_garbage(self) -> int:
+        """Remove all unreferenced blobs, stale temporary files and folders of deleted tasks.
+
+        Blobs and temporary files modified within the :py:attr:`blob_grace_period` are kept.
+
+        Returns:
+            int: the number of removed files
+        """
+        blob_root = self._get_blob_root()
+        removed = super().collect_garbage()
+        for temp_path in (blob_root / "tmp").glob("*"):
+            try:
+                if time() - temp_path.stat().st_mtime >= self.blob_grace_period:
+                    temp_path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass  # removed concurrently
+        for blob_path in blob_root.glob("??/??/*"):
+            content_hash, suffix = blob_path.name[:64], blob_path.name[64:]
+            content_encoding = get_content_encoding(blob_path) if suffix else None
+            if self._remove_blob_if_unreferenced(content_hash, content_encoding):
+                removed += 1
+        return removed
+
+
 class UrlFileStore(FileStore, name="url_file_store"):
     """A file store implementation using url references."""
 
@@ -390,6 +922,12 @@ class UrlFileStore(FileStore, name="url_file_store"):
         file_info.save(commit)
         return file_info
 
+    def delete_task_file(self, file_info: TaskFile, commit: bool = True):
+        # only the reference is stored, the referenced file is not owned by this store
+        DB.session.delete(file_info)
+        if commit:
+            DB.session.commit()
+
     def get_file_url(self, file_storage_data: str, external: bool = True) -> str:
         return file_storage_data
 
@@ -520,6 +1058,53 @@ class FileStoreRegistry(FileStoreInterface):
             raise NotImplementedError()
         return self._stores[storage_provider].get_task_file_url(file_info, external)
 
+    def open_task_result_writer(
+        self,
+        task_db_id: int,
+        file_name: str,
+        file_type: str,
+        mimetype: str,
+        mode: str = "t",
+        encoding: str = "utf-8",
+        commit: bool = True,
+        storage_provider: Optional[str] = None,
+    ) -> ContextManager[IO]:
+        if storage_provider is None:
+            storage_provider = self._default_store
+        if storage_provider is None:
+            raise NotImplementedError()
+        return self._stores[storage_provider].open_task_result_writer(
+            task_db_id,
+            file_name,
+            file_type,
+            mimetype,
+            mode=mode,
+            encoding=encoding,
+            commit=commit,
+        )
+
+    def delete_task_file(self, file_info: TaskFile, commit: bool = True):
+        storage_provider = (
+            file_info.storage_provider
+            if file_info.storage_provider
+            else self._default_store
+        )
+        if storage_provider is None:
+            raise NotImplementedError()
+        self._stores[storage_provider].delete_task_file(file_info, commit=commit)
+
+    def can_delete_task_file(self, file_info: TaskFile) -> bool:
+        storage_provider = (
+            file_info.storage_provider
+            if file_info.storage_provider
+            else self._default_store
+        )
+        store = self._stores.get(storage_provider) if storage_provider else None
+        return store is not None and store.can_delete_task_file(file_info)
+
+    def collect_garbage(self) -> int:
+        return sum(store.collect_garbage() for store in self._stores.values())
+
 
 # The file store registry that should be imported and used
 STORE: FileStoreRegistry = FileStoreRegistry()
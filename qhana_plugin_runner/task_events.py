@@ -0,0 +1,213 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing the notifications about changed tasks.
+
+Notifications only contain the name of the event (e.g. ``"step"``), subscribers
+load the current state of the task from the database. Notifications are sent
+with Redis pub/sub to reach subscribers in all processes (e.g. the task status
+event stream of the API). The in-process broker is only meant for tests and
+single process setups.
+"""
+
+from collections import defaultdict
+from queue import Empty, Queue
+from threading import Lock
+from time import monotonic
+from typing import DefaultDict, Optional, Set
+
+from flask import Flask, current_app
+from redis import Redis, RedisError
+
+TASK_STATUS_EVENT = "status"
+"""Event for changes of the task status or progress (also used for the first event of a stream)."""
+TASK_STEP_EVENT = "step"
+"""Event for a new step of a multi-step task."""
+TASK_FINISHED_EVENT = "finished"
+"""Event for a task that finished (successfully or with an error)."""
+
+
+class TaskEventSubscription:
+    """A subscription to the events of a single task. Close it after use."""
+
+    def get(self, timeout: float) -> Optional[str]:
+        """Wait for the next event.
+
+        Args:
+            timeout (float): the maximum time to wait in seconds
+
+        Returns:
+            Optional[str]: the name of the event or None if no event was received in time
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """End the subscription (closing it multiple times is allowed)."""
+        raise NotImplementedError()
+
+    def __enter__(self) -> "TaskEventSubscription":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TaskEventBroker:
+    """Base class of the brokers distributing task events."""
+
+    def publish(self, task_id: int, event: str):
+        """Notify all subscribers of the task about the event."""
+        raise NotImplementedError()
+
+    def subscribe(self, task_id: int) -> TaskEventSubscription:
+        """Subscribe to the events of the task (only events published after subscribing are received)."""
+        raise NotImplementedError()
+
+
+class _InProcessTaskEventSubscription(TaskEventSubscription):
+    def __init__(self, broker: "InProcessTaskEventBroker", task_id: int) -> None:
+        self.broker = broker
+        self.task_id = task_id
+        self.queue: "Queue[str]" = Queue()
+
+    def get(self, timeout: float) -> Optional[str]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class InProcessTaskEventBroker(TaskEventBroker):
+    """Broker distributing task events only inside the current process."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._subscriptions: DefaultDict[
+            int, Set[_InProcessTaskEventSubscription]
+        ] = defaultdict(set)
+
+    def publish(self, task_id: int, event: str):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(task_id, ()))
+        for subscription in subscriptions:
+            subscription.queue.put(event)
+
+    def subscribe(self, task_id: int) -> TaskEventSubscription:
+        subscription = _InProcessTaskEventSubscription(self, task_id)
+        with self._lock:
+            self._subscriptions[subscription.task_id].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: _InProcessTaskEventSubscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.task_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.task_id]
+
+
+class _RedisTaskEventSubscription(TaskEventSubscription):
+    def __init__(self, redis: Redis, channel: str) -> None:
+        self.pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+    def get(self, timeout: float) -> Optional[str]:
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            # get_message may return early with None (e.g. for subscribe messages)
+            message = self.pubsub.get_message(timeout=remaining)
+            if message is not None and message["type"] == "message":
+                return message["data"].decode()
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisTaskEventBroker(TaskEventBroker):
+    """Broker distributing task events with Redis pub/sub.
+
+    Args:
+        url (str): the URL of the Redis server
+        channel_prefix (str): the prefix of the pub/sub channels (one channel per task)
+    """
+
+    def __init__(self, url: str, channel_prefix: str) -> None:
+        self.redis = Redis.from_url(url)
+        self.channel_prefix = channel_prefix
+
+    def _get_channel(self, task_id: int) -> str:
+        return f"{self.channel_prefix}{task_id}"
+
+    def publish(self, task_id: int, event: str):
+        self.redis.publish(self._get_channel(task_id), event)
+
+    def subscribe(self, task_id: int) -> TaskEventSubscription:
+        return _RedisTaskEventSubscription(self.redis, self._get_channel(task_id))
+
+
+def get_task_event_broker(app: Flask) -> TaskEventBroker:
+    """Get the task event broker configured for the app.
+
+    The broker is configured with ``TASK_EVENTS_URL`` (``"memory://"`` for the
+    in-process broker). It defaults to the celery broker if it is a Redis server.
+    """
+    if "task_events" not in app.extensions:
+        url: Optional[str] = app.config.get("TASK_EVENTS_URL")
+        if not url:
+            url = app.config.get("CELERY", {}).get("broker_url")
+        broker: TaskEventBroker
+        if url and url.startswith(("redis://", "rediss://", "unix://")):
+            broker = RedisTaskEventBroker(
+                url,
+                app.config.get(
+                    "TASK_EVENTS_CHANNEL_PREFIX", "qhana_plugin_runner:task-events:"
+                ),
+            )
+        else:
+            if not app.testing:
+                app.logger.warning(
+                    "Task events are only distributed inside the current process, "
+                    "configure a Redis server with TASK_EVENTS_URL to notify "
+                    "subscribers about changes made by workers."
+                )
+            broker = InProcessTaskEventBroker()
+        app.extensions["task_events"] = broker
+    return app.extensions["task_events"]
+
+
+def publish_task_event(task_id: int, event: str = TASK_STATUS_EVENT):
+    """Notify the subscribers of a task about a change of the task.
+
+    Call this only after the change was committed to the database. Failing
+    notifications are only logged as clients can still poll the task status.
+
+    Args:
+        task_id (int): the database id of the task
+        event (str, optional): the name of the event. Defaults to TASK_STATUS_EVENT.
+    """
+    app: Flask = current_app._get_current_object()  # type: ignore
+    try:
+        get_task_event_broker(app).publish(task_id, event)
+    except RedisError as err:
+        app.logger.warning(
+            f"Could not publish event '{event}' for task with db id {task_id}: {err!r}"
+        )
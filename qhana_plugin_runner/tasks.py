@@ -1,11 +1,30 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from celery import Celery
 from celery.result import AsyncResult
 from celery.utils.log import get_task_logger
-from sqlalchemy.sql.expression import select
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.sql import sqltypes as sql
+from sqlalchemy.sql.expression import column, delete, exists, select, table
 
 from qhana_plugin_runner.db.db import DB
-from qhana_plugin_runner.db.models.tasks import ProcessingTask
+from qhana_plugin_runner.db.models.tasks import (
+    ProcessingTask,
+    TaskFile,
+    TaskLogEntry,
+    TaskResultCacheEntry,
+)
+from qhana_plugin_runner.result_cache import (
+    add_task_result_to_cache,
+    evict_result_cache_entries,
+)
+from qhana_plugin_runner.storage import STORE
+from qhana_plugin_runner.task_events import (
+    TASK_FINISHED_EVENT,
+    TASK_STEP_EVENT,
+    publish_task_event,
+)
 
 from .celery import CELERY
 
@@ -14,7 +33,6 @@ _name = "qhana-plugin-runner"
 TASK_LOGGER = get_task_logger(_name)
 
 
-# TODO add periodic cleanup task to remove old results from the database!
 @CELERY.task(name=f"{_name}.add-step", bind=True, ignore_result=True)
 def add_step(
     self,
@@ -63,6 +81,7 @@ def add_step(
 
     task_data.save(commit=True)
     TASK_LOGGER.debug(f"Save task log for task with db id '{db_id}' successful.")
+    publish_task_event(db_id, TASK_STEP_EVENT)
 
     AsyncResult(self.request.parent_id, app=CELERY).forget()
 
@@ -94,8 +113,10 @@ def save_task_result(self, task_log: str, db_id: int):
 
     task_data.save(commit=True)
     TASK_LOGGER.debug(f"Save task log for task with db id '{db_id}' successful.")
+    publish_task_event(db_id, TASK_FINISHED_EVENT)
 
-    # TODO: clean TaskData entries
+    # only added if the plugin uses the result cache
+    add_task_result_to_cache(task_data)
 
     AsyncResult(self.request.parent_id, app=CELERY).forget()
 
@@ -124,7 +145,155 @@ def save_task_error(self, failing_task_id: str, db_id: int):
     task_data.add_task_log_entry(f"{exc!r}\n\n{traceback}")
 
     task_data.save(commit=True)
-
-    # TODO: maybe clean TaskData entries
+    publish_task_event(db_id, TASK_FINISHED_EVENT)
 
     result.forget()
+
+
+_LEGACY_TASK_DATA = table("TaskData", column("id", sql.INTEGER()))
+"""The task data table of old databases (replaced by :py:attr:`ProcessingTask.data`)."""
+
+
+def _delete_task(task: ProcessingTask, delete_legacy_task_data: bool) -> bool:
+    """Delete the task with its files, steps and log entries without committing.
+
+    Returns:
+        bool: False if a task file could not be deleted (the task is kept)
+    """
+    task_files = (
+        DB.session.execute(select(TaskFile).filter(TaskFile.task_id == task.id))
+        .scalars()
+        .all()
+    )
+    for file_info in task_files:
+        # check all files first to not delete only some of the files of a kept task
+        if not STORE.can_delete_task_file(file_info):
+            TASK_LOGGER.warning(
+                f"Task with db id {task.id} is kept, the file store '{file_info.storage_provider}' cannot delete its file {file_info.id}."
+            )
+            return False
+    for file_info in task_files:
+        STORE.delete_task_file(file_info, commit=False)
+    # log entries have no relationship with the task that could cascade the delete
+    DB.session.execute(delete(TaskLogEntry).where(TaskLogEntry.task_id == task.id))
+    if delete_legacy_task_data:
+        DB.session.execute(
+            delete(_LEGACY_TASK_DATA).where(_LEGACY_TASK_DATA.c.id == task.id)
+        )
+    DB.session.delete(task)  # also deletes the steps
+    return True
+
+
+def delete_old_tasks(finished_before: datetime, batch_size: int = 100) -> int:
+    """Delete finished tasks with their files, steps and log entries.
+
+    Tasks with results in the result cache are kept until the cache entry is
+    evicted. Each batch of tasks is deleted in its own transaction.
+
+    Args:
+        finished_before (datetime): only delete tasks that finished before this moment
+        batch_size (int, optional): the number of tasks deleted per transaction. Defaults to 100.
+
+    Returns:
+        int: the number of deleted tasks
+    """
+    delete_legacy_task_data = inspect(DB.session.connection()).has_table("TaskData")
+    is_cached = exists().where(TaskResultCacheEntry.task_id == ProcessingTask.id)
+    deleted = 0
+    last_id = 0
+    while True:
+        query = (
+            select(ProcessingTask)
+            .filter(
+                ProcessingTask.finished_at < finished_before,
+                ProcessingTask.id > last_id,
+                ~is_cached,
+            )
+            .order_by(ProcessingTask.id)
+            .limit(batch_size)
+        )
+        tasks = DB.session.execute(query).scalars().all()
+        if not tasks:
+            return deleted
+        last_id = tasks[-1].id  # skip kept tasks in the next batch
+        for task in tasks:
+            if _delete_task(task, delete_legacy_task_data):
+                deleted += 1
+        DB.session.commit()
+
+
+def delete_old_temp_files(finished_before: datetime, batch_size: int = 100) -> int:
+    """Delete the temporary files (``"temp-file"``) of finished tasks.
+
+    Args:
+        finished_before (datetime): only delete files of tasks that finished before this moment
+        batch_size (int, optional): the number of files deleted per transaction. Defaults to 100.
+
+    Returns:
+        int: the number of deleted files
+    """
+    deleted = 0
+    last_id = 0
+    while True:
+        query = (
+            select(TaskFile)
+            .join(ProcessingTask, TaskFile.task_id == ProcessingTask.id)
+            .filter(
+                TaskFile.file_type == "temp-file",
+                ProcessingTask.finished_at < finished_before,
+                TaskFile.id > last_id,
+            )
+            .order_by(TaskFile.id)
+            .limit(batch_size)
+        )
+        task_files = DB.session.execute(query).scalars().all()
+        if not task_files:
+            return deleted
+        last_id = task_files[-1].id
+        for file_info in task_files:
+            if STORE.can_delete_task_file(file_info):
+                STORE.delete_task_file(file_info, commit=False)
+                deleted += 1
+        DB.session.commit()
+
+
+@CELERY.task(name=f"{_name}.clean-up-tasks", ignore_result=True)
+def clean_up_tasks():
+    """Delete old tasks, temporary files and unreferenced stored files.
+
+    Config keys:
+
+    * ``"TASK_CLEANUP_MAX_AGE"``: delete tasks that finished more than this many seconds ago (defaults to ``None``, which keeps all tasks)
+    * ``"TASK_CLEANUP_TEMP_FILE_MAX_AGE"``: delete temporary files of tasks that finished more than this many seconds ago
+    * ``"TASK_CLEANUP_BATCH_SIZE"``: the number of tasks or files deleted per transaction
+    """
+    config = current_app.config
+    batch_size = config.get("TASK_CLEANUP_BATCH_SIZE", 100)
+    now = datetime.utcnow()
+
+    # expired cache entries no longer protect their tasks
+    evict_result_cache_entries()
+
+    temp_file_max_age = config.get("TASK_CLEANUP_TEMP_FILE_MAX_AGE", 60 * 60 * 24)
+    if temp_file_max_age is not None:
+        deleted_files = delete_old_temp_files(
+            now - timedelta(seconds=temp_file_max_age), batch_size
+        )
+        TASK_LOGGER.info(f"Deleted {deleted_files} temporary task files.")
+
+    max_age = config.get("TASK_CLEANUP_MAX_AGE")
+    if max_age is not None:
+        deleted_tasks = delete_old_tasks(now - timedelta(seconds=max_age), batch_size)
+        TASK_LOGGER.info(f"Deleted {deleted_tasks} old tasks.")
+
+    removed = STORE.collect_garbage()
+    TASK_LOGGER.info(f"Removed {removed} unreferenced stored files.")
+
+
+@CELERY.on_after_finalize.connect
+def _schedule_clean_up_tasks(sender: Celery, **kwargs):
+    """Schedule the cleanup task every ``"TASK_CLEANUP_INTERVAL"`` seconds (requires celery beat)."""
+    app = getattr(sender, "flask_app", None)
+    interval = app.config.get("TASK_CLEANUP_INTERVAL") if app is not None else None
+    if interval:
+        sender.add_periodic_task(interval, clean_up_tasks.s(), name="clean up old tasks")
@@ -0,0 +1,107 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for files that are stored compressed.
+
+The compression is identified by the HTTP content coding name (``"gzip"`` or ``"zstd"``).
+Compressed files are stored with the suffix of the content coding (e.g. ``data.json.gz``).
+The zstd content coding requires the optional :py:mod:`zstandard` package.
+"""
+
+from gzip import GzipFile
+from pathlib import Path
+from typing import IO, Optional, Union
+
+CONTENT_ENCODING_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+"""The file suffixes of the supported content codings."""
+
+COMPRESSIBLE_MIMETYPE_SUFFIXES = ("json", "csv", "xml", "html", "yaml")
+
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    """Check if files with the given mimetype compress well (e.g. text and json files)."""
+    if not mimetype:
+        return False
+    mimetype = mimetype.split(";", maxsplit=1)[0].strip().lower()
+    return mimetype.startswith("text/") or mimetype.endswith(
+        COMPRESSIBLE_MIMETYPE_SUFFIXES
+    )
+
+
+def get_content_encoding(path: Union[str, Path]) -> Optional[str]:
+    """Get the content coding of a stored file from its suffix (None for uncompressed files)."""
+    suffix = Path(path).suffix
+    for content_encoding, encoding_suffix in CONTENT_ENCODING_SUFFIXES.items():
+        if suffix == encoding_suffix:
+            return content_encoding
+    return None
+
+
+def _check_content_encoding(content_encoding: str):
+    if content_encoding not in CONTENT_ENCODING_SUFFIXES:
+        raise ValueError(f"Unsupported content encoding '{content_encoding}'.")
+
+
+def open_compressing_writer(
+    file_: IO[bytes], content_encoding: str, level: Optional[int] = None
+) -> IO[bytes]:
+    """Open a stream compressing all written data into ``file_``.
+
+    Closing the returned stream writes the remaining compressed data
+    but does not close ``file_``.
+
+    Args:
+        file_ (IO[bytes]): the binary stream to write the compressed data to
+        content_encoding (str): the content coding to use (``"gzip"`` or ``"zstd"``)
+        level (Optional[int], optional): the compression level. Defaults to the default level of the compression.
+
+    Raises:
+        ValueError: if the content encoding is not supported
+
+    Returns:
+        IO[bytes]: the writable stream
+    """
+    _check_content_encoding(content_encoding)
+    if content_encoding == "zstd":
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.stream_writer(file_, closefd=False)
+    # mtime=0 makes the output only depend on the content
+    return GzipFile(
+        fileobj=file_, mode="wb", compresslevel=6 if level is None else level, mtime=0
+    )
+
+
+def open_decompressed(path: Union[str, Path], content_encoding: str) -> IO[bytes]:
+    """Open a compressed file for reading the decompressed content.
+
+    Args:
+        path (Union[str, Path]): the path of the compressed file
+        content_encoding (str): the content coding of the file (``"gzip"`` or ``"zstd"``)
+
+    Raises:
+        ValueError: if the content encoding is not supported
+
+    Returns:
+        IO[bytes]: the readable stream (closing it closes the file)
+    """
+    _check_content_encoding(content_encoding)
+    if content_encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, mode="rb"), closefd=True
+        )
+    return GzipFile(filename=path, mode="rb")
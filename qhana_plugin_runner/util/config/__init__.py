@@ -48,6 +48,26 @@ class ProductionConfig(SQLAchemyProductionConfig, SmorestProductionConfig):
 
     DEFAULT_FILE_STORE = "local_filesystem"
     FILE_STORE_ROOT_PATH = "files"
+    # compress text based task files at rest with "gzip" or "zstd" (requires zstandard)
+    FILE_STORE_COMPRESSION: Optional[str] = None
+    FILE_STORE_COMPRESSION_LEVEL: Optional[int] = None
+
+    # max age (in seconds) of task result files in the HTTP cache (task results are immutable)
+    TASK_FILE_MAX_AGE = 60 * 60 * 24 * 365
+
+    # time (in seconds) results of plugins using the result cache can be reused (0 disables the cache)
+    TASK_RESULT_CACHE_TTL = 60 * 60 * 24 * 7
+    # size limit (in bytes) of all cached result files, least recently used results are evicted first
+    TASK_RESULT_CACHE_MAX_SIZE: Optional[int] = 2**34
+
+    # periodic cleanup of old tasks (requires celery beat, see qhana_plugin_runner.tasks.clean_up_tasks)
+    # interval (in seconds) of the cleanup (None disables the cleanup)
+    TASK_CLEANUP_INTERVAL: Optional[int] = 60 * 60
+    # age (in seconds) after which finished tasks are deleted (None keeps all tasks)
+    TASK_CLEANUP_MAX_AGE: Optional[int] = None
+    # age (in seconds) after which temporary files of finished tasks are deleted
+    TASK_CLEANUP_TEMP_FILE_MAX_AGE: Optional[int] = 60 * 60 * 24
+    TASK_CLEANUP_BATCH_SIZE = 100
 
     PLUGIN_REGISTRY_URL: Optional[str] = None
 
@@ -55,6 +75,39 @@ class ProductionConfig(SQLAchemyProductionConfig, SmorestProductionConfig):
     # in order to URLs opened with qhana_plugin_runner.requests.open_url
     URL_REWRITE_RULES: Sequence[Tuple[re.Pattern, str]] = []
 
+    # maximum time (in seconds) a task status request waits for changes (long polling)
+    TASK_STATUS_MAX_WAIT = 30
+    # interval (in seconds) in which the database is checked for changes while waiting
+    TASK_STATUS_POLL_INTERVAL = 0.5
+
+    # URL of the Redis server used to publish task events ("memory://" for single process setups)
+    # defaults to the celery broker if it is a Redis server
+    TASK_EVENTS_URL: Optional[str] = None
+    TASK_EVENTS_CHANNEL_PREFIX = "qhana_plugin_runner:task-events:"
+    # interval (in seconds) of keep-alive comments in task event streams
+    TASK_EVENTS_KEEP_ALIVE = 15
+    # maximum duration (in seconds) of a task event stream before clients must reconnect
+    TASK_EVENTS_MAX_DURATION = 60 * 60
+
+    # connection pooling, timeouts and retries of outgoing http requests
+    # (see qhana_plugin_runner.requests.configure_request_session)
+    REQUEST_POOL_CONNECTIONS = 10  # number of hosts with pooled connections
+    REQUEST_POOL_MAXSIZE = 10  # pooled connections per host
+    REQUEST_POOL_BLOCK = False
+    REQUEST_TCP_KEEPALIVE = True
+    REQUEST_CONNECT_TIMEOUT = 10  # in seconds
+    REQUEST_READ_TIMEOUT = 5 * 60  # in seconds
+    REQUEST_RETRIES = 3
+    REQUEST_RETRY_BACKOFF_FACTOR = 0.5
+    REQUEST_RETRY_STATUS = (502, 503, 504)
+
+    # read task files of this runner directly from disk in open_url (instead of over http)
+    URL_LOCAL_FILE_SHORTCUT = True
+
+    # set a path (relative to the instance folder) to cache responses of open_url on disk
+    URL_CACHE_PATH: Optional[str] = None
+    URL_CACHE_MAX_SIZE = 2**30  # in bytes
+
     NISQ_ANALYZER_UI_URL = "http://localhost:4201"
 
 
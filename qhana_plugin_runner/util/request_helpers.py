@@ -18,17 +18,96 @@ from base64 import b64decode
 from http import HTTPStatus
 from io import BytesIO
 import mimetypes
+from mmap import ACCESS_READ, mmap
+from os import stat
 from pathlib import Path
-from typing import Container, Mapping, Optional, Text, Tuple, Union
+from typing import Any, Container, Mapping, Optional, Text, Tuple, Union
 from urllib.parse import unquote_to_bytes, urlparse
 
 from requests import Session
 from requests.adapters import BaseAdapter
 from requests.models import PreparedRequest, Response
 
+from .compression import open_decompressed
+
+
+def build_file_response(
+    url: str,
+    path: Union[str, Path],
+    mimetype: Optional[str] = None,
+    content_encoding: Optional[str] = None,
+    size: Optional[int] = None,
+) -> Response:
+    """Build a response reading a local file.
+
+    Args:
+        url (str): the URL of the response
+        path (Union[str, Path]): the path of the file
+        mimetype (Optional[str], optional): the mimetype of the file content. Defaults to None.
+        content_encoding (Optional[str], optional): the compression of the file, the file is decompressed transparently. Defaults to None.
+        size (Optional[int], optional): the size of the (decompressed) content if known. Defaults to the file size for uncompressed files.
+
+    Raises:
+        IOError: if the file cannot be opened
+
+    Returns:
+        Response: the response with the opened file as raw body (see :py:func:`get_local_file_path` and :py:func:`map_local_file`)
+    """
+    resp = Response()
+    resp.url = url
+    if content_encoding:
+        resp.raw = open_decompressed(path, content_encoding)
+    else:
+        file_object = open(path, mode="rb")  # read binary
+        resp.raw = file_object
+        # allows consumers to read the file directly (see get_local_file_path)
+        resp.local_file_path = Path(path)  # type: ignore
+        if size is None:
+            size = stat(file_object.fileno()).st_size
+    if size is not None:
+        resp.headers["Content-Length"] = str(size)
+    if mimetype:
+        resp.headers["Content-Type"] = mimetype
+    resp.status_code = HTTPStatus.OK
+    return resp
+
+
+def get_local_file_path(response: Any) -> Optional[Path]:
+    """Get the path of the local (uncompressed) file a response reads its body from.
+
+    Responses of ``file://`` URLs, of local task files and of cached URLs read
+    their body from a local file. Returns None for all other responses.
+    """
+    return getattr(response, "local_file_path", None)
+
+
+def map_local_file(response: Any) -> Optional[mmap]:
+    """Memory map the body of a response that reads from a local file.
+
+    The memory map can be used as a read only buffer without copying the file
+    into memory (e.g. with :py:class:`memoryview` or :py:func:`numpy.frombuffer`).
+    It stays valid after the response is closed.
+
+    Returns:
+        Optional[mmap]: the memory mapped body or None if the response does not read from a local (non-empty) file
+    """
+    if get_local_file_path(response) is None:
+        return None
+    raw = response.raw
+    if raw is None or raw.closed:
+        return None
+    try:
+        return mmap(raw.fileno(), 0, access=ACCESS_READ)
+    except (OSError, ValueError):
+        return None  # e.g. empty files cannot be memory mapped
+
 
 class FileAdapter(BaseAdapter):
-    """Adapter to load ``file://`` URLs."""
+    """Adapter to load ``file://`` URLs.
+
+    Files are read as they are, compressed files are never decompressed. Use
+    :py:func:`build_file_response` for files with a known content coding.
+    """
 
     def send(self, request: PreparedRequest, stream: bool, **kwargs) -> Response:
         if request.method not in ("HEAD", "GET"):
@@ -58,17 +137,12 @@ class FileAdapter(BaseAdapter):
 
         if resp.status_code is None:  # if no error
             try:
-                file_object = file_path.open(mode="rb")  # read binary
-                resp.raw = file_object
-
-                resp.headers["Content-Length"] = str(file_path.stat().st_size)
-                resp.status_code = HTTPStatus.OK
-
                 # set mimetype in response if guessable
-                mimetype = mimetypes.MimeTypes().guess_type(url=file_path)
-                if mimetype:
-                    resp.headers["Content-Type"] = mimetype[0]
-
+                mimetype, encoding = mimetypes.MimeTypes().guess_type(url=file_path)
+                if encoding:
+                    # the guessed mimetype describes the decompressed content
+                    mimetype = None
+                return build_file_response(request.url, file_path, mimetype)
             except IOError:
                 resp.status_code = HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -0,0 +1,337 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An on-disk read-through cache for responses opened with :py:func:`~qhana_plugin_runner.requests.open_url`.
+
+Cached responses are revalidated with conditional requests (``If-None-Match``
+and ``If-Modified-Since``) unless they are still fresh according to their
+``Cache-Control`` header. The least recently used responses are evicted when
+the cache exceeds its size budget.
+
+The cache is safe to use from multiple processes on the same host (e.g. celery
+workers). All files are written to a temporary file first and then moved into
+place atomically. Cached bodies are never modified, only replaced or removed.
+"""
+
+from hashlib import sha256
+from http import HTTPStatus
+from json import dumps, loads
+from os import replace, utime
+from pathlib import Path
+from secrets import token_urlsafe
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import IO, Any, Dict, Mapping, Optional
+
+from requests import Session
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from werkzeug.datastructures import ResponseCacheControl
+from werkzeug.http import parse_cache_control_header
+
+CACHED_HEADERS = (
+    "Content-Type",
+    "Content-Disposition",
+    "Content-Language",
+    "ETag",
+    "Last-Modified",
+    "Cache-Control",
+)
+"""The response headers that are stored in the cache."""
+
+UNCACHEABLE_REQUEST_HEADERS = ("range", "authorization", "cookie")
+
+STALE_TEMP_FILE_AGE = 60 * 60
+"""Temporary files older than this (in seconds) are considered to be left behind by crashed processes."""
+
+_CHUNK_SIZE = 2**16
+
+
+def _get_cache_control(headers: Mapping[str, str]) -> ResponseCacheControl:
+    return parse_cache_control_header(
+        headers.get("Cache-Control"), cls=ResponseCacheControl
+    )
+
+
+def is_plain_get_request(**kwargs) -> bool:
+    """Check if the arguments of a GET request only ask for the full, unconditional response.
+
+    Requests with query parameters, a body, credentials, ``Range`` headers or
+    conditional headers (``If-*``) are not plain requests.
+    """
+    if any(kwargs.get(arg) for arg in ("params", "data", "json", "auth", "files")):
+        return False
+    headers: Mapping[str, Any] = kwargs.get("headers") or {}
+    for header in headers:
+        header = header.lower()
+        if header in UNCACHEABLE_REQUEST_HEADERS or header.startswith("if-"):
+            return False
+    return True
+
+
+class UrlCache:
+    """An on-disk read-through cache for GET requests with LRU eviction.
+
+    Args:
+        root (Path): the folder to store the cached responses in
+        max_size (int): the size budget of the cache in bytes
+        max_entry_size (Optional[int], optional): responses larger than this are not cached. Defaults to 1/4 of the size budget.
+    """
+
+    def __init__(
+        self, root: Path, max_size: int, max_entry_size: Optional[int] = None
+    ) -> None:
+        self.root = root
+        self.max_size = max_size
+        self.max_entry_size = max_size // 4 if max_entry_size is None else max_entry_size
+
+    def is_cacheable_request(self, url: str, **kwargs) -> bool:
+        """Check if a GET request with the given arguments can be answered from the cache."""
+        if not url.startswith(("http://", "https://")):
+            return False  # local files and data URLs are not worth caching
+        return is_plain_get_request(**kwargs)
+
+    def _get_key(self, url: str) -> str:
+        return sha256(url.encode()).hexdigest()
+
+    def _get_path(self, key: str, name: str) -> Path:
+        return self.root / key[:2] / name
+
+    def _get_metadata_path(self, key: str) -> Path:
+        return self._get_path(key, f"{key}.json")
+
+    def _load_metadata(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return loads(self._get_metadata_path(key).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_atomic(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{token_urlsafe(8)}.tmp")
+        temp_path.write_bytes(data)
+        replace(temp_path, path)
+
+    def _open_body(self, body_path: Path) -> Optional[IO[bytes]]:
+        """Open a cached body for reading (None if the body was evicted)."""
+        try:
+            body = body_path.open(mode="rb")
+        except FileNotFoundError:
+            return None
+        try:
+            # mark the body as recently used for the LRU eviction
+            utime(body_path)
+        except FileNotFoundError:
+            pass  # evicted concurrently, the opened file can still be read
+        return body
+
+    def _build_response(
+        self, url: str, metadata: Dict[str, Any], body: IO[bytes]
+    ) -> Response:
+        """Build a response reading the cached body."""
+        response = Response()
+        response.url = url
+        response.status_code = HTTPStatus.OK
+        response.reason = HTTPStatus.OK.phrase
+        response.headers = CaseInsensitiveDict(metadata["headers"])
+        response.headers["Content-Length"] = str(metadata["size"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = body
+        response.from_cache = True  # type: ignore
+        response.local_file_path = Path(body.name)  # type: ignore
+        return response
+
+    def _is_fresh(self, metadata: Dict[str, Any]) -> bool:
+        expires = metadata.get("expires")
+        return expires is not None and time() < expires
+
+    def _get_expiry(self, headers: Mapping[str, str]) -> Optional[float]:
+        cache_control = _get_cache_control(headers)
+        if cache_control.no_cache or cache_control.max_age is None:
+            return None
+        try:
+            age = int(headers.get("Age", 0))
+        except ValueError:
+            age = 0
+        return time() + cache_control.max_age - age
+
+    def _is_cacheable_response(self, response: Response) -> bool:
+        if response.status_code != HTTPStatus.OK:
+            return False
+        headers = response.headers
+        if _get_cache_control(headers).no_store:
+            return False
+        vary = {
+            v.strip().lower() for v in headers.get("Vary", "").split(",") if v.strip()
+        }
+        if vary - {"accept-encoding"}:
+            return False  # the cache does not store different representations
+        if "Content-Range" in headers:
+            return False
+        length = headers.get("Content-Length")
+        if length and not headers.get("Content-Encoding"):
+            if int(length) > self.max_entry_size:
+                return False
+        return bool(
+            headers.get("ETag")
+            or headers.get("Last-Modified")
+            or self._get_expiry(headers) is not None
+        )
+
+    def _store_response(self, key: str, url: str, response: Response) -> Response:
+        """Store the response body in the cache and return a response reading the cached body."""
+        # a new body file for every response, cached bodies are never overwritten
+        body_path = self._get_path(key, f"{key}-{token_urlsafe(12)}.body")
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        size = 0
+        with NamedTemporaryFile(
+            dir=body_path.parent, suffix=".tmp", delete=False
+        ) as temp:
+            try:
+                # the body is stored decoded (without content encoding)
+                for chunk in response.iter_content(_CHUNK_SIZE):
+                    temp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                temp.close()
+                Path(temp.name).unlink(missing_ok=True)
+                raise
+            finally:
+                response.close()
+        temp_path = Path(temp.name)
+        metadata = {
+            "url": url,
+            "headers": {
+                h: response.headers[h] for h in CACHED_HEADERS if h in response.headers
+            },
+            "size": size,
+            "body": body_path.name,
+            "expires": self._get_expiry(response.headers),
+        }
+        # open the body before it can be evicted by other processes
+        body = temp_path.open(mode="rb")
+        if size > self.max_entry_size:
+            # too large to keep, serve the downloaded body once
+            temp_path.unlink(missing_ok=True)
+            return self._build_response(url, metadata, body)
+        replace(temp_path, body_path)
+        old_metadata = self._load_metadata(key)
+        self._write_atomic(self._get_metadata_path(key), dumps(metadata).encode())
+        if old_metadata and old_metadata.get("body") != body_path.name:
+            # readers that already opened the old body can still read it
+            self._get_path(key, old_metadata["body"]).unlink(missing_ok=True)
+        self.evict()
+        return self._build_response(url, metadata, body)
+
+    def open(self, session: Session, url: str, **kwargs) -> Response:
+        """Get the response for the URL from the cache or request it with the session.
+
+        Cached responses are revalidated with a conditional request unless they are still fresh.
+        Only successful responses with validators or an explicit max-age are cached.
+
+        Args:
+            session (Session): the session to send requests with
+            url (str): the URL to get (must be a cacheable request, see :py:meth:`is_cacheable_request`)
+            **kwargs: further arguments passed to :py:meth:`requests.Session.get`
+
+        Returns:
+            Response: the (possibly cached) response
+        """
+        stream = kwargs.pop("stream", False)
+        response = self._open(session, url, **kwargs)
+        if not stream:
+            # read the body immediately like requests does for requests without streaming
+            response.content
+            response.raw.close()
+        return response
+
+    def _open(self, session: Session, url: str, **kwargs) -> Response:
+        key = self._get_key(url)
+        metadata = self._load_metadata(key)
+        headers = dict(kwargs.pop("headers", None) or {})
+        kwargs["stream"] = True  # the body is streamed into the cache
+
+        if metadata is not None:
+            body_path = self._get_path(key, metadata["body"])
+            if self._is_fresh(metadata):
+                body = self._open_body(body_path)
+                if body is not None:
+                    return self._build_response(url, metadata, body)
+            validators = metadata["headers"]
+            conditional_headers = dict(headers)
+            if "ETag" in validators:
+                conditional_headers["If-None-Match"] = validators["ETag"]
+            if "Last-Modified" in validators:
+                conditional_headers["If-Modified-Since"] = validators["Last-Modified"]
+            response = session.get(url, headers=conditional_headers, **kwargs)
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                response.close()
+                expires = self._get_expiry(response.headers)
+                if expires is not None:
+                    metadata["expires"] = expires
+                    self._write_atomic(
+                        self._get_metadata_path(key), dumps(metadata).encode()
+                    )
+                body = self._open_body(body_path)
+                if body is not None:
+                    return self._build_response(url, metadata, body)
+                # the body was evicted in the meantime
+                response = session.get(url, headers=headers, **kwargs)
+        else:
+            response = session.get(url, headers=headers, **kwargs)
+
+        if not self._is_cacheable_response(response):
+            return response
+        return self._store_response(key, url, response)
+
+    def evict(self):
+        """Remove the least recently used responses until the cache fits into its size budget.
+
+        Also removes temporary files left behind by crashed processes.
+        """
+        for temp_path in self.root.glob("??/*.tmp"):
+            try:
+                if time() - temp_path.stat().st_mtime > STALE_TEMP_FILE_AGE:
+                    temp_path.unlink()
+            except FileNotFoundError:
+                pass  # removed concurrently
+        entries = []
+        total_size = 0
+        for body_path in self.root.glob("??/*.body"):
+            try:
+                stat = body_path.stat()
+            except FileNotFoundError:
+                continue  # removed concurrently
+            entries.append((stat.st_mtime, stat.st_size, body_path))
+            total_size += stat.st_size
+        if total_size <= self.max_size:
+            return
+        entries.sort()
+        for _, size, body_path in entries:
+            body_path.unlink(missing_ok=True)
+            key = body_path.name.split("-", maxsplit=1)[0]
+            metadata = self._load_metadata(key)
+            if metadata and metadata.get("body") == body_path.name:
+                # metadata pointing to a removed body is also a cache miss,
+                # removing it only keeps the cache folder clean
+                self._get_metadata_path(key).unlink(missing_ok=True)
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+    def clear(self):
+        """Remove all cached responses."""
+        for path in self.root.glob("??/*"):
+            path.unlink(missing_ok=True)
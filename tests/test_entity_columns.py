@@ -0,0 +1,137 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the binary columnar entity format."""
+
+from io import BytesIO
+from mmap import mmap
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+from utils import assert_sequence_equals
+
+from qhana_plugin_runner.plugin_utils.entity_columns import (
+    EntityColumns,
+    load_entity_columns,
+)
+from qhana_plugin_runner.plugin_utils.entity_marshalling import (
+    COLUMNAR_MIMETYPE,
+    load_entities,
+    save_entities,
+)
+from qhana_plugin_runner.requests import REQUEST_SESSION
+from qhana_plugin_runner.util.request_helpers import (
+    get_local_file_path,
+    register_additional_schemas,
+)
+
+JSON_VALUES = st.recursive(
+    st.none() | st.booleans() | st.integers() | st.floats(allow_nan=False) | st.text(),
+    lambda children: st.lists(children) | st.dictionaries(st.text(), children),
+    max_leaves=5,
+)
+
+ENTITY_STRATEGY = st.fixed_dictionaries(
+    {
+        "ID": st.text(),
+        "integer": st.integers(),
+        "number": st.floats(allow_nan=False),
+        "boolean": st.booleans(),
+        "mixed": JSON_VALUES,
+    }
+)
+
+
+class ResponseDummy:
+    """Dummy to simulate a response object for binary data."""
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+
+@given(entities=st.lists(ENTITY_STRATEGY))
+def test_columnar_roundtrip(entities: list):
+    """Test columnar serialization roundtrip."""
+    file_ = BytesIO()
+    save_entities(entities=entities, file_=file_, mimetype=COLUMNAR_MIMETYPE)
+    read_entities = list(
+        load_entities(file_=ResponseDummy(file_.getvalue()), mimetype=COLUMNAR_MIMETYPE)
+    )
+    assert_sequence_equals(expected=entities, actual=read_entities)
+
+
+def test_columnar_numpy_views():
+    """Test that numeric columns are stored typed and can be viewed as numpy arrays."""
+    np = pytest.importorskip("numpy")
+    entities = [
+        {"ID": f"entity{i}", "x": i / 2, "y": i, "flag": i % 2 == 0, "z": i}
+        for i in range(10)
+    ]
+    entities[3]["z"] = 1.5  # mixed int and float columns are widened to float
+
+    file_ = BytesIO()
+    save_entities(
+        entities=entities,
+        file_=file_,
+        mimetype=COLUMNAR_MIMETYPE,
+        attributes=["ID", "x", "y", "flag", "z"],
+    )
+    columns = load_entity_columns(ResponseDummy(file_.getvalue()))
+
+    assert len(columns) == 10
+    assert columns.attributes == ["ID", "x", "y", "flag", "z"]
+    assert columns.columns["z"].type == "float64"
+    assert columns.values("ID") == [e["ID"] for e in entities]
+
+    x = columns.array("x")
+    assert x.dtype == np.float64
+    assert not x.flags.owndata, "numeric columns must not be copied"
+    np.testing.assert_array_equal(x, [e["x"] for e in entities])
+    np.testing.assert_array_equal(columns.array("y"), [e["y"] for e in entities])
+    np.testing.assert_array_equal(columns.array("flag"), [e["flag"] for e in entities])
+    with pytest.raises(TypeError):
+        columns.array("ID")
+
+
+def test_columnar_memory_map(tmp_path):
+    """Test reading a memory mapped columnar file."""
+    entities = [{"ID": "a", "value": 1.0}, {"ID": "b", "value": 2.0}]
+    path = tmp_path / "entities.bin"
+    with path.open("wb") as file_:
+        save_entities(entities=entities, file_=file_, mimetype=COLUMNAR_MIMETYPE)
+
+    columns = EntityColumns.from_file(path)
+    assert list(columns.iter_entities()) == entities
+
+
+def test_columnar_invalid_data():
+    """Test that data in other formats is rejected."""
+    with pytest.raises(ValueError):
+        EntityColumns(b'[{"ID": "a"}]')
+
+
+def test_columnar_file_url(tmp_path):
+    """Test that columnar files from file:// URLs are memory mapped instead of copied."""
+    entities = [{"ID": "a", "value": 1.0}, {"ID": "b", "value": 2.0}]
+    path = tmp_path / "entities.bin"
+    with path.open("wb") as file_:
+        save_entities(entities=entities, file_=file_, mimetype=COLUMNAR_MIMETYPE)
+
+    register_additional_schemas(REQUEST_SESSION)
+    with REQUEST_SESSION.get(path.as_uri(), stream=True) as response:
+        assert get_local_file_path(response) == path
+        columns = load_entity_columns(response)
+    assert isinstance(columns.buffer.obj, mmap)
+    assert list(columns.iter_entities()) == entities
@@ -15,21 +15,28 @@
 """Tests for the entity_marshalling module."""
 
 from collections import namedtuple
-from json import loads
+from json import dumps, loads
 from keyword import iskeyword
 from typing import Any, Dict, Iterable, Iterator, NamedTuple, Sequence, TextIO, Type
 
+import pytest
 from hypothesis import given
 from hypothesis import strategies as st
 from utils import assert_sequence_equals, assert_sequence_partial_equals
 
 from qhana_plugin_runner.plugin_utils.entity_marshalling import (
+    _iter_json_values,
     ensure_dict,
     ensure_tuple,
     get_entity_tuple_class,
     load_entities,
     save_entities,
 )
+from qhana_plugin_runner.requests import REQUEST_SESSION
+from qhana_plugin_runner.util.request_helpers import (
+    get_local_file_path,
+    register_additional_schemas,
+)
 
 CSV_UNSAFE_CHARACTERS = ["\x00"]
 
@@ -65,8 +72,9 @@ class ReadWriteDummy(TextIO):
     Inherits from TextIO purely to satisfy type checkers.
     """
 
-    def __init__(self, data: str = "") -> None:
+    def __init__(self, data: str = "", chunk_size: int = 7) -> None:
         self.data: str = data
+        self.chunk_size = chunk_size
 
     def json(self, **kwargs):
         return loads(self.data)
@@ -74,6 +82,12 @@ class ReadWriteDummy(TextIO):
     def iter_lines(self, *args, **kwargs) -> Iterator[Any]:
         return iter(self.data.splitlines(keepends=True))
 
+    def iter_content(self, *args, **kwargs) -> Iterator[Any]:
+        # use a small fixed chunk size to test values spanning multiple chunks
+        data = self.data.encode()
+        for i in range(0, len(data), self.chunk_size):
+            yield data[i : i + self.chunk_size]
+
     def write(self, data: str):
         self.data += data
 
@@ -195,3 +209,73 @@ def test_csv_tuples(entities):
         ensure_dict(load_entities(file_=dummy_file_2, mimetype=mimetype))
     )
     assert_sequence_equals(expected=read_entities, actual=read_entities_2)
+
+
+@given(
+    entities=st.lists(DEFAULT_ENTITY_STRATEGY),
+    chunk_size=st.integers(min_value=1, max_value=64),
+)
+def test_json_streaming_chunks(entities: list, chunk_size: int):
+    """Test that json arrays are parsed correctly independent of chunk boundaries."""
+    dummy_file = ReadWriteDummy(chunk_size=chunk_size)
+    save_entities(entities=entities, file_=dummy_file, mimetype="application/json")
+    read_entities = list(load_entities(file_=dummy_file, mimetype="application/json"))
+    assert_sequence_equals(expected=entities, actual=read_entities)
+
+
+@given(
+    value=st.one_of(
+        st.integers(),
+        st.text(),
+        st.dictionaries(st.text(), st.integers()),
+    ),
+    chunk_size=st.integers(min_value=1, max_value=16),
+)
+def test_json_streaming_single_value(value: Any, chunk_size: int):
+    """Test that json documents that are not arrays are loaded as a single entity."""
+    dummy_file = ReadWriteDummy(data=f" {dumps(value)} ", chunk_size=chunk_size)
+    read_entities = list(load_entities(file_=dummy_file, mimetype="application/json"))
+    assert read_entities == [value]
+
+
+@pytest.mark.parametrize(
+    "data", ["[1.5, 2e3, -0.25E-2, 10, 1e+2]", "-12.5e3", '[{"a": 1.25}, 3]']
+)
+def test_json_streaming_split_numbers(data: str):
+    """Test that numbers split across two chunks are decoded completely."""
+    encoded = data.encode()
+    for offset in range(1, len(encoded)):
+        chunks = [encoded[:offset], encoded[offset:]]
+        assert list(_iter_json_values(chunks)) == list(_iter_json_values([encoded]))
+    values = loads(data)
+    assert list(_iter_json_values([encoded])) == (
+        values if isinstance(values, list) else [values]
+    )
+
+
+@pytest.mark.parametrize(
+    "data", ["", "[", "[1,", "[1 2]", "[1,]", '[{"a": 1}', "[1] 2", "[1]]"]
+)
+def test_json_streaming_invalid(data: str):
+    """Test that invalid json documents raise an error."""
+    dummy_file = ReadWriteDummy(data=data, chunk_size=2)
+    with pytest.raises(ValueError):
+        list(load_entities(file_=dummy_file, mimetype="application/json"))
+
+
+@pytest.mark.parametrize("mimetype", ["text/csv", "application/X-lines+json"])
+def test_load_from_file_url(tmp_path, mimetype: str):
+    """Test loading entities line by line directly from local files."""
+    entities = [
+        {"ID": "a", "href": "", "value": "1"},
+        {"ID": "b", "href": "", "value": "2"},
+    ]
+    path = tmp_path / "entities.txt"
+    with path.open("w", encoding="utf-8", newline="") as file_:
+        save_entities(entities, file_, mimetype, attributes=["ID", "href", "value"])
+
+    register_additional_schemas(REQUEST_SESSION)
+    with REQUEST_SESSION.get(path.as_uri(), stream=True) as response:
+        assert get_local_file_path(response) == path
+        loaded = list(ensure_dict(load_entities(response, mimetype)))
+    assert loaded == entities
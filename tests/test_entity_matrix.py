@@ -0,0 +1,140 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the binary entity matrix format."""
+
+from io import BytesIO
+from json import dumps
+from mmap import mmap
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from qhana_plugin_runner.plugin_utils.entity_matrix import (
+    EntityMatrix,
+    EntityMatrixWriter,
+    iter_matrix_pairs,
+    load_entity_matrix,
+    save_entity_matrix,
+)
+from qhana_plugin_runner.requests import REQUEST_SESSION
+from qhana_plugin_runner.util.request_helpers import register_additional_schemas
+
+
+class ResponseDummy:
+    """Dummy to simulate a response object for binary data."""
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+
+def test_dense_roundtrip():
+    """Test writing and reading a dense (rectangular) matrix."""
+    matrix = np.arange(12, dtype=np.float64).reshape((3, 4))
+    file_ = BytesIO()
+    save_entity_matrix(
+        matrix, file_, row_ids=["a", "b", "c"], column_ids=["w", "x", "y", "z"]
+    )
+
+    loaded = load_entity_matrix(ResponseDummy(file_.getvalue()), "kernel")
+    assert loaded.row_ids == ["a", "b", "c"]
+    assert loaded.column_ids == ["w", "x", "y", "z"]
+    assert loaded.column_index["y"] == 2
+    np.testing.assert_array_equal(loaded.to_numpy(), matrix)
+    assert not loaded.to_numpy().flags.owndata, "dense matrices must not be copied"
+
+
+def test_symmetric_roundtrip_in_blocks(tmp_path):
+    """Test writing a symmetric matrix block by block and memory mapping it."""
+    size = 5
+    base = np.random.default_rng(42).random((size, size))
+    matrix = base + base.T
+    path = tmp_path / "matrix.bin"
+
+    with path.open("wb") as file_:
+        with EntityMatrixWriter(
+            file_, row_ids=[str(i) for i in range(size)], symmetric=True
+        ) as writer:
+            writer.write_rows(matrix[:2])
+            writer.write_rows(matrix[2:])
+
+    loaded = EntityMatrix.from_file(path)
+    assert loaded.layout == "upper-triangular"
+    assert loaded.data.shape == (size * (size + 1) // 2,)
+    np.testing.assert_array_equal(loaded.to_numpy(), matrix)
+
+    pairs = list(iter_matrix_pairs(loaded, "similarity"))
+    assert len(pairs) == size * (size + 1) // 2
+    assert pairs[1] == {
+        "ID": "0_1",
+        "entity_1_ID": "0",
+        "entity_2_ID": "1",
+        "similarity": matrix[0, 1],
+    }
+
+
+def test_writer_checks_row_count():
+    """Test that incomplete matrices are rejected."""
+    writer = EntityMatrixWriter(BytesIO(), row_ids=["a", "b"])
+    writer.write_rows(np.zeros((1, 2)))
+    with pytest.raises(ValueError):
+        writer.write_rows(np.zeros((2, 2)))
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+def test_load_pair_list():
+    """Test loading the json pair-list format."""
+    pairs = [
+        {"entity_1_ID": "a", "entity_2_ID": "a", "distance": 0},
+        {"entity_1_ID": "a", "entity_2_ID": "b", "distance": 0.5},
+        {"entity_1_ID": "b", "entity_2_ID": "b", "distance": None},
+    ]
+    loaded = load_entity_matrix(
+        ResponseDummy(dumps(pairs).encode()), "distance", symmetric=True
+    )
+    assert loaded.row_ids == ["a", "b"]
+    assert loaded.column_ids == ["a", "b"]
+    np.testing.assert_array_equal(loaded.to_numpy(), [[0, 0.5], [0.5, np.nan]])
+
+
+def test_load_from_file_url(tmp_path):
+    """Test that binary matrices from file:// URLs are memory mapped and pair lists are streamed."""
+    matrix = np.arange(4, dtype=np.float64).reshape((2, 2))
+    path = tmp_path / "matrix.bin"
+    with path.open("wb") as file_:
+        save_entity_matrix(matrix, file_, row_ids=["a", "b"])
+    pairs = list(iter_matrix_pairs(EntityMatrix.from_file(path), "kernel"))
+    pairs_path = tmp_path / "pairs.json"
+    pairs_path.write_text(dumps(pairs))
+
+    register_additional_schemas(REQUEST_SESSION)
+    with REQUEST_SESSION.get(path.as_uri(), stream=True) as response:
+        loaded = load_entity_matrix(response, "kernel")
+    base = loaded.data
+    while isinstance(base, np.ndarray):
+        base = base.base
+    assert isinstance(base.obj, mmap)
+    np.testing.assert_array_equal(loaded.to_numpy(), matrix)
+
+    with REQUEST_SESSION.get(pairs_path.as_uri(), stream=True) as response:
+        loaded = load_entity_matrix(response, "kernel")
+    np.testing.assert_array_equal(loaded.to_numpy(), matrix)
+
+    response = REQUEST_SESSION.get(path.as_uri(), stream=True)
+    response.local_file_path = None  # read the body like a remote response
+    with response:
+        loaded = load_entity_matrix(response, "kernel")
+    np.testing.assert_array_equal(loaded.to_numpy(), matrix)
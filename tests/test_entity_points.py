@@ -0,0 +1,129 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for loading entity points into numpy arrays."""
+
+from io import BytesIO, StringIO
+from typing import Any, Iterator, Optional
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from qhana_plugin_runner.plugin_utils.entity_marshalling import (
+    COLUMNAR_MIMETYPE,
+    save_entities,
+)
+from qhana_plugin_runner.plugin_utils.entity_points import (
+    iter_entity_point_batches,
+    load_entity_points,
+)
+
+MIMETYPES = [
+    "application/json",
+    "application/X-lines+json",
+    "text/csv",
+    COLUMNAR_MIMETYPE,
+]
+
+ENTITIES = [
+    {"ID": f"entity{i}", "href": "", "y": i * 2.5, "x": -i, "a": i / 3} for i in range(10)
+]
+
+
+class ResponseDummy:
+    """Dummy to simulate a (streamed) response object."""
+
+    def __init__(
+        self, content: bytes, mimetype: str, charset: Optional[str] = "utf-8"
+    ) -> None:
+        self.content = content
+        if charset:
+            self.headers = {"Content-Type": f"{mimetype}; charset={charset}"}
+            self.encoding = charset
+        else:
+            self.headers = {"Content-Type": mimetype}
+            # requests uses ISO-8859-1 for text types without a charset
+            self.encoding = "ISO-8859-1" if mimetype.startswith("text/") else None
+
+    def iter_lines(self, *args, **kwargs) -> Iterator[Any]:
+        return iter(self.content.decode(self.encoding).splitlines())
+
+    def iter_content(self, *args, **kwargs) -> Iterator[Any]:
+        for i in range(0, len(self.content), 5):
+            yield self.content[i : i + 5]
+
+
+def serialize(entities: list, mimetype: str) -> ResponseDummy:
+    attributes = ["ID", "href", "a", "x", "y"]
+    if mimetype == COLUMNAR_MIMETYPE:
+        file_ = BytesIO()
+        save_entities(entities, file_, mimetype, attributes=attributes)
+        return ResponseDummy(file_.getvalue(), mimetype)
+    text_file = StringIO()
+    save_entities(entities, text_file, mimetype, attributes=attributes)
+    return ResponseDummy(text_file.getvalue().encode(), mimetype)
+
+
+@pytest.mark.parametrize("mimetype", MIMETYPES)
+def test_load_entity_points(mimetype: str):
+    """Test loading entity points from all supported formats."""
+    entity_points = load_entity_points(serialize(ENTITIES, mimetype))
+
+    assert entity_points.dimensions == ["a", "x", "y"]
+    assert entity_points.ids == [e["ID"] for e in ENTITIES]
+    assert entity_points.id_to_idx["entity3"] == 3
+    assert entity_points.points.dtype == np.float64
+    np.testing.assert_allclose(
+        entity_points.points, [[e["a"], e["x"], e["y"]] for e in ENTITIES]
+    )
+
+
+@pytest.mark.parametrize("mimetype", MIMETYPES)
+def test_point_batches(mimetype: str):
+    """Test loading entity points in batches with selected dimensions."""
+    batches = list(
+        iter_entity_point_batches(
+            serialize(ENTITIES, mimetype), batch_size=4, dimensions=["y"]
+        )
+    )
+
+    assert [len(ids) for ids, _ in batches] == [4, 4, 2]
+    assert batches[2][0] == ["entity8", "entity9"]
+    np.testing.assert_allclose(
+        np.concatenate([batch for _, batch in batches]), [[e["y"]] for e in ENTITIES]
+    )
+
+
+def test_duplicate_ids():
+    """Test that duplicate entity IDs are rejected."""
+    with pytest.raises(ValueError):
+        load_entity_points(serialize(ENTITIES + ENTITIES[:1], "application/json"))
+
+
+def test_empty_entities():
+    """Test loading an empty list of entities."""
+    entity_points = load_entity_points(
+        ResponseDummy(b"[]", "application/json"), dimensions=["x", "y"]
+    )
+    assert entity_points.ids == []
+    assert entity_points.points.shape == (0, 2)
+
+
+def test_csv_without_charset():
+    """Test that csv files without a charset are decoded as utf-8."""
+    entities = [{"ID": "äöü", "href": "", "a": 1, "x": 2, "y": 3}]
+    response = serialize(entities, "text/csv")
+    response = ResponseDummy(response.content, "text/csv", charset=None)
+    assert load_entity_points(response).ids == ["äöü"]
@@ -0,0 +1,125 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the files api."""
+
+from gzip import decompress
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from conftests import task_data
+from flask import current_app
+from requests.exceptions import ConnectionError
+
+from qhana_plugin_runner.db.models.tasks import ProcessingTask, TaskFile
+from qhana_plugin_runner.requests import open_url
+from qhana_plugin_runner.storage import STORE
+
+CONTENT = bytes(range(256)) * 16
+
+
+@pytest.fixture()
+def task_file(task_data: ProcessingTask, tmp_path: Path):
+    current_app.config["FILE_STORE_ROOT_PATH"] = str(tmp_path)
+    current_app.config["TASK_FILE_MAX_AGE"] = 3600
+    return STORE.persist_task_result(
+        task_data.id, CONTENT, "data.bin", "binary", "application/octet-stream"
+    )
+
+
+def get_file(task_file: TaskFile, **headers):
+    client = current_app.test_client()
+    return client.get(
+        f"/files/{task_file.id}/",
+        query_string={"file-id": task_file.security_tag},
+        headers=headers,
+    )
+
+
+def test_get_file(task_file: TaskFile):
+    """Test downloading a file with validators and cache headers."""
+    response = get_file(task_file)
+    assert response.status_code == HTTPStatus.OK
+    assert response.data == CONTENT
+    assert response.get_etag() == (task_file.content_hash, False)
+    assert response.cache_control.max_age == 3600
+    assert response.cache_control.immutable
+    assert response.cache_control.private and not response.cache_control.public
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    response = get_file(task_file, **{"If-None-Match": f'"{task_file.content_hash}"'})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.data == b""
+
+
+def test_get_file_range(task_file: TaskFile):
+    """Test downloading parts of a file with range requests."""
+    response = get_file(task_file, Range="bytes=100-299")
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.data == CONTENT[100:300]
+    assert response.headers["Content-Range"] == f"bytes 100-299/{len(CONTENT)}"
+
+    response = get_file(task_file, Range=f"bytes={len(CONTENT)}-")
+    assert response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+def test_get_file_wrong_tag(task_file: TaskFile):
+    """Test that files cannot be downloaded without the correct security tag."""
+    client = current_app.test_client()
+    response = client.get(f"/files/{task_file.id}/", query_string={"file-id": "wrong"})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_get_compressed_file(task_data: ProcessingTask, tmp_path: Path):
+    """Test downloading compressed files with and without content encoding."""
+    current_app.config["FILE_STORE_ROOT_PATH"] = str(tmp_path)
+    current_app.config["FILE_STORE_COMPRESSION"] = "gzip"
+    content = b"ID,value\n" + b"entity,1\n" * 100
+    task_file = STORE.persist_task_result(
+        task_data.id, content, "a.csv", "csv", "text/csv"
+    )
+    assert task_file.content_encoding == "gzip"
+
+    encoded = get_file(task_file, **{"Accept-Encoding": "gzip, deflate"})
+    assert encoded.status_code == HTTPStatus.OK
+    assert encoded.content_encoding == "gzip"
+    assert decompress(encoded.data) == content
+    assert "Accept-Encoding" in encoded.vary
+
+    decoded = get_file(task_file)
+    assert decoded.status_code == HTTPStatus.OK
+    assert decoded.content_encoding is None
+    assert decoded.data == content
+    assert decoded.get_etag() == (task_file.content_hash, False)
+    assert encoded.get_etag()[0] != decoded.get_etag()[0]
+
+    not_modified = get_file(task_file, **{"If-None-Match": f'"{task_file.content_hash}"'})
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_open_url_local_file(task_file: TaskFile):
+    """Test that open_url reads task files of this runner directly from disk."""
+    with current_app.test_request_context():
+        url = STORE.get_task_file_url(task_file)
+    with open_url(url, stream=True) as response:
+        assert response.status_code == HTTPStatus.OK
+        assert response.raw.name == task_file.file_storage_data
+        assert response.headers["Content-Type"] == "application/octet-stream"
+        assert response.headers["Content-Length"] == str(len(CONTENT))
+        assert response.raw.read() == CONTENT
+
+    with pytest.raises(ConnectionError):
+        # wrong security tags are not served from disk (but over http)
+        open_url(url.replace(task_file.security_tag, "wrong"))
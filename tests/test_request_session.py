@@ -0,0 +1,87 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the connection pooling and retry settings of request sessions."""
+
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import List
+
+import pytest
+from requests import Session
+
+from qhana_plugin_runner.requests import PooledHTTPAdapter, configure_request_session
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Handler responding with 503 to every other request."""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive
+    requests: List[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        status = HTTPStatus.OK
+        if len(self.requests) % 2 == 1:
+            status = HTTPStatus.SERVICE_UNAVAILABLE
+        body = status.phrase.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server_url():
+    FlakyHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_configure_request_session(server_url: str):
+    """Test that requests use the configured adapter with timeouts and retries."""
+    session = Session()
+    configure_request_session(
+        session,
+        {
+            "REQUEST_POOL_MAXSIZE": 4,
+            "REQUEST_READ_TIMEOUT": 30,
+            "REQUEST_RETRY_BACKOFF_FACTOR": 0,
+        },
+    )
+    adapter = session.get_adapter(server_url)
+    assert isinstance(adapter, PooledHTTPAdapter)
+    assert adapter.timeout == (10, 30)
+    assert adapter._pool_maxsize == 4
+
+    response = session.get(f"{server_url}/retried")
+    assert response.status_code == HTTPStatus.OK
+    assert FlakyHandler.requests == ["/retried", "/retried"]
+
+    # requests that are not idempotent are not retried
+    response = session.post(f"{server_url}/not-retried")
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert FlakyHandler.requests[2:] == ["/not-retried"]
+    session.close()
@@ -0,0 +1,137 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the task result cache."""
+
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from conftests import task_data
+from flask import current_app
+from requests.models import Response
+from sqlalchemy.sql.expression import select
+
+from qhana_plugin_runner.db.db import DB
+from qhana_plugin_runner.db.models.tasks import ProcessingTask, TaskResultCacheEntry
+from qhana_plugin_runner.result_cache import (
+    add_task_result_to_cache,
+    complete_task_from_result_cache,
+    evict_result_cache_entries,
+    get_input_fingerprint,
+)
+from qhana_plugin_runner.storage import STORE
+
+INPUT_URL = "data:text/plain,input"
+
+
+@pytest.fixture()
+def cached_task(task_data: ProcessingTask, tmp_path: Path):
+    """A finished task with a result file that is in the result cache."""
+    current_app.config["FILE_STORE_ROOT_PATH"] = str(tmp_path)
+    task_data.parameters = '{"b": 1, "a": [1, 2]}'
+    assert not complete_task_from_result_cache(task_data, "v1", [INPUT_URL])
+    assert task_data.result_cache_key
+
+    STORE.persist_task_result(
+        task_data.id, b"result", "result.txt", "result", "text/plain"
+    )
+    task_data.task_status = "SUCCESS"
+    task_data.finished_at = datetime.utcnow()
+    task_data.add_task_log_entry("done", commit=True)
+    add_task_result_to_cache(task_data)
+    return task_data
+
+
+def new_task(parameters: str, input_url: str = INPUT_URL, version: str = "v1"):
+    task = ProcessingTask(task_name="test-data", parameters=parameters)
+    task.save(commit=True)
+    return task, complete_task_from_result_cache(task, version, [input_url, None])
+
+
+def test_result_cache_hit(cached_task: ProcessingTask):
+    """Test that identical tasks reuse the result files of the cached task."""
+    task, hit = new_task('{"a": [1, 2], "b": 1}')  # parameters are normalized
+    assert hit
+    assert task.status == "SUCCESS"
+    assert "done" in task.task_log
+    assert task.result_cache_key == cached_task.result_cache_key
+    (output,) = task.outputs
+    (cached_output,) = cached_task.outputs
+    assert output.file_storage_data == cached_output.file_storage_data
+    assert output.security_tag != cached_output.security_tag
+
+    # shared result files are kept until the last task file is deleted
+    STORE.delete_task_file(cached_output)
+    assert Path(output.file_storage_data).exists()
+    STORE.delete_task_file(output)
+    assert not Path(output.file_storage_data).exists()
+
+
+def test_result_cache_miss(cached_task: ProcessingTask):
+    """Test that different parameters, inputs or plugin versions are cache misses."""
+    assert not new_task('{"a": [2, 1], "b": 1}')[1]
+    assert not new_task(cached_task.parameters, input_url="data:text/plain,other")[1]
+    assert not new_task(cached_task.parameters, version="v2")[1]
+
+    current_app.config["TASK_RESULT_CACHE_TTL"] = 0
+    task, hit = new_task(cached_task.parameters)
+    assert not hit
+    assert task.result_cache_key is None
+
+
+def test_result_cache_eviction(cached_task: ProcessingTask):
+    """Test that expired and least recently used entries are evicted."""
+    current_app.config["TASK_RESULT_CACHE_MAX_SIZE"] = 10
+    assert evict_result_cache_entries() == 0
+
+    # a newer result with the same size exceeds the size limit
+    task, _ = new_task("{}")
+    STORE.persist_task_result(task.id, b"result", "result.txt", "result", "text/plain")
+    task.task_status = "SUCCESS"
+    task.finished_at = datetime.utcnow()
+    task.save(commit=True)
+    add_task_result_to_cache(task)
+    entries = DB.session.execute(select(TaskResultCacheEntry)).scalars().all()
+    assert [entry.task_id for entry in entries] == [task.id]
+
+    entries[0].created_at = datetime.utcnow() - timedelta(days=30)
+    entries[0].save(commit=True)
+    assert evict_result_cache_entries() == 1
+    assert not new_task("{}")[1]
+
+
+def test_input_fingerprint(task_data: ProcessingTask, tmp_path: Path, monkeypatch):
+    """Test that inputs are identified without reading them and skip the cache otherwise."""
+    path = tmp_path / "input.txt"
+    path.write_text("input")
+    fingerprint = get_input_fingerprint(path.as_uri())
+    assert fingerprint and fingerprint.startswith("file:")
+    path.write_text("changed input")
+    assert get_input_fingerprint(path.as_uri()) != fingerprint
+
+    def open_without_validators(url, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.raw = BytesIO(b"input")
+        return response
+
+    monkeypatch.setattr(
+        "qhana_plugin_runner.result_cache.open_url", open_without_validators
+    )
+    assert get_input_fingerprint("http://example.com/input") is None
+    task, hit = new_task("{}", input_url="http://example.com/input")
+    assert not hit
+    assert task.result_cache_key is None
@@ -0,0 +1,181 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the file store."""
+
+from gzip import decompress
+from hashlib import sha256
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from conftests import task_data
+from flask import current_app
+
+from qhana_plugin_runner.db.models.tasks import ProcessingTask, TaskFile
+from qhana_plugin_runner.plugin_utils.entity_marshalling import save_entities
+from qhana_plugin_runner.requests import open_url
+from qhana_plugin_runner.storage import STORE, FileStore
+
+
+@pytest.fixture()
+def file_root(task_data: ProcessingTask, tmp_path: Path):
+    current_app.config["FILE_STORE_ROOT_PATH"] = str(tmp_path)
+    return tmp_path
+
+
+def test_task_result_writer(task_data: ProcessingTask, file_root: Path):
+    """Test streaming a task result directly to the storage."""
+    entities = [{"ID": str(i), "href": "", "value": i} for i in range(100)]
+    with STORE.open_task_result_writer(
+        task_data.id, "entities.json", "entity/list", "application/json"
+    ) as output:
+        save_entities(entities, output, "application/json")
+
+    (file_info,) = TaskFile.get_task_result_files(task_data)
+    content = Path(file_info.file_storage_data).read_bytes()
+    assert file_root in Path(file_info.file_storage_data).parents
+    assert file_info.file_size == len(content)
+    assert file_info.content_hash == sha256(content).hexdigest()
+    assert file_info.mimetype == "application/json"
+    assert output.file_info == file_info
+
+
+def test_task_result_writer_error(task_data: ProcessingTask, file_root: Path):
+    """Test that no file is stored if writing the result fails."""
+    with pytest.raises(RuntimeError):
+        with STORE.open_task_result_writer(
+            task_data.id, "broken.bin", "binary", "application/octet-stream", mode="b"
+        ) as output:
+            output.write(b"incomplete")
+            raise RuntimeError()
+
+    assert TaskFile.get_task_result_files(task_data) == []
+    assert not (file_root / f"task_{task_data.id}/out/broken.bin").exists()
+
+
+def test_persist_task_result_metadata(task_data: ProcessingTask, file_root: Path):
+    """Test that persisted files record their size and hash."""
+    with SpooledTemporaryFile(mode="w") as output:
+        output.write("äöü")
+        file_info = STORE.persist_task_result(
+            task_data.id, output, "text.txt", "text", "text/plain"
+        )
+    content = "äöü".encode("utf-8")
+    assert Path(file_info.file_storage_data).read_bytes() == content
+    assert file_info.file_size == len(content)
+    assert file_info.content_hash == sha256(content).hexdigest()
+
+    with pytest.raises(KeyError):
+        STORE.persist_task_result(task_data.id + 1, b"data", "a.bin", "binary", "*")
+
+
+def test_content_addressed_store(task_data: ProcessingTask, file_root: Path):
+    """Test that identical task files share one blob that is removed with the last reference."""
+    store = STORE["content_addressed"]
+    store.blob_grace_period = 0
+
+    first = store.persist_task_result(task_data.id, b"data", "a.bin", "binary", "*")
+    with store.open_task_result_writer(
+        task_data.id, "b.bin", "binary", "*", mode="b"
+    ) as output:
+        output.write(b"data")
+    second = output.file_info
+    other = store.persist_task_result(task_data.id, b"other", "c.bin", "binary", "*")
+
+    assert first.file_storage_data == second.file_storage_data
+    assert first.file_storage_data != other.file_storage_data
+    blob_path = Path(first.file_storage_data)
+    assert blob_path.read_bytes() == b"data"
+    assert sorted(p.name for p in (file_root / "blobs").glob("??/??/*")) == sorted(
+        [first.content_hash, other.content_hash]
+    )
+    assert store.count_blob_references(first.content_hash) == 2
+
+    STORE.delete_task_file(first)
+    assert blob_path.exists()
+    STORE.delete_task_file(second)
+    assert not blob_path.exists()
+    assert [f.file_name for f in TaskFile.get_task_result_files(task_data)] == ["c.bin"]
+    assert store.collect_garbage() == 0
+
+
+def test_compressed_task_files(task_data: ProcessingTask, file_root: Path):
+    """Test that text files are compressed at rest and decompressed by open_url."""
+    current_app.config["FILE_STORE_COMPRESSION"] = "gzip"
+    content = '{"text": "compressible"}\n' * 100
+    with STORE.open_task_result_writer(
+        task_data.id, "data.json", "text", "application/json"
+    ) as output:
+        output.write(content)
+    file_info = output.file_info
+
+    assert file_info.content_encoding == "gzip"
+    assert file_info.file_storage_data.endswith("data.json.gz")
+    assert file_info.file_size == len(content)
+    assert file_info.content_hash == sha256(content.encode()).hexdigest()
+    compressed = Path(file_info.file_storage_data).read_bytes()
+    assert len(compressed) < len(content) and decompress(compressed) == content.encode()
+
+    with current_app.test_request_context():
+        # compressed files are served through the files api
+        url = STORE.get_task_file_url(file_info, external=False)
+    with open_url(url) as response:
+        assert response.text == content
+        assert response.headers["Content-Type"] == "application/json"
+    # file:// URLs are read as is, even if the file name has a compression suffix
+    with open_url(Path(file_info.file_storage_data).as_uri()) as response:
+        assert response.content == compressed
+        assert "Content-Type" not in response.headers
+
+    binary = STORE.persist_task_result(
+        task_data.id, b"PK", "data.zip", "zip", "application/zip"
+    )
+    assert binary.content_encoding is None
+    assert Path(binary.file_storage_data).read_bytes() == b"PK"
+
+
+class _BufferedFileStore(FileStore, name="test_buffered"):
+    """A file store that can only persist complete files (no writer)."""
+
+    def __init__(self, app=None) -> None:
+        super().__init__(app)
+        self.files = {}
+
+    def persist_file(self, file_, target, mimetype):
+        self.files[str(target)] = (file_.read(), mimetype)
+
+
+def test_task_result_writer_without_store_writer(task_data: ProcessingTask):
+    """Test that stores without a writer persist the buffered file on exit."""
+    store = _BufferedFileStore(current_app)
+    with store.open_task_result_writer(
+        task_data.id, "text.txt", "text", "text/plain"
+    ) as output:
+        output.write("äöü")
+    with store.open_task_result_writer(
+        task_data.id, "data.bin", "binary", "application/octet-stream", mode="b"
+    ) as binary_output:
+        binary_output.write(b"data")
+
+    content = "äöü".encode("utf-8")
+    assert store.files == {
+        f"task_{task_data.id}/out/text.txt": (content, "text/plain"),
+        f"task_{task_data.id}/out/data.bin": (b"data", "application/octet-stream"),
+    }
+    file_info = output.file_info
+    assert file_info.storage_provider == "test_buffered"
+    assert file_info.file_size == len(content)
+    assert file_info.content_hash == sha256(content).hexdigest()
+    assert binary_output.file_info.file_size == 4
@@ -0,0 +1,112 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the periodic cleanup of old tasks."""
+
+from datetime import datetime, timedelta
+from os import utime
+from pathlib import Path
+from time import time
+
+import pytest
+from conftests import task_data
+from flask import current_app
+
+from qhana_plugin_runner.db.models.tasks import (
+    ProcessingTask,
+    TaskFile,
+    TaskLogEntry,
+    TaskResultCacheEntry,
+)
+from qhana_plugin_runner.storage import STORE
+from qhana_plugin_runner.tasks import clean_up_tasks, delete_old_tasks
+
+
+@pytest.fixture()
+def file_root(task_data: ProcessingTask, tmp_path: Path):
+    current_app.config["FILE_STORE_ROOT_PATH"] = str(tmp_path)
+    return tmp_path
+
+
+def create_task(finished_days_ago=None) -> ProcessingTask:
+    task = ProcessingTask(task_name="test-cleanup")
+    if finished_days_ago is not None:
+        task.finished_at = datetime.utcnow() - timedelta(days=finished_days_ago)
+    task.add_next_step(href="http://step.test", ui_href="http://ui.test", step_id="s1")
+    task.add_task_log_entry("log", commit=True)
+    STORE.persist_task_result(task.id, b"result", "result.txt", "result", "text/plain")
+    STORE.persist_task_temp_file(task.id, b"temp", "temp.txt", "text/plain")
+    return task
+
+
+def test_clean_up_tasks(file_root: Path):
+    """Test that old tasks are deleted with their files and temp files of finished tasks."""
+    old_task = create_task(finished_days_ago=60)
+    old_id = old_task.id
+    recent_task = create_task(finished_days_ago=2)
+    running_task = create_task()
+    current_app.config["TASK_CLEANUP_MAX_AGE"] = 60 * 60 * 24 * 30
+
+    # folder of a task that was deleted without deleting its files
+    orphaned = file_root / "task_9999" / "out"
+    orphaned.mkdir(parents=True)
+    (orphaned / "result.txt").write_text("orphaned")
+    utime(orphaned.parent, (time() - 7200, time() - 7200))
+
+    clean_up_tasks()
+
+    assert ProcessingTask.get_by_id(old_id) is None
+    assert TaskLogEntry.get_task_log_entries(old_id) == []
+    assert not (file_root / f"task_{old_id}").exists()
+    assert not orphaned.parent.exists()
+
+    # only the temp files of finished tasks are deleted
+    assert [f.file_type for f in recent_task.outputs] == ["result"]
+    assert not (file_root / f"task_{recent_task.id}" / "tmp").exists()
+    assert len(running_task.outputs) == 2
+    assert running_task.task_log == "log"
+
+
+def test_keep_cached_tasks(file_root: Path):
+    """Test that tasks with results in the result cache are not deleted."""
+    cached_task = create_task(finished_days_ago=60)
+    TaskResultCacheEntry(cache_key="key", task_id=cached_task.id).save(commit=True)
+    tasks = [create_task(finished_days_ago=60) for _ in range(3)]
+
+    assert delete_old_tasks(datetime.utcnow(), batch_size=2) == 3
+    assert all(ProcessingTask.get_by_id(task.id) is None for task in tasks)
+    assert ProcessingTask.get_by_id(cached_task.id) is not None
+    assert len(TaskFile.get_task_result_files(cached_task)) == 1
+
+
+def test_keep_tasks_with_undeletable_files(file_root: Path):
+    """Test that no file is deleted if one file of the task cannot be deleted."""
+    task = create_task(finished_days_ago=60)
+    TaskFile(
+        task=task,
+        security_tag="tag",
+        storage_provider="unknown_store",
+        file_name="remote.txt",
+        file_storage_data="remote.txt",
+        file_type="result",
+        mimetype="text/plain",
+    ).save(commit=True)
+
+    assert delete_old_tasks(datetime.utcnow()) == 0
+    assert len(task.outputs) == 3
+    assert all(
+        Path(f.file_storage_data).exists()
+        for f in task.outputs
+        if f.storage_provider != "unknown_store"
+    )
@@ -0,0 +1,169 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the tasks api."""
+
+from datetime import datetime
+from http import HTTPStatus
+from json import loads
+from time import monotonic
+
+from conftests import task_data
+from flask import current_app
+
+from qhana_plugin_runner.db.models.tasks import ProcessingTask
+from qhana_plugin_runner.task_events import (
+    TASK_FINISHED_EVENT,
+    TASK_STEP_EVENT,
+    publish_task_event,
+)
+
+
+def get_task(task_data: ProcessingTask, headers=None, **query):
+    client = current_app.test_client()
+    return client.get(f"/tasks/{task_data.id}/", query_string=query, headers=headers)
+
+
+def test_task_log(task_data: ProcessingTask):
+    """Test that the task log is returned completely or after a cursor."""
+    response = get_task(task_data)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["log"] == ""
+    assert "logCursor" not in response.json
+
+    task_data.add_task_log_entry("first")
+    task_data.add_task_log_entry("second", commit=True)
+    assert task_data.task_log == "first\nsecond"
+
+    response = get_task(task_data)
+    assert response.json["log"] == "first\nsecond"
+    cursor = response.json["logCursor"]
+
+    task_data.add_task_log_entry("third", commit=True)
+    response = get_task(task_data, **{"log-after": cursor})
+    assert response.json["log"] == "third"
+    cursor = response.json["logCursor"]
+
+    response = get_task(task_data, **{"log-after": cursor})
+    assert response.json["log"] == ""
+    assert response.json["logCursor"] == cursor
+
+
+def test_task_etag(task_data: ProcessingTask):
+    """Test that unchanged tasks are answered with 304 and changes update the ETag."""
+    response = get_task(task_data)
+    etag = response.headers["ETag"]
+
+    response = get_task(task_data, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+
+    task_data.add_task_log_entry("log entry", commit=True)
+    response = get_task(task_data, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    task_data.progress_value = 50
+    task_data.save(commit=True)
+    response = get_task(task_data, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["progress"]["value"] == 50
+
+
+def test_task_long_polling(task_data: ProcessingTask):
+    """Test that long polling requests wait for changes at most the given time."""
+    current_app.config["TASK_STATUS_POLL_INTERVAL"] = 0.05
+    etag = get_task(task_data).headers["ETag"]
+
+    start = monotonic()
+    response = get_task(task_data, headers={"If-None-Match": etag}, wait=0.3)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert monotonic() - start >= 0.3
+
+    task_data.add_task_log_entry("changed", commit=True)
+    start = monotonic()
+    response = get_task(task_data, headers={"If-None-Match": etag}, wait=10)
+    assert response.status_code == HTTPStatus.OK
+    assert monotonic() - start < 5, "changed tasks must be returned immediately"
+    assert response.json["log"] == "changed"
+
+
+def parse_event(chunk: bytes):
+    fields = {}
+    for line in chunk.decode().splitlines():
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    if "data" in fields:
+        fields["data"] = loads(fields["data"])
+    return fields
+
+
+def test_task_events(task_data: ProcessingTask):
+    """Test that the event stream sends the task status for every change until the task finished."""
+    current_app.config["TASK_EVENTS_URL"] = "memory://"
+    current_app.config["TASK_EVENTS_KEEP_ALIVE"] = 0.05
+    client = current_app.test_client()
+
+    assert client.get("/tasks/1234/events/").status_code == HTTPStatus.NOT_FOUND
+
+    response = client.get(f"/tasks/{task_data.id}/events/", buffered=False)
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == "text/event-stream"
+    events = response.iter_encoded()
+
+    event = parse_event(next(events))
+    assert event["event"] == "status"
+    assert event["data"]["status"] == "PENDING"
+    assert "id" not in event
+
+    assert next(events) == b": keep-alive\n\n"
+
+    # progress updates without a notification are sent after the keep-alive interval
+    task_data.progress_value = 5
+    task_data.save(commit=True)
+    event = parse_event(next(events))
+    assert event["event"] == "status"
+    assert event["data"]["progress"]["value"] == 5
+
+    task_data.add_next_step(
+        href="http://step.test", ui_href="http://ui.test", step_id="s1"
+    )
+    task_data.add_task_log_entry("step added", commit=True)
+    publish_task_event(task_data.id, TASK_STEP_EVENT)
+    event = parse_event(next(events))
+    assert event["event"] == TASK_STEP_EVENT
+    assert event["data"]["steps"][0]["stepId"] == "s1"
+    assert event["data"]["log"] == "step added"
+    cursor = event["id"]
+
+    task_data.task_status = "SUCCESS"
+    task_data.finished_at = datetime.utcnow()
+    task_data.add_task_log_entry("finished", commit=True)
+    publish_task_event(task_data.id, TASK_FINISHED_EVENT)
+    publish_task_event(task_data.id, TASK_FINISHED_EVENT)  # sent only once
+    event = parse_event(next(events))
+    assert event["event"] == TASK_FINISHED_EVENT
+    assert event["data"]["status"] == "SUCCESS"
+    assert event["data"]["outputs"] == []
+    assert event["data"]["log"] == "finished"
+    assert list(events) == []
+    response.close()
+
+    # reconnecting clients only get the log after the last event
+    response = client.get(
+        f"/tasks/{task_data.id}/events/", headers={"Last-Event-ID": cursor}
+    )
+    event = parse_event(response.data)
+    assert event["data"]["log"] == "finished"
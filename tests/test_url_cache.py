@@ -0,0 +1,165 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the on-disk URL cache."""
+
+from http import HTTPStatus
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+from conftests import task_data
+from flask import current_app
+from requests import Session
+from requests.adapters import BaseAdapter
+from requests.models import PreparedRequest, Response
+
+from qhana_plugin_runner.db.models.tasks import ProcessingTask
+from qhana_plugin_runner.requests import REQUEST_SESSION, open_url
+from qhana_plugin_runner.util.url_cache import UrlCache
+
+
+class VersionedAdapter(BaseAdapter):
+    """Adapter serving files with ETags that records all requests."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.files: Dict[str, bytes] = {}
+        self.cache_control: Optional[str] = None
+        self.requests: List[PreparedRequest] = []
+
+    def send(self, request: PreparedRequest, stream: bool, **kwargs) -> Response:
+        self.requests.append(request)
+        resp = Response()
+        resp.url = request.url
+        content = self.files[request.url]
+        etag = f'"{hash(content)}"'
+        resp.headers["ETag"] = etag
+        if self.cache_control:
+            resp.headers["Cache-Control"] = self.cache_control
+        if request.headers.get("If-None-Match") == etag:
+            resp.status_code = HTTPStatus.NOT_MODIFIED
+            content = b""
+        else:
+            resp.status_code = HTTPStatus.OK
+            resp.headers["Content-Type"] = "application/json"
+        resp.headers["Content-Length"] = str(len(content))
+        resp.raw = BytesIO(content)
+        return resp
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def adapter():
+    adapter = VersionedAdapter()
+    yield adapter
+
+
+@pytest.fixture()
+def session(adapter: VersionedAdapter):
+    session = Session()
+    session.mount("http://cache.test/", adapter)
+    return session
+
+
+def test_revalidation(tmp_path: Path, session: Session, adapter: VersionedAdapter):
+    """Test that cached responses are revalidated and updated."""
+    cache = UrlCache(tmp_path, max_size=2**20)
+    url = "http://cache.test/entities.json"
+    adapter.files[url] = b'[{"ID": "a"}]'
+
+    response = cache.open(session, url)
+    assert response.json() == [{"ID": "a"}]
+    assert not hasattr(adapter.requests[-1].headers, "If-None-Match")
+
+    response = cache.open(session, url, stream=True)
+    assert getattr(response, "from_cache", False)
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.raw.read() == b'[{"ID": "a"}]'
+    response.close()
+    assert "If-None-Match" in adapter.requests[-1].headers
+
+    adapter.files[url] = b'[{"ID": "b"}]'
+    assert cache.open(session, url).json() == [{"ID": "b"}]
+    assert len(list(tmp_path.glob("??/*.body"))) == 1, "replaced bodies must be removed"
+
+
+def test_fresh_responses(tmp_path: Path, session: Session, adapter: VersionedAdapter):
+    """Test that fresh responses are served without a request and no-store is respected."""
+    cache = UrlCache(tmp_path, max_size=2**20)
+    url = "http://cache.test/result.json"
+    adapter.files[url] = b"[]"
+    adapter.cache_control = "public, max-age=3600, immutable"
+
+    assert cache.open(session, url).content == b"[]"
+    assert cache.open(session, url).content == b"[]"
+    assert len(adapter.requests) == 1
+
+    adapter.cache_control = "no-store"
+    url = "http://cache.test/uncacheable.json"
+    adapter.files[url] = b"[]"
+    cache.open(session, url)
+    response = cache.open(session, url)
+    assert not getattr(response, "from_cache", False)
+    assert len(adapter.requests) == 3
+
+
+def test_lru_eviction(tmp_path: Path, session: Session, adapter: VersionedAdapter):
+    """Test that the least recently used responses are evicted."""
+    cache = UrlCache(tmp_path, max_size=250, max_entry_size=120)
+    adapter.cache_control = "max-age=3600"
+    urls = [f"http://cache.test/{i}" for i in range(4)]
+    for i, url in enumerate(urls):
+        adapter.files[url] = bytes([i]) * 100
+
+    cache.open(session, urls[0])
+    cache.open(session, urls[1])
+    cache.open(session, urls[0])  # makes urls[1] the least recently used entry
+    cache.open(session, urls[2])
+    assert len(adapter.requests) == 3
+
+    assert cache.open(session, urls[0]).content == bytes([0]) * 100
+    assert len(adapter.requests) == 3
+    cache.open(session, urls[1])
+    assert len(adapter.requests) == 4, "evicted response must be requested again"
+
+    adapter.files[urls[3]] = b"x" * 200  # larger than the maximum entry size
+    assert cache.open(session, urls[3]).content == b"x" * 200
+    assert sum(p.stat().st_size for p in tmp_path.glob("??/*.body")) <= 250
+
+
+def test_open_url_cache(
+    task_data: ProcessingTask, tmp_path: Path, adapter: VersionedAdapter
+):
+    """Test that open_url uses the cache if it is configured."""
+    current_app.config["URL_CACHE_PATH"] = str(tmp_path)
+    REQUEST_SESSION.mount("http://cache.test/", adapter)
+    try:
+        url = "http://cache.test/data.json"
+        adapter.files[url] = b"[1, 2]"
+        adapter.cache_control = "max-age=60"
+        with open_url(url) as response:
+            assert response.json() == [1, 2]
+        with open_url(url, stream=True) as response:
+            assert response.json() == [1, 2]
+        with open_url(url, use_cache=False) as response:
+            assert response.json() == [1, 2]
+        with open_url(url, headers={"Range": "bytes=0-1"}) as response:
+            pass
+        assert len(adapter.requests) == 3
+    finally:
+        REQUEST_SESSION.adapters.pop("http://cache.test/")
@@ -0,0 +1,178 @@
+# Copyright 2022 QHAna plugin runner contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for reading zip files from URLs."""
+
+import re
+from http import HTTPStatus
+from io import BytesIO
+from os import urandom
+from typing import List
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pytest
+from requests.adapters import BaseAdapter
+from requests.models import PreparedRequest, Response
+
+from qhana_plugin_runner.plugin_utils.zip_utils import (
+    copy_zip_members,
+    get_files_from_zip_url,
+    open_file_from_zip_url,
+    open_zip_url,
+)
+from qhana_plugin_runner.requests import REQUEST_SESSION
+from qhana_plugin_runner.util.request_helpers import register_additional_schemas
+
+MEMBERS = {
+    "a.json": b'{"a": 1}',
+    "large.bin": urandom(2**16),
+    "b.json": b'{"b": 2}',
+}
+
+
+def create_zip() -> bytes:
+    file_ = BytesIO()
+    with ZipFile(file_, "w", compression=ZIP_STORED) as zip_file:
+        for name, content in MEMBERS.items():
+            zip_file.writestr(name, content)
+    return file_.getvalue()
+
+
+class RangeAdapter(BaseAdapter):
+    """Adapter serving a single file with support for range requests."""
+
+    def __init__(self, content: bytes, accept_ranges: bool = True) -> None:
+        super().__init__()
+        self.content = content
+        self.accept_ranges = accept_ranges
+        self.sent_bytes: List[int] = []
+
+    def send(self, request: PreparedRequest, stream: bool, **kwargs) -> Response:
+        resp = Response()
+        resp.url = request.url
+        body = self.content
+        resp.status_code = HTTPStatus.OK
+        range_header = request.headers.get("Range")
+        if range_header and self.accept_ranges:
+            match = re.fullmatch(r"bytes=(\d+)-(\d+)", range_header)
+            assert match
+            body = body[int(match.group(1)) : int(match.group(2)) + 1]
+            resp.status_code = HTTPStatus.PARTIAL_CONTENT
+        if self.accept_ranges:
+            resp.headers["Accept-Ranges"] = "bytes"
+        resp.headers["Content-Length"] = str(len(body))
+        raw = BytesIO(body)
+        # simulate a not seekable network stream that counts the transferred bytes
+        raw.seekable = lambda: False  # type: ignore
+        original_read = raw.read
+
+        def read(*args):
+            data = original_read(*args)
+            self.sent_bytes.append(len(data))
+            return data
+
+        raw.read = read  # type: ignore
+        resp.raw = raw
+        return resp
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def zip_url():
+    adapter = RangeAdapter(create_zip())
+    REQUEST_SESSION.mount("http://zip.test/", adapter)
+    yield "http://zip.test/archive.zip", adapter
+    REQUEST_SESSION.adapters.pop("http://zip.test/")
+
+
+def test_file_url(tmp_path):
+    """Test reading zip files from file:// URLs."""
+    register_additional_schemas(REQUEST_SESSION)
+    path = tmp_path / "archive.zip"
+    path.write_bytes(create_zip())
+
+    files = {
+        name: file_.read() for file_, name in get_files_from_zip_url(path.as_uri(), "b")
+    }
+    assert files == MEMBERS
+
+
+def test_spooled(zip_url):
+    """Test reading small zip files that are downloaded completely."""
+    url, _ = zip_url
+    files = {name: file_.read() for file_, name in get_files_from_zip_url(url, "b")}
+    assert files == MEMBERS
+
+    with open_file_from_zip_url(url, "a.json") as file_:
+        assert file_.read() == MEMBERS["a.json"].decode()
+
+
+def test_spooled_to_temp_file(zip_url):
+    """Test reading zip files larger than the spool threshold without range requests."""
+    url, adapter = zip_url
+    adapter.accept_ranges = False
+    with open_zip_url(url, spool_threshold=1024) as zip_file:
+        assert zip_file.read("large.bin") == MEMBERS["large.bin"]
+
+
+def test_range_requests(zip_url):
+    """Test that only the requested member is downloaded with range requests."""
+    url, adapter = zip_url
+    with open_zip_url(url, spool_threshold=1024) as zip_file:
+        assert zip_file.namelist() == list(MEMBERS.keys())
+        assert zip_file.read("b.json") == MEMBERS["b.json"]
+    assert sum(adapter.sent_bytes) < len(MEMBERS["large.bin"])
+
+    with pytest.raises(KeyError):
+        with open_file_from_zip_url(url, "missing.json"):
+            pass
+
+
+class NonSeekableBuffer(BytesIO):
+    """Buffer that forces zip files to be written with data descriptors."""
+
+    def seekable(self) -> bool:
+        return False
+
+    def seek(self, *args):
+        raise OSError("not seekable")
+
+
+def test_copy_zip_members():
+    """Test merging zip files by copying the compressed members (also into streams)."""
+    deflated = BytesIO()
+    with ZipFile(deflated, "w", compression=ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("deflated.json", b'{"c": 3}' * 100)
+    streamed = NonSeekableBuffer()
+    with ZipFile(streamed, "w", compression=ZIP_DEFLATED) as zip_file:
+        with zip_file.open("streamed.json", "w") as member:
+            member.write(b'{"d": 4}' * 100)
+
+    for merged in (BytesIO(), NonSeekableBuffer()):
+        with ZipFile(merged, "w") as merged_zip:
+            for content in (create_zip(), deflated.getvalue(), streamed.getvalue()):
+                with ZipFile(BytesIO(content)) as source:
+                    copy_zip_members(source, merged_zip)
+
+        with ZipFile(BytesIO(merged.getvalue())) as merged_zip:
+            assert merged_zip.testzip() is None
+            assert merged_zip.namelist() == list(MEMBERS.keys()) + [
+                "deflated.json",
+                "streamed.json",
+            ]
+            assert merged_zip.getinfo("deflated.json").compress_type == ZIP_DEFLATED
+            assert merged_zip.read("large.bin") == MEMBERS["large.bin"]
+            assert merged_zip.read("streamed.json") == b'{"d": 4}' * 100